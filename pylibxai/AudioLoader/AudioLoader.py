@@ -1,6 +1,8 @@
 import librosa
 import numpy as np
 
+from pylibxai.AudioLoader.resampling import resample
+
 def remove_splits(y, splits):
     y = np.concatenate([y[x[0]:x[1]] for x in splits])
     return y
@@ -49,6 +51,6 @@ class RawAudioLoader(AudioLoader):
     def initialize_mix(self):
         musicnn_sr = 16000  # todo: pass as target_sr
 
-        waveform, _ = librosa.load(self._audio_path, mono=True, sr=musicnn_sr)
-        return waveform
+        waveform, sr = librosa.load(self._audio_path, mono=True, sr=None)
+        return resample(waveform, sr, musicnn_sr)
 
@@ -1 +1,2 @@
 from .AudioLoader import AudioLoader, RawAudioLoader
+from .resampling import Resampler, resample
@@ -0,0 +1,60 @@
+import threading
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+
+class Resampler(object):
+    """
+    :class:`Resampler` converts audio between sampling rates with a polyphase FIR filter.
+
+    The filter kernel of every (orig_sr, target_sr) pair is designed once and reused, and
+    multi-dimensional input (e.g. all stems of a separation stacked) is resampled along one
+    axis in a single call.
+    """
+    def __init__(self, window=('kaiser', 5.0)):
+        """
+        :param window: window used to design the low-pass filter, see scipy.signal.firwin
+        """
+        self.window = window
+        self._filters = {}
+        self._lock = threading.Lock()
+
+    def get_filter(self, orig_sr, target_sr):
+        """
+        :return: tuple (up, down, taps) of the reduced rate ratio and the filter kernel
+        """
+        key = (orig_sr, target_sr)
+        with self._lock:
+            if key not in self._filters:
+                divisor = gcd(int(orig_sr), int(target_sr))
+                up, down = int(target_sr) // divisor, int(orig_sr) // divisor
+                max_rate = max(up, down)
+                # same design as resample_poly's default filter
+                taps = firwin(2 * 10 * max_rate + 1, 1. / max_rate, window=self.window)
+                self._filters[key] = (up, down, taps)
+            return self._filters[key]
+
+    def resample(self, y, orig_sr, target_sr, axis=-1):
+        """
+        :param y: audio array, may hold several signals along the other axes
+        :param orig_sr: sampling rate of y
+        :param target_sr: sampling rate of the result
+        :param axis: time axis of y
+        :return: resampled array with the dtype of y for floating point input
+        """
+        y = np.asarray(y)
+        if orig_sr == target_sr:
+            return y
+        up, down, taps = self.get_filter(orig_sr, target_sr)
+        dtype = y.dtype if np.issubdtype(y.dtype, np.floating) else np.float64
+        return resample_poly(y, up, down, axis=axis, window=taps.astype(dtype)).astype(dtype, copy=False)
+
+
+default_resampler = Resampler()
+
+
+def resample(y, orig_sr, target_sr, axis=-1):
+    """Resamples y with the shared :class:`Resampler`, see :meth:`Resampler.resample`."""
+    return default_resampler.resample(y, orig_sr, target_sr, axis=axis)
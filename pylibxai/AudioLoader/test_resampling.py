@@ -0,0 +1,67 @@
+import os
+
+import pytest
+import numpy as np
+import soundfile
+from scipy.signal import resample_poly
+
+from pylibxai.AudioLoader import RawAudioLoader
+from pylibxai.AudioLoader.resampling import Resampler
+
+
+@pytest.fixture
+def stems():
+    return np.random.RandomState(0).uniform(-1, 1, (3, 1600)).astype(np.float32)
+
+
+class TestResampler:
+    """Test polyphase resampling with cached filter kernels"""
+
+    def test_matches_resample_poly(self, stems):
+        """Test the cached filter gives the same result as scipy's default design"""
+        resampled = Resampler().resample(stems[0], 16000, 41000)
+
+        np.testing.assert_allclose(resampled, resample_poly(stems[0], 41, 16), rtol=1e-5, atol=1e-6)
+
+    def test_two_dimensional_input_matches_rows(self, stems):
+        """Test all stems resampled at once equal the stems resampled one by one"""
+        resampler = Resampler()
+
+        resampled = resampler.resample(stems, 41000, 16000)
+
+        assert resampled.dtype == np.float32
+        for row, stem in zip(resampled, stems):
+            np.testing.assert_array_equal(row, resampler.resample(stem, 41000, 16000))
+
+    def test_filter_is_designed_once(self):
+        """Test the filter of a rate pair is cached and reduced by the common divisor"""
+        resampler = Resampler()
+
+        up, down, taps = resampler.get_filter(16000, 44100)
+
+        assert (up, down) == (441, 160)
+        assert resampler.get_filter(16000, 44100)[2] is taps
+
+    def test_same_rate_is_returned_unchanged(self, stems):
+        """Test resampling to the original rate returns the input"""
+        assert Resampler().resample(stems, 16000, 16000) is stems
+
+    def test_preserves_frequency(self):
+        """Test a sine keeps its frequency after resampling"""
+        t = np.arange(22050) / 22050
+        resampled = Resampler().resample(np.sin(2 * np.pi * 440 * t), 22050, 16000)
+
+        spectrum = np.abs(np.fft.rfft(resampled))
+        assert len(resampled) == 16000
+        assert np.argmax(spectrum) == 440
+
+    def test_raw_audio_loader_resamples_to_16k(self, tmp_path):
+        """Test RawAudioLoader converts the file rate to 16 kHz"""
+        audio_path = os.path.join(str(tmp_path), 'tone.wav')
+        t = np.arange(22050) / 22050
+        soundfile.write(audio_path, 0.5 * np.sin(2 * np.pi * 440 * t), 22050, subtype='FLOAT')
+
+        mix = RawAudioLoader(audio_path).get_mix()
+
+        assert mix.dtype == np.float32
+        assert len(mix) == 16000
@@ -1,16 +1,20 @@
 from pylibxai.AudioLoader import RawAudioLoader
 from pylibxai.audioLIME import lime_audio, SpleeterFactorization
-from pylibxai.Interfaces import ViewType, LimeAdapter
+from pylibxai.audioLIME.factorization_spectral import SpectralFactorization
+from pylibxai.Interfaces import ViewType, LimeAdapter, SpectralLimeAdapter, LimePreviewAdapter
 from pylibxai.Views import WebView, DebugView
 import os
+import numpy as np
 
 class LimeExplainer:
-    def __init__(self, adapter, context, view_type, port=9000):
+    def __init__(self, adapter, context, view_type, port=9000, stem_cache=None, separator=None):
         if not issubclass(type(adapter), LimeAdapter):
             raise TypeError("LimeExplainer must be initialized with a model adapter that implements LimeAdapter interface.")
         self.adapter = adapter
         self.context = context
         self.view_type = view_type
+        self.stem_cache = stem_cache
+        self.separator = separator
         if view_type == ViewType.WEBVIEW:
             self.view = WebView(context, port=port)
         elif view_type == ViewType.DEBUG:
@@ -20,22 +24,50 @@ class LimeExplainer:
         else:
             raise ValueError(f"Invalid view type: {view_type}. Must be one of WEBVIEW, DEBUG, or NONE.")
 
-    def explain(self, audio, target=None): 
-        audio_loader = RawAudioLoader(audio)
-        spleeter_factorization = SpleeterFactorization(audio_loader,
+    def factorize(self, audio):
+        """Returns the Spleeter factorization of audio and the factorization perturbations are composed with."""
+        spleeter_factorization = SpleeterFactorization(RawAudioLoader(audio),
                                                        n_temporal_segments=10,
                                                        composition_fn=None,
-                                                       model_name='spleeter:5stems')
+                                                       model_name='spleeter:5stems',
+                                                       stem_cache=self.stem_cache,
+                                                       separator=self.separator)
+        if isinstance(self.adapter, SpectralLimeAdapter):
+            # the model's STFT front end is applied to the components once instead of per perturbation
+            return spleeter_factorization, SpectralFactorization(spleeter_factorization,
+                                                                 self.adapter.get_stft_front_end())
+        return spleeter_factorization, spleeter_factorization
+
+    def get_predict_fn(self, preview=False):
+        """Returns the predict function matching the factorizations of factorize, see LimePreviewAdapter for preview."""
+        spectral = isinstance(self.adapter, SpectralLimeAdapter)
+        if preview:
+            if not isinstance(self.adapter, LimePreviewAdapter):
+                raise TypeError("Preview mode requires a model adapter that implements LimePreviewAdapter interface.")
+            return self.adapter.get_lime_preview_predict_fn(spectral=spectral)
+        return self.adapter.get_lime_spectral_predict_fn() if spectral else self.adapter.get_lime_predict_fn()
+
+    def explain(self, audio, target=None, memory_budget=None, window_seconds=None, hop_seconds=None, preview=False):
+        spleeter_factorization, factorization = self.factorize(audio)
+        predict_fn = self.get_predict_fn(preview)
 
         print('Creating explanation object')
         explainer = lime_audio.LimeAudioExplainer(verbose=True, absolute_feature_sort=False)
 
+        if window_seconds is not None:
+            self.explain_windows(explainer, factorization, predict_fn, len(spleeter_factorization.data_provider.get_mix()),
+                                 window_seconds, hop_seconds if hop_seconds is not None else window_seconds)
+            self.context.write_audio(audio, os.path.join("lime", "original.wav"))
+            self.show_view()
+            return
+
         print('Starting LIME explanation')
-        explanation = explainer.explain_instance(factorization=spleeter_factorization,
-                                                 predict_fn=self.adapter.get_lime_predict_fn(),
+        explanation = explainer.explain_instance(factorization=factorization,
+                                                 predict_fn=predict_fn,
                                                  top_labels=1,
                                                  num_samples=16384,
-                                                 batch_size=16
+                                                 batch_size=16,
+                                                 memory_budget=memory_budget
                                                  )
 
         label = list(explanation.local_exp.keys())[0]
@@ -49,8 +81,80 @@ class LimeExplainer:
         print("predicted label:", label)
 
         self.context.write_audio(audio, os.path.join("lime", "original.wav"))
-        self.context.write_audio(sum(top_components), os.path.join("lime", f"lime_explanation.wav"), 16000, 'PCM_24')
+        explanation_audio = spleeter_factorization.sum_components(component_indices)
+        self.context.write_audio(explanation_audio, os.path.join("lime", f"lime_explanation.wav"), 16000, 'PCM_24')
+        self.show_view()
+
+    def explain_windows(self, explainer, factorization, predict_fn, track_length, window_seconds, hop_seconds,
+                        sr=16000):
+        window_length = int(window_seconds * sr)
+        starts = explainer.window_starts(track_length, window_length, int(hop_seconds * sr))
+        print(f'Starting windowed LIME explanation of {len(starts)} windows')
+
+        def write_window(start, explanation):
+            index = starts.index(start)
+            label = list(explanation.local_exp.keys())[0]
+            _, component_indices = explanation.get_sorted_components(label,
+                                                                     positive_components=True,
+                                                                     negative_components=False,
+                                                                     num_components=3,
+                                                                     return_indeces=True)
+            names = explanation.factorization.get_ordered_component_names()
+            weights = dict((feature, weight) for feature, weight, _ in explanation.local_exp[label])
+            self.context.write_audio(explanation.factorization.sum_components(component_indices),
+                                     os.path.join("lime", f"window_{index:03d}.wav"), sr, 'PCM_24')
+            self.context.write_json({"start": start / sr,
+                                     "end": (start + window_length) / sr,
+                                     "label": int(label),
+                                     "components": [{"index": int(i), "name": names[i], "weight": float(weights[i])}
+                                                    for i in component_indices]},
+                                    os.path.join("lime", f"window_{index:03d}.json"))
+            print(f'Window {index + 1}/{len(starts)} done, predicted label: {label}')
+
+        explainer.explain_windows(factorization, predict_fn, starts, window_length,
+                                  top_labels=1,
+                                  num_samples=16384,
+                                  batch_size=16,
+                                  window_done_fn=write_window)
+
+    def preview_report(self, audios, num_samples=2048, num_components=3):
+        """
+        Compares LIME explanations of the preview model to those of the full precision model.
+
+        Args:
+            audios: paths of the audio files the models are compared on
+            num_samples: LIME neighborhood size of each explanation
+            num_components: number of top components compared
+
+        Returns:
+            dict with the report of every audio file (see LimeAudioExplainer.compare_predict_fns)
+            and their mean Spearman rank correlation and top component overlap, also written to
+            lime/preview_report.json
+        """
+        predict_fn = self.get_predict_fn()
+        explainer = lime_audio.LimeAudioExplainer(verbose=False, absolute_feature_sort=False)
+        reports = []
+        for audio in audios:
+            _, factorization = self.factorize(audio)
+            # a new preview model per audio file, quantized copies are calibrated on their first batch
+            preview_fn = self.get_predict_fn(preview=True)
+            report = explainer.compare_predict_fns(factorization, predict_fn, preview_fn,
+                                                   num_samples=num_samples,
+                                                   batch_size=16,
+                                                   num_components=num_components)
+            report['audio'] = str(audio)
+            print(f"{audio}: spearman {report['spearman']:.3f}, top {num_components} overlap {report['top_overlap']:.2f}")
+            reports.append(report)
+
+        summary = {"num_samples": num_samples,
+                   "num_components": num_components,
+                   "mean_spearman": float(np.mean([report['spearman'] for report in reports])),
+                   "mean_top_overlap": float(np.mean([report['top_overlap'] for report in reports])),
+                   "audios": reports}
+        self.context.write_json(summary, os.path.join("lime", "preview_report.json"))
+        return summary
 
+    def show_view(self):
         if self.view_type == ViewType.WEBVIEW:
             self.view.start()
             print('Press Ctrl+C to stop the server.')
@@ -1,4 +1,6 @@
+import os
 import pytest
+import soundfile as sf
 import torch
 import torch.nn as nn
 import numpy as np
@@ -10,9 +12,12 @@ from pylibxai.Interfaces import (
     LimeAdapter, 
     IGradientsAdapter, 
     LrpAdapter, 
+    LimePreviewAdapter,
     ViewType,
     ModelLabelProvider
 )
+from pylibxai.AudioLoader import RawAudioLoader
+from pylibxai.audioLIME import BandFactorization
 
 
 class TestExplainerTypeChecking:
@@ -342,6 +347,45 @@ class TestExplainerMethodBehavior:
         assert lime_explainer.adapter == adapter
         assert lime_explainer.context == context
 
+    def test_lime_preview_requires_preview_adapter(self):
+        """Test LIME preview mode rejects adapters without a preview model"""
+
+        class MockLimeAdapter(LimeAdapter):
+            def get_lime_predict_fn(self):
+                return lambda x: np.array([0.2, 0.8])
+
+        lime_explainer = LimeExplainer(MockLimeAdapter(), Mock(), ViewType.NONE)
+
+        with pytest.raises(TypeError) as excinfo:
+            lime_explainer.get_predict_fn(preview=True)
+
+        assert "LimePreviewAdapter" in str(excinfo.value)
+
+    def test_lime_preview_report(self, tmp_path):
+        """Test the preview report compares preview and full precision explanations"""
+        projection = np.random.RandomState(0).normal(size=(16000, 4))
+
+        class MockPreviewAdapter(LimePreviewAdapter):
+            def get_lime_predict_fn(self):
+                return lambda x: np.tanh(x @ projection)
+
+            def get_lime_preview_predict_fn(self, spectral=False):
+                return lambda x: np.tanh(x @ projection).astype(np.float16)
+
+        path = tmp_path / "audio.wav"
+        sf.write(path, np.random.RandomState(1).uniform(-0.5, 0.5, 16000), 16000)
+        factorization = BandFactorization(RawAudioLoader(str(path)), n_temporal_segments=2, n_bands=3)
+        context = Mock()
+        lime_explainer = LimeExplainer(MockPreviewAdapter(), context, ViewType.NONE)
+
+        with patch.object(LimeExplainer, 'factorize', return_value=(factorization, factorization)):
+            report = lime_explainer.preview_report([path], num_samples=64)
+
+        assert report["audios"][0]["audio"] == str(path)
+        assert report["mean_spearman"] > 0.9
+        assert 0.0 <= report["mean_top_overlap"] <= 1.0
+        context.write_json.assert_called_once_with(report, os.path.join("lime", "preview_report.json"))
+
 class TestExplainerErrorHandling:
     """Test error handling in explainers"""
 
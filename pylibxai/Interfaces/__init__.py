@@ -1,4 +1,6 @@
 from .lime_adapter import LimeAdapter
+from .spectral_lime_adapter import SpectralLimeAdapter, StftFrontEnd
+from .lime_preview_adapter import LimePreviewAdapter
 from .IGradients_adapter import IGradientsAdapter
 from .lrp_adapter import LrpAdapter
 from .label_provider import ModelLabelProvider
@@ -0,0 +1,12 @@
+from abc import abstractmethod
+import numpy as np
+from typing import Callable
+
+from .lime_adapter import LimeAdapter
+
+class LimePreviewAdapter(LimeAdapter):
+    """LIME adapter offering a cheaper, approximate copy of its model for previews of explanations."""
+    @abstractmethod
+    def get_lime_preview_predict_fn(self, spectral: bool = False) -> Callable[[np.ndarray], np.ndarray]: pass
+    """Returns the LIME predict function, or with spectral=True the spectral LIME predict function,
+    running the preview model instead of the full precision one."""
@@ -0,0 +1,44 @@
+from abc import abstractmethod
+import numpy as np
+import torch
+from typing import Callable
+
+from .lime_adapter import LimeAdapter
+
+class StftFrontEnd:
+    """Linear front end of a model: waveforms are zero padded or truncated to input_length
+    (if set) and transformed by a complex STFT with a periodic Hann window."""
+    def __init__(self, n_fft, hop_length, win_length=None, center=True, pad_mode='reflect', input_length=None):
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.win_length = n_fft if win_length is None else win_length
+        self.center = center
+        self.pad_mode = pad_mode
+        self.input_length = input_length
+
+    def stft(self, y: np.ndarray) -> np.ndarray:
+        """Returns the complex64 STFT of shape (..., n_fft // 2 + 1, frames) of waveforms y (..., samples)."""
+        y = np.asarray(y, dtype=np.float32)
+        if self.input_length is not None:
+            if y.shape[-1] < self.input_length:
+                y = np.pad(y, [(0, 0)] * (y.ndim - 1) + [(0, self.input_length - y.shape[-1])])
+            y = y[..., :self.input_length]
+        batch_shape = y.shape[:-1]
+        with torch.inference_mode():
+            spectrum = torch.stft(torch.from_numpy(np.ascontiguousarray(y.reshape(-1, y.shape[-1]))),
+                                  n_fft=self.n_fft, hop_length=self.hop_length, win_length=self.win_length,
+                                  window=torch.hann_window(self.win_length), center=self.center,
+                                  pad_mode=self.pad_mode, return_complex=True)
+        return spectrum.numpy().reshape(batch_shape + spectrum.shape[-2:])
+
+class SpectralLimeAdapter(LimeAdapter):
+    """LIME adapter of a model whose input stage is a linear STFT front end. Perturbations can
+    then be composed directly as complex spectrograms, skipping the STFT per sample."""
+    @abstractmethod
+    def get_stft_front_end(self) -> StftFrontEnd: pass
+    """Returns the linear front end the model applies to its waveform input."""
+
+    @abstractmethod
+    def get_lime_spectral_predict_fn(self) -> Callable[[np.ndarray], np.ndarray]: pass
+    """Returns a function that takes a batch of complex STFTs computed by the front end and returns
+    the model's predictions, the same as the LIME predict function on the corresponding waveforms."""
@@ -8,9 +8,12 @@ from pylibxai.Interfaces import (
     IGradientsAdapter, 
     LrpAdapter, 
     ModelLabelProvider, 
+    SpectralLimeAdapter,
+    StftFrontEnd,
     ViewInterface,
     ViewType
 )
+import torchaudio
 
 class TestAbstractMethodEnforcement:
     """Test that abstract methods are properly enforced"""
@@ -321,3 +324,40 @@ class TestAbstractMethodEnforcement:
         predict_fn = adapter.get_lime_predict_fn()
         result = predict_fn(np.array([1, 2, 3]))
         np.testing.assert_array_equal(result, np.array([2, 4, 6]))
+
+
+class TestSpectralLimeAdapter:
+    """Test the linear STFT front end declared by spectral LIME adapters"""
+
+    def test_spectral_adapter_requires_front_end(self):
+        """Test that SpectralLimeAdapter enforces the front end and the spectral predict function"""
+
+        class IncompleteSpectralAdapter(SpectralLimeAdapter):
+            def get_lime_predict_fn(self):
+                return lambda x: x
+
+        with pytest.raises(TypeError) as excinfo:
+            IncompleteSpectralAdapter()
+
+        assert "get_stft_front_end" in str(excinfo.value)
+        assert "get_lime_spectral_predict_fn" in str(excinfo.value)
+
+    def test_front_end_matches_torchaudio_spectrogram(self):
+        """Test the front end STFT equals the complex spectrogram torchaudio computes"""
+        y = np.random.RandomState(0).uniform(-1, 1, (3, 4000)).astype(np.float32)
+        front_end = StftFrontEnd(n_fft=512, hop_length=256)
+
+        expected = torchaudio.transforms.Spectrogram(n_fft=512, power=None)(torch.from_numpy(y)).numpy()
+
+        np.testing.assert_allclose(front_end.stft(y), expected, rtol=1e-4, atol=1e-4)
+
+    def test_front_end_is_linear(self):
+        """Test the STFT of a sum equals the sum of the STFTs, including padding to input_length"""
+        rng = np.random.RandomState(1)
+        a, b = rng.uniform(-1, 1, (2, 3000)).astype(np.float32)
+        front_end = StftFrontEnd(n_fft=256, hop_length=64, input_length=4000)
+
+        spectrum = front_end.stft(a + b)
+
+        assert spectrum.shape == (129, 4000 // 64 + 1)
+        np.testing.assert_allclose(spectrum, front_end.stft(a) + front_end.stft(b), rtol=1e-4, atol=1e-4)
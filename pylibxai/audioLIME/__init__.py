@@ -1,4 +1,6 @@
-from .factorization import SpleeterFactorization
-from audioLIME import lime_audio
+from .factorization import BandFactorization, NMFFactorization, SpleeterFactorization
+from .separator_worker import SeparatorWorker
+from .stem_cache import StemCache
+from . import lime_audio
 
 __version__ = "0.1.0"
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Benchmarks LimeBase.forward_selection against the refitting reference implementation.
+
+    python -m pylibxai.audioLIME.benchmark_forward_selection --num-samples 4096
+"""
+import argparse
+import time
+
+import numpy as np
+
+from pylibxai.audioLIME.lime_base import LimeBase
+
+
+def make_neighborhood(num_samples, num_components, random_state):
+    data = random_state.randint(0, 2, (num_samples, num_components))
+    data[0, :] = 1
+    labels = data @ random_state.normal(size=num_components) + random_state.normal(scale=0.5, size=num_samples)
+    distances = 1 - np.sqrt(data.sum(axis=1) / num_components)
+    weights = np.sqrt(np.exp(-(distances ** 2) / 0.25 ** 2))
+    return data, labels, weights
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incremental against refitting forward selection.")
+    parser.add_argument('--num-samples', type=int, default=4096, help="Size of the LIME neighborhood.")
+    parser.add_argument('--num-features', type=int, default=6, help="Number of features to select.")
+    parser.add_argument('--components', type=str, default="50,200,1000",
+                        help="Comma separated numbers of components.")
+    args = parser.parse_args()
+
+    base = LimeBase(kernel_fn=None, random_state=0)
+    random_state = np.random.RandomState(0)
+    print('{:>10} {:>12} {:>14} {:>9} {:>6}'.format('components', 'refit [s]', 'incremental [s]', 'speedup', 'same'))
+    for num_components in map(int, args.components.split(',')):
+        data, labels, weights = make_neighborhood(args.num_samples, num_components, random_state)
+        reference, refit_time = timed(base.forward_selection_refit, data, labels, weights, args.num_features)
+        selected, incremental_time = timed(base.forward_selection, data, labels, weights, args.num_features)
+        print('{:>10} {:>12.3f} {:>14.3f} {:>8.1f}x {:>6}'.format(
+            num_components, refit_time, incremental_time, refit_time / incremental_time,
+            str(np.array_equal(reference, selected))))
+
+
+if __name__ == '__main__':
+    main()
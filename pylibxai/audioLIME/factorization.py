@@ -1,10 +1,15 @@
+import copy
 import numpy as np
 import warnings
 import os
 import librosa
-from audioLIME.factorization_base import Factorization
+from functools import lru_cache
+from scipy.fft import next_fast_len
+from scipy.signal import firwin
+from pylibxai.audioLIME.factorization_base import Factorization
 
 from pylibxai.AudioLoader import RawAudioLoader
+from pylibxai.AudioLoader.resampling import resample
 
 try:
     import torch
@@ -27,7 +32,47 @@ def default_composition_fn(x):
     return x
 
 
+class SegmentComponent(object):
+    """
+    Component that is nonzero in a single temporal segment only, stored as the offset of the
+    segment and a view into the stem instead of a zero-padded copy.
+    """
+    __slots__ = ('offset', 'data', 'length')
+
+    def __init__(self, offset, data, length):
+        """
+        :param offset: index of the first sample of the segment
+        :param data: samples of the segment, usually a view into the original stem
+        :param length: length of the (zero-padded) signal the component belongs to
+        """
+        self.offset = offset
+        self.data = data
+        self.length = length
+
+    @property
+    def shape(self):
+        return (self.length,)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return self.length
+
+    def add_to(self, y):
+        """Adds the component to y in place."""
+        y[self.offset:self.offset + len(self.data)] += self.data
+        return y
+
+    def __array__(self, dtype=None, copy=None):
+        y = np.zeros(self.length, dtype=self.data.dtype if dtype is None else dtype)
+        return self.add_to(y)
+
+
 class DataBasedFactorization(Factorization):
+    # bytes the segment lookup table may take, composition falls back to the segment matmul above
+    segment_lookup_budget = 256 * 2 ** 20
 
     def __init__(self, data_provider, n_temporal_segments, composition_fn=None):
         """
@@ -46,17 +91,107 @@ class DataBasedFactorization(Factorization):
         self.original_components = []
         self.components = []
         self._components_names = []
+        self._stem_names = None
+        self._explained_length = 0
+        self._component_matrix = None
+        self._segment_stems = None
+        self._segment_lookup = None
 
         self.initialize_components()  # that's the part that's specific to each source sep. algorithm
         self.set_analysis_window(0, len(self.data_provider.get_mix()))
 
     def compose_model_input(self, components=None):
-        sel_sources = self.retrieve_components(selection_order=components)
-        if len(sel_sources) > 1:
-            y = sum(sel_sources)
+        return self.composition_fn(self.sum_components(components))
+
+    def sum_components(self, selection_order=None):
+        """
+        :param selection_order: indices of the components to sum, all components if None
+        :return: float32 waveform of the selected components, each added into its own segment
+        """
+        y = np.zeros(self._explained_length, dtype=np.float32)
+        for component in self.retrieve_components(selection_order):
+            component.add_to(y)
+        return y
+
+    def get_component_matrix(self):
+        """
+        :return: contiguous float32 array of shape (n_components, n_samples) holding the dense
+                 current components, built once per analysis window; composition does not use it
+        """
+        if self._component_matrix is None:
+            self._component_matrix = np.ascontiguousarray(np.stack(self.components), dtype=np.float32)
+        return self._component_matrix
+
+    def uses_segment_lookup(self):
+        """
+        Components are single stems restricted to non-overlapping temporal segments, so every
+        segment of a perturbation is one of 2^n_stems stem combinations. These are precomputed
+        in a lookup table as long as it fits into segment_lookup_budget.
+        """
+        n_temporal_segments, n_stems, samples_per_segment = self._segment_stems.shape
+        table_bytes = 2 ** n_stems * n_temporal_segments * samples_per_segment * np.dtype(np.float32).itemsize
+        return table_bytes <= self.segment_lookup_budget
+
+    def get_segment_lookup(self):
+        """
+        :return: float32 array of shape (n_temporal_segments, 2^n_stems, samples_per_segment),
+                 entry [s, p] is the sum of the stems whose bits are set in p, restricted to segment s
+        """
+        if self._segment_lookup is None:
+            n_stems = self._segment_stems.shape[1]
+            patterns = (np.arange(2 ** n_stems)[:, None] >> np.arange(n_stems)) & 1
+            self._segment_lookup = np.ascontiguousarray(
+                np.matmul(patterns.astype(np.float32), self._segment_stems), dtype=np.float32)
+        return self._segment_lookup
+
+    def compose_waveforms(self, masks, out=None):
+        """
+        Sums the selected components for every mask, before composition_fn is applied.
+
+        Every segment is copied from the segment lookup table, see uses_segment_lookup; without
+        the table the segments are products of the stem bits with the stems of the segment.
+
+        :param masks: binary array of shape (n_masks, n_components)
+        :param out: optional contiguous float32 array of shape (n_masks, n_samples) to write into
+        :return: float32 array of shape (n_masks, n_samples)
+        """
+        masks = np.asarray(masks)
+        n_temporal_segments, n_stems, samples_per_segment = self._segment_stems.shape
+        # component index is segment * n_stems + stem
+        segment_masks = (masks != 0).reshape(len(masks), n_temporal_segments, n_stems)
+        if out is None:
+            out = np.empty((len(masks), n_temporal_segments * samples_per_segment), dtype=np.float32)
+        y = out.reshape(len(masks), n_temporal_segments, samples_per_segment)
+
+        if not self.uses_segment_lookup():
+            # segment-local products, (segments, masks, stems) @ (segments, stems, samples)
+            np.matmul(segment_masks.transpose(1, 0, 2).astype(np.float32), self._segment_stems,
+                      out=y.transpose(1, 0, 2))
+            return out
+
+        # the stem bits of a segment form its pattern
+        lookup = self.get_segment_lookup()
+        patterns = segment_masks @ (1 << np.arange(n_stems))
+        rows = patterns + np.arange(n_temporal_segments) * lookup.shape[1]
+        # rows are in range; unlike mode='raise', 'clip' gathers straight into out without a buffer
+        np.take(lookup.reshape(-1, samples_per_segment), rows, axis=0, out=y, mode='clip')
+        return out
+
+    def compose_batch(self, masks, out=None):
+        masks = np.asarray(masks)
+        if self.composition_fn is not default_composition_fn:
+            out = None
+        y = self.compose_waveforms(masks, out=out)
+
+        empty_rows = ~masks.any(axis=1)
+        if self.composition_fn is not default_composition_fn:
+            composed = np.array([self.composition_fn(row) for row in y])
         else:
-            y = sel_sources[0]
-        return self.composition_fn(y)
+            composed = y
+        if empty_rows.any():
+            full = self.compose_waveforms(np.ones((1, masks.shape[1]), dtype=masks.dtype))[0]
+            composed[empty_rows] = self.composition_fn(full).min()
+        return composed
 
     def get_number_components(self):
         return len(self.components)
@@ -78,6 +213,8 @@ class DataBasedFactorization(Factorization):
         # this resets in case temporal segmentation was previously applied
         self.components = [
             comp[start_sample:start_sample + y_length] for comp in self.original_components]
+        if self._stem_names is None:
+            self._stem_names = list(self._components_names)
 
         mix = self.data_provider.get_mix()
         audio_length = len(mix)
@@ -94,42 +231,221 @@ class DataBasedFactorization(Factorization):
             segment_start = s * samples_per_segment
             segment_end = segment_start + samples_per_segment
             for co in range(self.get_number_components()):
-                current_component = np.zeros(explained_length, dtype=np.float32)
-                current_component[segment_start:segment_end] = self.components[co][segment_start:segment_end]
-                temporary_components.append(current_component)
-                component_names.append(self._components_names[co]+str(s))
+                # views into the stems, no zero-padded copy per (segment, stem)
+                temporary_components.append(SegmentComponent(
+                    segment_start, self.components[co][segment_start:segment_end], explained_length))
+                component_names.append(self._stem_names[co]+str(s))
 
+        # (n_temporal_segments, n_stems, samples_per_segment) view the segment lookup is built from
+        segment_stems = np.stack([comp[:explained_length] for comp in self.components])
+        segment_stems = segment_stems.reshape(-1, n_temporal_segments, samples_per_segment)
+        self._segment_stems = np.ascontiguousarray(segment_stems.transpose(1, 0, 2), dtype=np.float32)
         self.components = temporary_components
         self._components_names = component_names
+        self._explained_length = explained_length
+        self._component_matrix = None
+        self._segment_lookup = None
 
     def set_analysis_window(self, start_sample, y_length):
         self.data_provider.set_analysis_window(start_sample, y_length)
         self.prepare_components(start_sample, y_length)
 
+    def window_view(self, start_sample, y_length):
+        view = copy.copy(self)
+        # the data provider holds the window, the separated stems are shared
+        view.data_provider = copy.copy(self.data_provider)
+        view.set_analysis_window(start_sample, y_length)
+        return view
+
 
 class SpleeterFactorization(DataBasedFactorization):
-    def __init__(self, data_provider, n_temporal_segments, composition_fn, model_name, target_sr=16000):
+    def __init__(self, data_provider, n_temporal_segments, composition_fn, model_name, target_sr=16000,
+                 stem_cache=None, separator=None):
+        """
+        :param stem_cache: optional StemCache; stems of audio separated before with the same
+                model_name and target_sr are loaded from it instead of running spleeter
+        :param separator: optional object with a spleeter Separator.separate method, e.g. a
+                SeparatorWorker shared between factorizations; a new Separator is built if None
+        """
         assert isinstance(data_provider, RawAudioLoader)
         self.model_name = model_name
         self.target_sr = target_sr
+        self.stem_cache = stem_cache
+        self.separator = separator
         super().__init__(data_provider, n_temporal_segments, composition_fn)
 
     def initialize_components(self):
         spleeter_sr = 41000
 
-        if Separator is None:
-            raise ImportError('spleeter is not imported')
+        mix = self.data_provider.get_mix()
+        if self.stem_cache is not None:
+            cache_key = self.stem_cache.key(mix, self.model_name, self.target_sr)
+            entry = self.stem_cache.get(cache_key)
+            if entry is not None:
+                self._components_names, stems = entry
+                self.original_components = list(stems)
+                return
 
-        separator = Separator(self.model_name, multiprocess=False)
+        separator = self.separator
+        if separator is None:
+            if Separator is None:
+                raise ImportError('spleeter is not imported')
+            separator = Separator(self.model_name, multiprocess=False)
 
         # Perform the separation:
-        waveform = self.data_provider.get_mix()
-        waveform = np.expand_dims(waveform, axis=0)
-        waveform = librosa.resample(waveform, orig_sr=self.target_sr, target_sr=spleeter_sr)
-        waveform = np.swapaxes(waveform, 0, 1)
+        waveform = resample(mix, self.target_sr, spleeter_sr)[:, np.newaxis]
         prediction = separator.separate(waveform)
 
-        self.original_components = [
-            librosa.resample(np.mean(prediction[key], axis=1), orig_sr=spleeter_sr, target_sr=self.target_sr) for
-            key in prediction]
+        # all stems are resampled back in a single call
+        stems = np.stack([np.mean(prediction[key], axis=1) for key in prediction])
+        self.original_components = list(resample(stems, spleeter_sr, self.target_sr))
         self._components_names = list(prediction.keys())
+
+        if self.stem_cache is not None:
+            self.stem_cache.put(cache_key, self._components_names, self.original_components)
+
+
+class NMFFactorization(DataBasedFactorization):
+    """
+    Separation-free factorization: the STFT magnitude of the analysis window is factored into
+    n_components spectral templates with multiplicative updates for the KL divergence, and every
+    template is turned into a stem by soft masking the complex STFT of the mix, so the stems sum
+    up to the mix.
+
+    Each analysis window is factored on its own. When the window moves, the updates start from the
+    templates of the previous window, which converges in fewer iterations and keeps the template
+    order (and thereby the component names) stable along a track.
+    """
+    def __init__(self, data_provider, n_temporal_segments, composition_fn=None, n_components=4,
+                 n_iter=200, warm_start_iter=50, tol=1e-4, n_fft=1024, hop_length=256, random_state=0):
+        """
+        :param n_components: number of spectral templates (stems)
+        :param n_iter: maximum number of updates of the first window
+        :param warm_start_iter: maximum number of updates of windows warm-started from the previous one
+        :param tol: updates stop once the divergence decreased by less than this fraction over 10 updates
+        :param n_fft: STFT size
+        :param hop_length: STFT hop size
+        :param random_state: seed of the template initialization of the first window
+        """
+        self.n_components = n_components
+        self.n_iter = n_iter
+        self.warm_start_iter = warm_start_iter
+        self.tol = tol
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.random_state = random_state
+        self.templates = None
+        self.activations = None
+        self.divergence = None
+        super().__init__(data_provider, n_temporal_segments, composition_fn)
+
+    def initialize_components(self):
+        self._components_names = ['nmf{}'.format(k) for k in range(self.n_components)]
+
+    def factorize(self, magnitude, templates=None, n_iter=None):
+        """
+        :param magnitude: nonnegative array of shape (n_bins, n_frames)
+        :param templates: optional initial templates of shape (n_bins, n_components)
+        :return: tuple (templates, activations, divergence), templates are normalized to unit sum
+        """
+        eps = np.finfo(np.float32).eps
+        n_iter = self.n_iter if n_iter is None else n_iter
+        rng = np.random.RandomState(self.random_state)
+        scale = np.sqrt(magnitude.mean() / self.n_components) + eps
+        if templates is None:
+            templates = rng.uniform(0.5, 1.5, (magnitude.shape[0], self.n_components)) * scale
+        templates = np.array(templates, dtype=np.float64)
+        activations = np.full((self.n_components, magnitude.shape[1]), scale)
+
+        def kl_divergence(approximation):
+            return np.sum(magnitude * np.log((magnitude + eps) / approximation) - magnitude + approximation)
+
+        approximation = templates @ activations + eps
+        previous = kl_divergence(approximation)
+        for i in range(n_iter):
+            activations *= (templates.T @ (magnitude / approximation)) / (templates.sum(axis=0)[:, None] + eps)
+            approximation = templates @ activations + eps
+            templates *= ((magnitude / approximation) @ activations.T) / (activations.sum(axis=1) + eps)
+            approximation = templates @ activations + eps
+            if (i + 1) % 10 == 0:
+                divergence = kl_divergence(approximation)
+                if previous - divergence < self.tol * previous:
+                    break
+                previous = divergence
+
+        norms = templates.sum(axis=0) + eps
+        return templates / norms, activations * norms[:, None], kl_divergence(approximation)
+
+    def set_analysis_window(self, start_sample, y_length):
+        self.data_provider.set_analysis_window(start_sample, y_length)
+        mix = self.data_provider.get_mix()
+
+        stft = librosa.stft(mix, n_fft=self.n_fft, hop_length=self.hop_length)
+        magnitude = np.abs(stft).astype(np.float64)
+        warm_start = self.templates is not None
+        self.templates, self.activations, self.divergence = self.factorize(
+            magnitude, self.templates, self.warm_start_iter if warm_start else self.n_iter)
+
+        # soft masks of all templates, inverted with one batched ISTFT
+        parts = self.templates.T[:, :, None] * self.activations[:, None, :]
+        masks = parts / (parts.sum(axis=0) + np.finfo(np.float32).eps)
+        stems = librosa.istft(masks * stft, n_fft=self.n_fft, hop_length=self.hop_length, length=len(mix))
+        self.original_components = list(stems.astype(np.float32))
+
+        # stems cover the current window only
+        self.prepare_components(0, y_length)
+
+
+@lru_cache(maxsize=16)
+def band_filterbank(sr, band_edges, numtaps):
+    """
+    :param sr: sampling rate
+    :param band_edges: increasing tuple of the cutoff frequencies between the bands
+    :param numtaps: odd length of the linear phase filters
+    :return: array of shape (len(band_edges) + 1, numtaps) with band-pass filters that sum up to a
+             unit impulse, i.e. the filtered bands add back up to the signal
+    """
+    lowpasses = [firwin(numtaps, edge, fs=sr) for edge in band_edges]
+    impulse = np.zeros(numtaps)
+    impulse[numtaps // 2] = 1.0
+    cumulative = [np.zeros(numtaps)] + lowpasses + [impulse]
+    filters = np.diff(np.stack(cumulative), axis=0)
+    filters.setflags(write=False)
+    return filters
+
+
+class BandFactorization(DataBasedFactorization):
+    """
+    Splits the mix into frequency bands with a perfect reconstruction filterbank: band k holds the
+    difference of two linear phase low-pass filters, so all bands add back up to the mix.
+    Perturbations then compose by summation without any per-sample transform, and factorizing a
+    track costs one batched FFT convolution.
+    """
+    def __init__(self, data_provider, n_temporal_segments, composition_fn=None, band_edges=None, n_bands=6,
+                 sr=16000, numtaps=1025):
+        """
+        :param band_edges: increasing cutoff frequencies between the bands in Hz; if None, n_bands
+                bands with log-spaced edges from 125 Hz up to a quarter of sr
+        :param n_bands: number of bands if band_edges is None
+        :param sr: sampling rate of the mix
+        :param numtaps: length of the filters, odd so the filters have an integer delay
+        """
+        if band_edges is None:
+            band_edges = np.geomspace(125.0, sr / 4, n_bands - 1)
+        if numtaps % 2 == 0:
+            raise ValueError('numtaps must be odd.')
+        self.band_edges = tuple(float(edge) for edge in band_edges)
+        self.sr = sr
+        self.numtaps = numtaps
+        super().__init__(data_provider, n_temporal_segments, composition_fn)
+
+    def initialize_components(self):
+        filters = band_filterbank(self.sr, self.band_edges, self.numtaps)
+        mix = np.asarray(self.data_provider.get_mix(), dtype=np.float32)
+        # one FFT of the mix shared by all filters, centered ('same') part of the convolutions
+        n_fft = next_fast_len(len(mix) + self.numtaps - 1)
+        spectra = np.fft.rfft(mix, n_fft) * np.fft.rfft(filters, n_fft, axis=-1)
+        delay = self.numtaps // 2
+        bands = np.fft.irfft(spectra, n_fft, axis=-1)[:, delay:delay + len(mix)]
+        self.original_components = list(bands.astype(np.float32))
+        self._components_names = ['band{}'.format(k) for k in range(len(filters))]
@@ -1,3 +1,8 @@
+import copy
+
+import numpy as np
+
+
 class Factorization(object):
     def __init__(self):
         pass
@@ -5,6 +10,35 @@ class Factorization(object):
     def compose_model_input(self, components=None):
         raise NotImplementedError
 
+    def compose_batch(self, masks, out=None):
+        """
+        Composes the model inputs for a batch of binary masks.
+
+        :param masks: array of shape (n_masks, n_components), a nonzero entry selects the component
+        :param out: optional preallocated array the batch is written into when its shape matches
+        :return: array of shape (n_masks, ...) with one composed model input per mask; masks that
+                 select no component are composed as a constant signal at the minimum of the
+                 full composition
+        """
+        masks = np.asarray(masks)
+        composed = [None] * len(masks)
+        empty_rows = []
+        for i, mask in enumerate(masks):
+            non_zeros = np.flatnonzero(mask)
+            if len(non_zeros) == 0:
+                empty_rows.append(i)
+            else:
+                composed[i] = self.compose_model_input(non_zeros)
+        if len(empty_rows) > 0:
+            like = self.compose_model_input()
+            for i in empty_rows:
+                composed[i] = np.zeros_like(like) + like.min()
+        composed = np.array(composed)
+        if out is not None and out.shape == composed.shape:
+            out[...] = composed
+            return out
+        return composed
+
     def get_number_components(self):
         raise NotImplementedError
 
@@ -15,4 +49,15 @@ class Factorization(object):
         raise NotImplementedError
 
     def set_analysis_window(self, start_sample, y_length):
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def window_view(self, start_sample, y_length):
+        """
+        Returns a shallow copy analysing another window, without factorizing the audio again.
+
+        :param start_sample: index of the sample where the analysis window starts
+        :param y_length: length (in samples) of the analysis window
+        """
+        view = copy.copy(self)
+        view.set_analysis_window(start_sample, y_length)
+        return view
@@ -1,7 +1,7 @@
 import numpy as np
 import librosa
 import warnings
-from audioLIME.factorization_base import Factorization
+from pylibxai.audioLIME.factorization_base import Factorization
 
 
 class SoundLIMEFactorization(Factorization):
@@ -35,6 +35,7 @@ class SoundLIMEFactorization(Factorization):
         mag, phase = librosa.magphase(D)
         self.phase = phase
         self.spectrogram = mag
+        self._complex_spectrogram = mag * phase
 
         assert self.spectrogram.shape[0] % self.frequency_segments == 0, \
             "spec height {} must be a multiple of frequency_segments {} (for now)".format(mag.shape[0], self.frequency_segments)
@@ -45,6 +46,32 @@ class SoundLIMEFactorization(Factorization):
         y_ = librosa.istft(D_, length=len(self.mix))
         return y_
 
+    def compose_batch(self, masks, out=None):
+        """
+        Composes a batch of masks with a single ISTFT call. Each mask is expanded into a
+        time-frequency block mask (Kronecker product of the (frequency, time) segment grid with
+        a block of ones), applied to the complex spectrogram, and the whole batch is inverted at once.
+        """
+        masks = np.asarray(masks)
+        n_freq, n_frames = self.spectrogram.shape
+        freq_length = n_freq // self.frequency_segments
+        temp_length = n_frames // self.temporal_segments
+
+        # component index is t * frequency_segments + f, following [Mishra 2017] Figure 4
+        grid = (masks != 0).reshape(len(masks), self.temporal_segments, self.frequency_segments)
+        grid = grid.transpose(0, 2, 1)[:, :, np.newaxis, :, np.newaxis]
+        block_masks = np.broadcast_to(grid, (len(masks), self.frequency_segments, freq_length,
+                                             self.temporal_segments, temp_length)).reshape(len(masks), n_freq, n_frames)
+
+        composed = librosa.istft(block_masks * self._complex_spectrogram, length=len(self.mix))
+        empty_rows = ~masks.any(axis=1)
+        if empty_rows.any():
+            composed[empty_rows] = self.compose_model_input().min()
+        if out is not None and out.shape == composed.shape:
+            out[...] = composed
+            return out
+        return composed
+
     def get_number_components(self):
         return self.frequency_segments * self.temporal_segments
 
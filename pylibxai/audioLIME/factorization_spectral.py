@@ -0,0 +1,95 @@
+import copy
+
+import numpy as np
+from pylibxai.audioLIME.factorization_base import Factorization
+from pylibxai.audioLIME.factorization import default_composition_fn
+
+
+class SpectralFactorization(Factorization):
+    """
+    Composes the perturbations of a DataBasedFactorization directly as complex STFTs.
+
+    The STFT front end of a model is linear, so the STFT of a sum of components is the sum of
+    their STFTs. The STFT of every component is computed once per analysis window, restricted
+    to the frames its temporal segment reaches, and perturbations are composed by summing them.
+    The model then only runs its nonlinear stages (magnitude, mel, ...) per sample.
+    """
+    def __init__(self, factorization, front_end):
+        """
+        :param factorization: DataBasedFactorization without a composition_fn
+        :param front_end: StftFrontEnd of the model the perturbations are passed to
+        """
+        super().__init__()
+        if factorization.composition_fn is not default_composition_fn:
+            raise ValueError('Spectral composition requires a factorization without composition_fn.')
+        self.factorization = factorization
+        self.front_end = front_end
+        self.prepare_spectra()
+
+    def prepare_spectra(self):
+        components = self.factorization.retrieve_components()
+        segments = {}
+        for index, component in enumerate(components):
+            segments.setdefault(component.offset, []).append(index)
+
+        self._segment_spectra = []
+        for indices in segments.values():
+            waveforms = np.zeros((len(indices), len(components[0])), dtype=np.float32)
+            for waveform, index in zip(waveforms, indices):
+                components[index].add_to(waveform)
+            spectra = self.front_end.stft(waveforms)
+            # only frames overlapping the segment are nonzero
+            active = np.flatnonzero(np.abs(spectra).max(axis=(0, 1)) > 0)
+            frame_start, frame_stop = (active[0], active[-1] + 1) if len(active) > 0 else (0, 0)
+            spectra = np.ascontiguousarray(spectra[:, :, frame_start:frame_stop])
+            self._segment_spectra.append((np.array(indices), frame_start, frame_stop, spectra))
+
+        full = self.factorization.sum_components()
+        self._empty_spectrum = self.front_end.stft(np.full(len(full), full.min(), dtype=np.float32))
+
+    def compose_model_input(self, components=None):
+        return self.front_end.stft(self.factorization.sum_components(components))
+
+    def compose_batch(self, masks, out=None):
+        """
+        :param masks: binary array of shape (n_masks, n_components)
+        :param out: optional complex64 array of shape (n_masks, freq_bins, frames) to write into
+        :return: complex64 STFTs of the composed perturbations; masks that select no component
+                 are the STFT of a constant signal at the minimum of the full composition
+        """
+        masks = np.asarray(masks)
+        shape = (len(masks),) + self._empty_spectrum.shape
+        if out is None or out.shape != shape or out.dtype != np.complex64:
+            out = np.zeros(shape, dtype=np.complex64)
+        else:
+            out[...] = 0
+        for indices, frame_start, frame_stop, spectra in self._segment_spectra:
+            segment_masks = (masks[:, indices] != 0).astype(np.float32)
+            out[:, :, frame_start:frame_stop] += np.tensordot(segment_masks, spectra, axes=1)
+
+        empty_rows = ~masks.any(axis=1)
+        if empty_rows.any():
+            out[empty_rows] = self._empty_spectrum
+        return out
+
+    def sum_components(self, selection_order=None):
+        return self.factorization.sum_components(selection_order)
+
+    def get_number_components(self):
+        return self.factorization.get_number_components()
+
+    def retrieve_components(self, selection_order=None):
+        return self.factorization.retrieve_components(selection_order)
+
+    def get_ordered_component_names(self):
+        return self.factorization.get_ordered_component_names()
+
+    def set_analysis_window(self, start_sample, y_length):
+        self.factorization.set_analysis_window(start_sample, y_length)
+        self.prepare_spectra()
+
+    def window_view(self, start_sample, y_length):
+        view = copy.copy(self)
+        view.factorization = self.factorization.window_view(start_sample, y_length)
+        view.prepare_spectra()
+        return view
@@ -1,14 +1,19 @@
 """
 Functions for explaining classifiers that use Image data.
 """
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from functools import partial
 
 import numpy as np
 import sklearn
 import sklearn.preprocessing
+import scipy.stats
 from sklearn.utils import check_random_state
 
-from audioLIME import lime_base
+from pylibxai.audioLIME import lime_base
 
 class AudioExplanation(object):
     def __init__(self, factorization, factors, neighborhood_data, neighborhood_labels):
@@ -71,6 +76,225 @@ class AudioExplanation(object):
         return components
 
 
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(axis=1)
+
+
+class PackedMasks(object):
+    """Binary perturbation masks stored bit-packed, eight components per byte.
+
+    Rows are unpacked lazily: indexing a single row, iteration and iter_blocks
+    only unpack the rows they return, in blocks of block_size rows. Slicing
+    rows returns PackedMasks, indexing rows and columns returns the dense
+    uint8 selection and np.asarray unpacks the whole matrix.
+    """
+    block_size = 4096
+
+    def __init__(self, bits, n_features):
+        self.bits = bits
+        self.n_features = n_features
+
+    @classmethod
+    def empty(cls, n_samples, n_features):
+        return cls(np.zeros((n_samples, (n_features + 7) // 8), dtype=np.uint8), n_features)
+
+    @classmethod
+    def from_dense(cls, masks):
+        masks = np.asarray(masks)
+        return cls(np.packbits(masks != 0, axis=1), masks.shape[1])
+
+    @classmethod
+    def concatenate(cls, packed_masks):
+        return cls(np.concatenate([masks.bits for masks in packed_masks]), packed_masks[0].n_features)
+
+    @property
+    def shape(self):
+        return len(self.bits), self.n_features
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def __len__(self):
+        return len(self.bits)
+
+    def set_rows(self, start, masks):
+        """Packs a dense block of masks into the rows from start on."""
+        self.bits[start:start + len(masks)] = np.packbits(np.asarray(masks) != 0, axis=1)
+
+    def unpack(self, rows=slice(None)):
+        return np.unpackbits(self.bits[rows], axis=-1, count=self.n_features)
+
+    def popcount(self):
+        """Returns the number of selected components of every mask."""
+        counts = np.zeros(len(self), dtype=np.int64)
+        for start in range(0, len(self), self.block_size):
+            counts[start:start + self.block_size] = _POPCOUNT[self.bits[start:start + self.block_size]].sum(axis=1)
+        return counts
+
+    def iter_blocks(self, dtype=np.uint8):
+        """Yields (start, block) pairs of consecutive dense row blocks."""
+        for start in range(0, len(self), self.block_size):
+            yield start, self.unpack(slice(start, start + self.block_size)).astype(dtype, copy=False)
+
+    def __iter__(self):
+        for _, block in self.iter_blocks():
+            yield from block
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows, columns = key[0], (slice(None),) + key[1:]
+            selected = self[rows]
+            if not isinstance(selected, PackedMasks):
+                return selected[key[1:]]
+            if len(selected) == 0:
+                return selected.unpack()[columns]
+            return np.concatenate([block[columns] for _, block in selected.iter_blocks()])
+        if isinstance(key, (int, np.integer)):
+            return self.unpack(key)
+        return PackedMasks(self.bits[key], self.n_features)
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.unpack()
+        return dense if dtype is None else dense.astype(dtype)
+
+
+class PredictionCache(object):
+    """Memoizes model predictions of perturbed inputs, keyed by their component bitmask."""
+
+    def __init__(self):
+        self._predictions = {}
+        self._components = None
+        self._predict_fn = None
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, factorization, predict_fn):
+        """Binds the cache to a factorization window and predict_fn.
+
+        Cached predictions are dropped whenever either of them changes, e.g.
+        after factorization.set_analysis_window, so the same cache can be
+        passed to consecutive explain_instance calls.
+        """
+        components = factorization.retrieve_components()
+        if components is not self._components or predict_fn is not self._predict_fn:
+            self.clear()
+            self._components = components
+            self._predict_fn = predict_fn
+
+    def clear(self):
+        self._predictions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        """Returns the fraction of masks served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __len__(self):
+        return len(self._predictions)
+
+    def predict(self, masks, predict_fn):
+        """Returns predictions for masks, calling predict_fn only on unseen masks.
+
+        Args:
+            masks: binary array of shape (n_masks, n_components)
+            predict_fn: function mapping an array of unseen masks to a matrix
+                of predictions
+        """
+        masks = np.asarray(masks)
+        return self.predict_rows(masks, lambda rows: predict_fn(masks[rows]))
+
+    def predict_rows(self, masks, predict_rows_fn):
+        """Same as predict, but predict_rows_fn receives the row indices of
+        the unseen masks, e.g. to select them from an already composed batch."""
+        keys = [row.tobytes() for row in np.packbits(np.asarray(masks) != 0, axis=1)]
+        unseen = {}
+        for i, key in enumerate(keys):
+            if key not in self._predictions and key not in unseen:
+                unseen[key] = i
+        self.misses += len(unseen)
+        self.hits += len(keys) - len(unseen)
+
+        if len(unseen) > 0:
+            preds = predict_rows_fn(np.array(list(unseen.values())))
+            for key, pred in zip(unseen, preds):
+                self._predictions[key] = np.array(pred)
+        return np.array([self._predictions[key] for key in keys])
+
+
+class CompositionPipeline(object):
+    """Composes upcoming batches of perturbations on worker threads while the
+    current batch is inside predict_fn.
+
+    Composed batches are written into a ring of queue_depth + 1 reusable
+    buffers. At most queue_depth batches are composed ahead of the batch being
+    predicted; when the model is the slower stage, composition waits for a
+    buffer to be released (backpressure). predict_fn must not keep references
+    to its input after returning, as the buffer is reused.
+    """
+
+    def __init__(self, workers=1, queue_depth=2):
+        if workers < 1 or queue_depth < 1:
+            raise ValueError('workers and queue_depth must be positive.')
+        self.workers = workers
+        self.queue_depth = queue_depth
+
+    def compose(self, compose_fn, mask_batches):
+        """Yields (masks, composed) pairs in batch order.
+
+        Args:
+            compose_fn: function (masks, out) -> composed batch, out is a
+                reusable buffer of matching shape or None
+            mask_batches: iterable of mask batches, consumed on the calling
+                thread
+        """
+        buffers = [None] * (self.queue_depth + 1)
+        free_slots = deque(range(self.queue_depth + 1))
+        pending = deque()
+        mask_batches = iter(mask_batches)
+
+        def compose_job(slot, masks):
+            buffer = buffers[slot]
+            out = buffer[:len(masks)] if buffer is not None and len(buffer) >= len(masks) else None
+            composed = compose_fn(masks, out)
+            if out is None and isinstance(composed, np.ndarray):
+                buffers[slot] = composed
+            return composed
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        def submit_ahead():
+            while len(pending) < self.queue_depth and free_slots:
+                masks = next(mask_batches, None)
+                if masks is None:
+                    return
+                slot = free_slots.popleft()
+                pending.append((slot, masks, executor.submit(compose_job, slot, masks)))
+
+        try:
+            submit_ahead()
+            while pending:
+                slot, masks, future = pending.popleft()
+                composed = future.result()
+                submit_ahead()
+                yield masks, composed
+                free_slots.append(slot)
+                submit_ahead()
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
 class LimeAudioExplainer(object):
     """Explains predictions on audio data."""
 
@@ -114,7 +338,14 @@ class LimeAudioExplainer(object):
                          batch_size=10,
                          distance_metric='cosine',
                          model_regressor=None,
-                         random_seed=None):
+                         random_seed=None,
+                         memory_budget=None,
+                         prediction_cache=None,
+                         sample_round_size=None,
+                         convergence_top_k=5,
+                         convergence_tol=0.1,
+                         deadline=None,
+                         pipeline=None):
         """Generates explanations for a prediction.
 
         First, we generate neighborhood data by randomly perturbing features
@@ -142,10 +373,31 @@ class LimeAudioExplainer(object):
             random_seed: integer used as random seed for the segmentation
                 algorithm. If None, a random integer, between 0 and 1000,
                 will be generated using the internal random number generator.
+            memory_budget: if not None, peak memory (in bytes) allowed for the
+                neighborhood data and labels (see data_labels).
+            prediction_cache: optional PredictionCache, reused predictions are
+                not passed to predict_fn again. The same cache can be kept
+                across calls on the same factorization.
+            sample_round_size: if not None, the neighborhood is sampled in rounds
+                of this size (up to num_samples) and the surrogate is refitted
+                after every round. Sampling stops once the top
+                convergence_top_k components of every explained label keep their
+                ranking and the 95% confidence intervals of their coefficients
+                move by less than convergence_tol of their width between rounds.
+            convergence_top_k: number of top components checked for convergence.
+            convergence_tol: relative tolerance on confidence interval movement.
+            deadline: if not None, wall-clock budget in seconds. Sampling stops
+                when it runs out and the explanation is fitted on all samples
+                drawn so far. The first round is always completed. Implies
+                sampling in rounds, of num_samples // 8 if sample_round_size is
+                not set.
+            pipeline: optional CompositionPipeline overlapping the composition
+                of upcoming batches with predict_fn (see data_labels).
 
         Returns:
             An AudioExplanation object (see lime_audio.py) with the corresponding
-            explanations.
+            explanations. Its num_samples holds the size of the neighborhood used
+            and stop_reason one of 'num_samples', 'converged' or 'deadline'.
         """
 
         # check whether regression or classification task
@@ -167,14 +419,205 @@ class LimeAudioExplainer(object):
 
         top = labels
 
-        data, labels = self.data_labels(predict_fn, num_samples,
-                                        batch_size=batch_size)
+        if num_samples == 'exhaustive' and (sample_round_size is not None or deadline is not None):
+            raise ValueError('Sampling in rounds requires a number of samples, not exhaustive sampling.')
+        if deadline is not None:
+            deadline = time.monotonic() + deadline
+            if sample_round_size is None:
+                sample_round_size = max(num_samples // 8, batch_size)
+        if sample_round_size is None:
+            data, labels = self.data_labels(predict_fn, num_samples,
+                                            batch_size=batch_size,
+                                            memory_budget=memory_budget,
+                                            prediction_cache=prediction_cache,
+                                            pipeline=pipeline)
+            ret_exp = self._fit_explanation(factors, data, labels, top, top_labels, is_classification,
+                                            num_reg_targets, num_features, distance_metric, model_regressor)
+            ret_exp.num_samples = len(data)
+            ret_exp.stop_reason = 'num_samples'
+            return ret_exp
+
+        data_rounds, label_rounds = [], []
+        n_samples = 0
+        previous = None
+        stop_reason = 'num_samples'
+        while n_samples < num_samples:
+            data, labels = self.data_labels(predict_fn, min(sample_round_size, num_samples - n_samples),
+                                            batch_size=batch_size,
+                                            memory_budget=memory_budget,
+                                            prediction_cache=prediction_cache,
+                                            sample_offset=n_samples,
+                                            deadline=deadline if n_samples > 0 else None,
+                                            pipeline=pipeline)
+            data_rounds.append(data)
+            label_rounds.append(labels)
+            n_samples += len(data)
+
+            ret_exp, stderr = self._fit_explanation(factors, PackedMasks.concatenate(data_rounds),
+                                                    np.concatenate(label_rounds), top, top_labels,
+                                                    is_classification, num_reg_targets, num_features,
+                                                    distance_metric, model_regressor, return_stderr=True)
+            if deadline is not None and time.monotonic() >= deadline:
+                stop_reason = 'deadline'
+                break
+            if previous is not None and self._has_converged(previous, (ret_exp, stderr),
+                                                            convergence_top_k, convergence_tol):
+                stop_reason = 'converged'
+                break
+            previous = (ret_exp, stderr)
+
+        ret_exp.num_samples = n_samples
+        ret_exp.stop_reason = stop_reason
+        return ret_exp
+
+    @staticmethod
+    def window_starts(track_length, window_length, hop_length):
+        """Returns the start samples of windows of window_length, hop_length
+        apart; the last window ends at the end of the track."""
+        if window_length <= 0:
+            raise ValueError('window_length must be positive, got {}.'.format(window_length))
+        if hop_length <= 0:
+            raise ValueError('hop_length must be positive, got {}.'.format(hop_length))
+        starts = list(range(0, max(track_length - window_length, 0) + 1, hop_length))
+        if starts[-1] + window_length < track_length:
+            starts.append(track_length - window_length)
+        return starts
+
+    def explain_windows(self, factorization, predict_fn, window_starts, window_length,
+                        labels=None,
+                        top_labels=None,
+                        num_reg_targets=None,
+                        num_features=100000,
+                        num_samples=1000,
+                        batch_size=10,
+                        distance_metric='cosine',
+                        model_regressor=None,
+                        window_done_fn=None):
+        """Explains several analysis windows of a factorized track.
+
+        The track is factorized once: every window is a
+        factorization.window_view sharing the separated stems. Perturbations
+        of consecutive windows are packed into the same predict_fn calls, so a
+        batch may hold the last samples of one window and the first samples of
+        the next. Each window is fitted as soon as all its samples are
+        predicted.
+
+        Args:
+            factorization: Factorization of the whole track
+            predict_fn: see explain_instance
+            window_starts: start samples of the windows, see window_starts
+            window_length: length of the analysis windows in samples
+            labels, top_labels, num_reg_targets, num_features, num_samples,
+            distance_metric, model_regressor: see explain_instance
+            batch_size: number of perturbations per predict_fn call
+            window_done_fn: optional function (start_sample, explanation)
+                called for every window once its explanation is fitted
+
+        Returns:
+            A list of (start_sample, AudioExplanation) tuples in window order.
+        """
+        is_classification = bool(labels or top_labels)
+        if is_classification and num_reg_targets:
+            raise ValueError('Set labels or top_labels for classification. '
+                             'Set num_reg_targets for regression.')
+
+        results = []
+        batch = []  # (window, first row, masks) chunks of the next predict_fn call
+
+        def predict_batch():
+            composed = np.concatenate([window['view'].compose_batch(masks) for window, _, masks in batch])
+            preds = np.asarray(predict_fn(composed))
+            offset = 0
+            for window, row, masks in batch:
+                if window['labels'] is None:
+                    window['labels'] = np.empty((num_samples,) + preds.shape[1:], dtype=preds.dtype)
+                window['labels'][row:row + len(masks)] = preds[offset:offset + len(masks)]
+                offset += len(masks)
+                if row + len(masks) == num_samples:
+                    finish_window(window)
+
+        def finish_window(window):
+            self.factorization = window['view']
+            explanation = self._fit_explanation(window['view'].retrieve_components(), window['data'],
+                                                window['labels'], labels, top_labels, is_classification,
+                                                num_reg_targets, num_features, distance_metric, model_regressor)
+            explanation.num_samples = num_samples
+            explanation.stop_reason = 'num_samples'
+            results.append((window['start'], explanation))
+            if window_done_fn is not None:
+                window_done_fn(window['start'], explanation)
+
+        n_batched = 0
+        for start in window_starts:
+            view = factorization.window_view(start, window_length)
+            n_features = view.get_number_components()
+            masks = self.random_state.randint(0, 2, num_samples * n_features).reshape((num_samples, n_features))
+            masks[0, :] = 1
+            window = {'start': start, 'view': view, 'data': PackedMasks.from_dense(masks), 'labels': None}
+            row = 0
+            while row < num_samples:
+                # chunks are cut so that every predict_fn call gets batch_size rows
+                chunk_rows = min(batch_size - n_batched, num_samples - row)
+                batch.append((window, row, masks[row:row + chunk_rows]))
+                n_batched += chunk_rows
+                row += chunk_rows
+                if n_batched == batch_size:
+                    predict_batch()
+                    batch, n_batched = [], 0
+        if batch:
+            predict_batch()
+        return results
+
+    def compare_predict_fns(self, factorization, predict_fn, preview_fn,
+                            num_samples=1000,
+                            batch_size=10,
+                            num_components=3):
+        """Compares the explanation of a cheaper preview_fn to that of predict_fn.
+
+        Both explanations are fitted on the same neighborhood and explain the
+        top label of predict_fn.
 
-        distances = sklearn.metrics.pairwise_distances(
-            data,
-            data[0].reshape(1, -1),
-            metric=distance_metric
-        ).ravel()
+        Args:
+            factorization: see explain_instance
+            predict_fn: reference prediction function, e.g. the full precision model
+            preview_fn: prediction function under test, e.g. a quantized model
+            num_samples, batch_size: see explain_instance
+            num_components: number of top components compared
+
+        Returns:
+            A dict with the explained 'label', the Spearman rank correlation
+            'spearman' of all component weights, and 'top_overlap', the
+            fraction of the top num_components components of predict_fn also
+            among the top components of preview_fn.
+        """
+        state = self.random_state.get_state()
+        reference = self.explain_instance(factorization, predict_fn, top_labels=1,
+                                          num_samples=num_samples, batch_size=batch_size)
+        label = reference.top_labels[0]
+        self.random_state.set_state(state)
+        preview = self.explain_instance(factorization, preview_fn, labels=(label,),
+                                        num_samples=num_samples, batch_size=batch_size)
+
+        weights = np.zeros((2, factorization.get_number_components()))
+        for row, explanation in enumerate((reference, preview)):
+            for feature, weight, _ in explanation.local_exp[label]:
+                weights[row, feature] = weight
+        top = [set(np.argsort(-row_weights, kind='stable')[:num_components]) for row_weights in weights]
+        return {'label': int(label),
+                'spearman': float(scipy.stats.spearmanr(weights[0], weights[1]).correlation),
+                'top_overlap': len(top[0] & top[1]) / num_components}
+
+    def _fit_explanation(self, factors, data, labels, top, top_labels, is_classification, num_reg_targets,
+                         num_features, distance_metric, model_regressor, return_stderr=False):
+        if distance_metric == 'cosine' and np.all(data[0] == 1):
+            # cosine distance to the all-ones reference row follows from the popcount
+            distances = 1 - np.sqrt(data.popcount() / data.shape[1])
+        else:
+            distances = np.concatenate([sklearn.metrics.pairwise_distances(
+                block,
+                data[0].reshape(1, -1),
+                metric=distance_metric
+            ).ravel() for _, block in data.iter_blocks()])
 
         ret_exp = AudioExplanation(self.factorization, factors, data, labels)
 
@@ -183,28 +626,62 @@ class LimeAudioExplainer(object):
                 top = np.argsort(labels[0])[-top_labels:]
                 ret_exp.top_labels = list(top)
                 ret_exp.top_labels.reverse()
+            explanations, stderr = self.base.explain_instances_with_data(
+                data, labels, distances, top, num_features,
+                model_regressor=model_regressor,
+                feature_selection=self.feature_selection,
+                return_stderr=True)
             for label in top:
                 (ret_exp.intercept[label],
                  ret_exp.local_exp[label],
-                 ret_exp.score, ret_exp.local_pred) = self.base.explain_instance_with_data(
-                    data, labels, distances, label, num_features,
-                    model_regressor=model_regressor,
-                    feature_selection=self.feature_selection)
+                 ret_exp.score, ret_exp.local_pred) = explanations[label]
         else:
+            explanations, stderr = self.base.explain_instances_with_data(
+                data, labels, distances, range(num_reg_targets), num_features,
+                model_regressor=model_regressor,
+                feature_selection=self.feature_selection,
+                return_stderr=True)
             for target in range(num_reg_targets):
                 (ret_exp.intercept[target],
                  ret_exp.local_exp[target],
                  ret_exp.score,
-                 ret_exp.distance[target]) = self.base.explain_instance_with_data(
-                    data, labels, distances, target, num_features,
-                    model_regressor=model_regressor,
-                    feature_selection=self.feature_selection)
+                 ret_exp.distance[target]) = explanations[target]
+        if return_stderr:
+            return ret_exp, stderr
         return ret_exp
 
+    @staticmethod
+    def _has_converged(previous, current, top_k, tol):
+        """Checks whether the top_k components and the confidence intervals of
+        their coefficients are stable between two consecutive rounds."""
+        (previous_exp, previous_stderr), (current_exp, current_stderr) = previous, current
+        t_crit = scipy.stats.t.ppf(0.975, len(current_exp.neighborhood_data) - 1)
+        previous_t_crit = scipy.stats.t.ppf(0.975, len(previous_exp.neighborhood_data) - 1)
+        for label, exp in current_exp.local_exp.items():
+            top = [x[0] for x in exp[:top_k]]
+            if top != [x[0] for x in previous_exp.local_exp[label][:top_k]]:
+                return False
+            if current_stderr[label] is None or previous_stderr[label] is None:
+                continue
+            previous_coef = {x[0]: x[1] for x in previous_exp.local_exp[label]}
+            for feature, coef, _ in exp[:top_k]:
+                half_width = t_crit * current_stderr[label][feature]
+                previous_half_width = previous_t_crit * previous_stderr[label][feature]
+                # largest movement of either interval bound
+                shift = abs(coef - previous_coef[feature]) + abs(half_width - previous_half_width)
+                if shift > tol * 2 * half_width:
+                    return False
+        return True
+
     def data_labels(self,
                     predict_fn,
                     num_samples,
-                    batch_size=10):
+                    batch_size=10,
+                    memory_budget=None,
+                    prediction_cache=None,
+                    sample_offset=0,
+                    deadline=None,
+                    pipeline=None):
         """Generates audio and predictions in the neighborhood of this audio.
 
         Args:
@@ -212,25 +689,132 @@ class LimeAudioExplainer(object):
                 matrix of predictions
             num_samples: size of the neighborhood to learn the linear model
             batch_size: classifier_fn will be called on batches of this size.
+            memory_budget: if not None, peak memory (in bytes) of the neighborhood.
+                Masks are packed per batch into preallocated PackedMasks,
+                predictions are written into a preallocated float32 matrix and
+                batch_size is lowered until masks, predictions and one composed
+                batch fit into the budget.
+            prediction_cache: if not None, a PredictionCache; only masks not
+                seen before are composed and passed to predict_fn.
+            sample_offset: index of the first generated sample within the
+                neighborhood, used to continue a neighborhood in rounds. Only
+                the sample at index 0 is the unperturbed input.
+            deadline: if not None, a time.monotonic() value after which no
+                further batches are predicted; the samples finished by then are
+                returned.
+            pipeline: if not None, a CompositionPipeline composing upcoming
+                batches on worker threads while predict_fn runs.
 
         Returns:
             A tuple (data, labels), where:
-                data: dense num_samples * num_factors
+                data: PackedMasks of shape num_samples * num_factors
                 labels: prediction probabilities matrix
         """
         n_features = self.factorization.get_number_components()
-        if num_samples == 'exhaustive':
-            import itertools
+        exhaustive = num_samples == 'exhaustive'
+        if exhaustive:
             num_samples = 2**n_features
-            data = np.array(list(map(list, itertools.product([1, 0], repeat=n_features))))
-        else:
-            data = self.random_state.randint(0, 2, num_samples * n_features) \
-                .reshape((num_samples, n_features))
-            data[0, :] = 1  # first row all is set to 1
 
+        def draw_masks(start, stop):
+            start, stop = start + sample_offset, stop + sample_offset
+            if exhaustive:
+                # same row order as itertools.product([1, 0], repeat=n_features)
+                index = 2**n_features - 1 - np.arange(start, stop)
+                return (index[:, None] >> np.arange(n_features - 1, -1, -1)) & 1
+            # drawing in chunks yields the same sequence as a single draw
+            masks = self.random_state.randint(0, 2, (stop - start) * n_features) \
+                .reshape((stop - start, n_features))
+            if start == 0:
+                masks[0, :] = 1  # first row all is set to 1
+            return masks
+
+        if prediction_cache is not None:
+            prediction_cache.bind(self.factorization, predict_fn)
+
+        if memory_budget is not None:
+            return self._stream_data_labels(predict_fn, num_samples, n_features, draw_masks,
+                                            batch_size, memory_budget, prediction_cache, deadline,
+                                            pipeline)
+
+        data = PackedMasks.empty(num_samples, n_features)
         labels = []
+        with closing(self._predict_batches(predict_fn, self._mask_batches(data, draw_masks, 0, batch_size),
+                                           prediction_cache, pipeline)) as predictions:
+            for preds in predictions:
+                labels.extend(preds)
+                if deadline is not None and len(labels) < num_samples and time.monotonic() >= deadline:
+                    data = data[:len(labels)]
+                    break
+        return data, np.array(labels)
+
+    def _stream_data_labels(self, predict_fn, num_samples, n_features, draw_masks,
+                            batch_size, memory_budget, prediction_cache=None, deadline=None,
+                            pipeline=None):
+        data = PackedMasks.empty(num_samples, n_features)
+        first = draw_masks(0, 1)
+        data.set_rows(0, first)
+        audio = self._compose_batch(first)
+        if prediction_cache is not None:
+            preds = prediction_cache.predict(first, lambda _: predict_fn(audio))
+        else:
+            preds = np.asarray(predict_fn(audio))
+        labels = np.empty((num_samples,) + preds.shape[1:], dtype=np.float32)
+        labels[:1] = preds
+
+        # a pipeline keeps queue_depth + 1 composed batches alive
+        n_buffers = 1 if pipeline is None else pipeline.queue_depth + 1
+        row_bytes = audio.nbytes * n_buffers + labels[:1].nbytes
+        available_rows = (memory_budget - data.nbytes - labels.nbytes) // row_bytes
+        if available_rows < 1:
+            raise ValueError('memory_budget of {} bytes cannot hold {} masks, their predictions '
+                             'and a single composed input ({} bytes required).'.format(
+                                 memory_budget, num_samples, data.nbytes + labels.nbytes + row_bytes))
+        batch_size = int(min(batch_size, available_rows))
+
+        n_predicted = 1
+        with closing(self._predict_batches(predict_fn, self._mask_batches(data, draw_masks, 1, batch_size),
+                                           prediction_cache, pipeline)) as predictions:
+            for preds in predictions:
+                labels[n_predicted:n_predicted + len(preds)] = preds
+                n_predicted += len(preds)
+                if deadline is not None and n_predicted < num_samples and time.monotonic() >= deadline:
+                    return data[:n_predicted], labels[:n_predicted]
+        return data, labels
+
+    @staticmethod
+    def _mask_batches(data, draw_masks, start, batch_size):
+        """Draws the masks from row start on batch by batch, packs them into
+        data and yields each dense batch."""
+        for batch_start in range(start, len(data), batch_size):
+            masks = draw_masks(batch_start, min(batch_start + batch_size, len(data)))
+            data.set_rows(batch_start, masks)
+            yield masks
+
+    def _predict_batches(self, predict_fn, mask_batches, prediction_cache=None, pipeline=None):
+        """Yields the predictions for every batch of masks, in order."""
+        if pipeline is None:
+            for masks in mask_batches:
+                yield self._predict_batch(predict_fn, masks, prediction_cache)
+            return
+
+        for masks, composed in pipeline.compose(self._compose_batch, mask_batches):
+            # copied, as composed is a buffer the pipeline reuses
+            if prediction_cache is None:
+                yield np.array(predict_fn(composed))
+            else:
+                yield prediction_cache.predict_rows(masks, lambda rows: predict_fn(composed[rows]))
+
+    def _predict_batch(self, predict_fn, masks, prediction_cache):
+        if prediction_cache is None:
+            return predict_fn(self._compose_batch(masks))
+        return prediction_cache.predict(masks, lambda unseen: predict_fn(self._compose_batch(unseen)))
+
+    def _compose_batch(self, masks, out=None):
+        if hasattr(self.factorization, 'compose_batch'):
+            return self.factorization.compose_batch(masks, out=out)
+
         audios = []
-        for row in data:
+        for row in masks:
             non_zeros = np.where(row != 0)[0]
             if len(non_zeros) == 0:
                 like = self.factorization.compose_model_input()
@@ -238,11 +822,4 @@ class LimeAudioExplainer(object):
             else:
                 temp = self.factorization.compose_model_input(non_zeros)
             audios.append(temp)
-            if len(audios) == batch_size:
-                preds = predict_fn(np.array(audios))
-                labels.extend(preds)
-                audios = []
-        if len(audios) > 0:
-            preds = predict_fn(np.array(audios))
-            labels.extend(preds)
-        return data, np.array(labels)
+        return np.array(audios)
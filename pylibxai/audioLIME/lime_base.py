@@ -4,6 +4,9 @@ Contains abstract functionality for learning locally linear sparse model.
 from __future__ import print_function
 import numpy as np
 import scipy as sp
+import scipy.linalg
+import scipy.sparse
+import scipy.stats
 from sklearn.linear_model import Ridge, lars_path
 from sklearn.utils import check_random_state
 from regressors import stats
@@ -51,7 +54,62 @@ class LimeBase(object):
         return alphas, coefs
 
     def forward_selection(self, data, labels, weights, num_features):
-        """Iteratively adds features to the model"""
+        """Iteratively adds features to the model.
+
+        Selects the same features as forward_selection_refit, but builds the
+        weighted Gram matrix once and scores every candidate from an
+        incrementally extended Cholesky factor instead of refitting a model.
+        """
+        if sp.sparse.issparse(data):
+            return self.forward_selection_refit(data, labels, weights, num_features)
+        data = np.asarray(data, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.float64).reshape(-1, 1)
+        gram, cross, _, _ = self._weighted_gram(data, labels, np.asarray(weights, dtype=np.float64))
+        return self._forward_selection_gram(gram, cross[:, 0], num_features)
+
+    @staticmethod
+    def _forward_selection_gram(gram, cross, num_features):
+        """Forward selection on a weighted, centered Gram matrix.
+
+        Adding feature f to the selected set S lowers the weighted residual sum
+        of squares of the least squares fit by r_f^2 / d_f, where r_f and d_f
+        are the cross product with the labels and the variance of f left after
+        projecting out S. Both follow from L^-1 G[S, :], with L the Cholesky
+        factor of G[S, S], which grows by one row per step. Maximising the
+        decrease maximises the R^2 scored by forward_selection_refit.
+        """
+        n_features = gram.shape[0]
+        n_steps = min(num_features, n_features)
+        tol = 1e-10 * max(np.max(np.diag(gram)), 1e-300)
+
+        projections = np.zeros((n_steps, n_features))  # rows of L^-1 G[S, :]
+        residual_cross = np.array(cross, dtype=np.float64)
+        residual_var = np.diag(gram).astype(np.float64)
+        available = np.ones(n_features, dtype=bool)
+        used_features = []
+        for step in range(n_steps):
+            gain = np.zeros(n_features)
+            independent = residual_var > tol
+            gain[independent] = residual_cross[independent] ** 2 / residual_var[independent]
+            gain[~available] = -np.inf
+            # first of the best features, as in forward_selection_refit; gains of
+            # duplicated columns may differ by rounding only
+            max_gain = np.max(gain)
+            best = int(np.flatnonzero(gain >= max_gain - 1e-12 * abs(max_gain))[0])
+
+            if independent[best]:
+                pivot = np.sqrt(residual_var[best])
+                row = (gram[best] - projections[:step].T @ projections[:step, best]) / pivot
+                projections[step] = row
+                residual_cross -= row * (residual_cross[best] / pivot)
+                residual_var -= row ** 2
+            available[best] = False
+            used_features.append(best)
+        return np.array(used_features)
+
+    def forward_selection_refit(self, data, labels, weights, num_features):
+        """Iteratively adds features to the model, refitting a Ridge model
+        for every candidate. Reference for forward_selection."""
         clf = Ridge(alpha=0, fit_intercept=True, random_state=self.random_state)
         used_features = []
         for _ in range(min(num_features, data.shape[1])):
@@ -202,18 +260,173 @@ class LimeBase(object):
 
         local_pred = easy_model.predict(neighborhood_data[0, used_features].reshape(1, -1))
 
+        return self._sorted_explanation(used_features, easy_model.coef_, pvals,
+                                        easy_model.intercept_, prediction_score, local_pred,
+                                        neighborhood_labels[0, label])
+
+    def _sorted_explanation(self, used_features, coef, pvals, intercept, prediction_score,
+                            local_pred, right):
         if self.absolute_feature_sort:
-            sorted_local_exp = sorted(zip(used_features, easy_model.coef_, pvals),
+            sorted_local_exp = sorted(zip(used_features, coef, pvals),
                    key=lambda x: np.abs(x[1]), reverse=True) # TODO: check if this is sorted by weight
         else:
-            sorted_local_exp = sorted(zip(used_features, easy_model.coef_, pvals),
+            sorted_local_exp = sorted(zip(used_features, coef, pvals),
                                   key=lambda x: x[1], reverse=True)
 
         if self.verbose:
-            print('Intercept:', easy_model.intercept_)
+            print('Intercept:', intercept)
             print('Prediction_local:', local_pred,)
-            print('Right:', neighborhood_labels[0, label])
+            print('Right:', right)
             print('Score:', prediction_score)
-        return (easy_model.intercept_,
+        return (intercept,
                 sorted_local_exp,
                 prediction_score, local_pred)
+
+    def explain_instances_with_data(self,
+                                    neighborhood_data,
+                                    neighborhood_labels,
+                                    distances,
+                                    labels,
+                                    num_features,
+                                    feature_selection='auto',
+                                    model_regressor=None,
+                                    return_stderr=False):
+        """Explains several labels at once, see explain_instance_with_data.
+
+        With the default Ridge regressor, kernel weights and the weighted Gram
+        matrix of the neighborhood are computed once. All labels that end up
+        with the same selected features are fitted by a single multi-output
+        closed-form ridge solve. R^2, local predictions and p-values (as in
+        regressors.stats.coef_pval) are computed in vectorized form. A custom
+        model_regressor or sparse data fall back to one fit per label.
+
+        Returns:
+            dict mapping every label to the (intercept, exp, score, local_pred)
+            tuple returned by explain_instance_with_data. If return_stderr is
+            True, a tuple (explanations, stderr) where stderr maps every label
+            to a dict of coefficient standard errors by feature, or to None
+            when the fit fell back to model_regressor.
+        """
+        labels = list(labels)
+        if model_regressor is not None or sp.sparse.issparse(neighborhood_data):
+            if hasattr(neighborhood_data, 'iter_blocks'):
+                neighborhood_data = np.asarray(neighborhood_data)
+            explanations = {label: self.explain_instance_with_data(neighborhood_data, neighborhood_labels,
+                                                                   distances, label, num_features,
+                                                                   feature_selection=feature_selection,
+                                                                   model_regressor=model_regressor)
+                            for label in labels}
+            if return_stderr:
+                return explanations, {label: None for label in labels}
+            return explanations
+
+        weights = np.asarray(self.kernel_fn(distances), dtype=np.float64)
+        # bit-packed masks stay packed and are unpacked in blocks where needed
+        data = neighborhood_data
+        if not hasattr(data, 'iter_blocks'):
+            data = np.asarray(data, dtype=np.float64)
+        labels_matrix = np.asarray(neighborhood_labels, dtype=np.float64)[:, labels]
+        gram, cross, data_mean, labels_mean = self._weighted_gram(data, labels_matrix, weights)
+
+        used_features = self._select_features(data, labels_matrix, weights, num_features,
+                                              feature_selection, gram, cross)
+        groups = {}
+        for i, features in enumerate(used_features):
+            groups.setdefault(tuple(sorted(features)), []).append(i)
+
+        explanations = {}
+        stderr = {}
+        for features, columns in groups.items():
+            features = np.array(features, dtype=int)
+            coef, pvals, intercept, score, local_pred, se = self._ridge_fit(
+                data, labels_matrix[:, columns], weights, features,
+                gram, cross[:, columns], data_mean, labels_mean[columns])
+            for j, column in enumerate(columns):
+                label = labels[column]
+                # coefficients and p-values in the order returned by feature selection;
+                # pvals[0] belongs to the intercept, as in regressors.stats.coef_pval
+                order = np.searchsorted(features, used_features[column])
+                label_pvals = np.concatenate((pvals[:1, j], pvals[1:, j][order]))
+                explanations[label] = self._sorted_explanation(
+                    used_features[column], coef[order, j], label_pvals, intercept[j], score[j],
+                    local_pred[j:j + 1], neighborhood_labels[0, label])
+                stderr[label] = dict(zip(used_features[column], np.abs(se[1:, j][order])))
+        if return_stderr:
+            return explanations, stderr
+        return explanations
+
+    @staticmethod
+    def _weighted_gram(data, labels_matrix, weights):
+        """Weighted, centered Gram matrix of the data and its cross product with the labels."""
+        weights_sum = weights.sum()
+        data_mean = sum(weights[start:start + len(block)] @ block
+                        for start, block in _row_blocks(data)) / weights_sum
+        labels_mean = weights @ labels_matrix / weights_sum
+        gram = np.zeros((data.shape[1], data.shape[1]))
+        cross = np.zeros((data.shape[1], labels_matrix.shape[1]))
+        for start, block in _row_blocks(data):
+            stop = start + len(block)
+            centered = block - data_mean
+            weighted_centered = centered * weights[start:stop, np.newaxis]
+            gram += weighted_centered.T @ centered
+            cross += weighted_centered.T @ (labels_matrix[start:stop] - labels_mean)
+        return gram, cross, data_mean, labels_mean
+
+    def _select_features(self, data, labels_matrix, weights, num_features, method, gram, cross):
+        """Feature selection for every label column, vectorized where the method allows it."""
+        if method == 'auto':
+            method = 'forward_selection' if num_features <= 6 else 'highest_weights'
+        if method == 'none':
+            return [np.arange(data.shape[1])] * labels_matrix.shape[1]
+        if method == 'highest_weights':
+            # least squares on all features, same as Ridge(alpha=0) in feature_selection
+            try:
+                coef = sp.linalg.solve(gram, cross, assume_a='pos')
+            except (np.linalg.LinAlgError, sp.linalg.LinAlgError):
+                coef = np.linalg.lstsq(gram, cross, rcond=None)[0]
+            weighted_data = coef.T * data[0]
+            return [np.argsort(-np.abs(w), kind='stable')[:num_features] for w in weighted_data]
+        if method == 'forward_selection':
+            return [self._forward_selection_gram(gram, cross[:, i], num_features)
+                    for i in range(labels_matrix.shape[1])]
+        data = np.asarray(data, dtype=np.float64)
+        return [self.feature_selection(data, labels_matrix[:, i], weights, num_features, method)
+                for i in range(labels_matrix.shape[1])]
+
+    @staticmethod
+    def _ridge_fit(data, labels_matrix, weights, features, gram, cross, data_mean, labels_mean,
+                   alpha=1.0):
+        """Closed-form weighted ridge regression of several label columns on the same features.
+
+        Returns:
+            (coef, pvals, intercept, score, local_pred, se) with the label
+            column as last axis; pvals and se hold the intercept first.
+        """
+        n_samples = data.shape[0]
+        sub_gram = gram[np.ix_(features, features)] + alpha * np.eye(len(features))
+        coef = sp.linalg.solve(sub_gram, cross[features], assume_a='pos')
+        intercept = labels_mean - data_mean[features] @ coef
+
+        x = data[:, features]
+        residuals = labels_matrix - (x @ coef + intercept)
+        centered = labels_matrix - labels_mean
+        score = 1 - (weights @ residuals ** 2) / (weights @ centered ** 2)
+        local_pred = x[0] @ coef + intercept
+
+        # unweighted standard errors of [intercept, coef], as in regressors.stats.coef_se
+        x1 = np.hstack((np.ones((n_samples, 1)), x))
+        se_scale = np.diagonal(sp.linalg.sqrtm(np.linalg.inv(x1.T @ x1)))
+        mse = np.mean(residuals ** 2, axis=0)
+        se = se_scale[:, np.newaxis] * np.sqrt(mse)
+        t = np.vstack((intercept, coef)) / se
+        pvals = 2 * (1 - sp.stats.t.cdf(abs(t), n_samples - 1))
+        return coef, pvals, intercept, score, local_pred, se
+
+
+def _row_blocks(data):
+    """Yields (start, float64 block) pairs covering the rows of data; packed
+    masks are unpacked block by block, arrays are returned whole."""
+    if hasattr(data, 'iter_blocks'):
+        yield from data.iter_blocks(dtype=np.float64)
+    else:
+        yield 0, data
@@ -0,0 +1,160 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def spleeter_separator(model_name):
+    from spleeter.separator import Separator
+    return Separator(model_name, multiprocess=False)
+
+
+def _serve(separator_factory, model_name, jobs, results, max_batch_tracks, batch_timeout, gap):
+    separator = separator_factory(model_name)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        batch = [job]
+        while len(batch) < max_batch_tracks:
+            try:
+                job = jobs.get(timeout=batch_timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                jobs.put(None)  # handled after the current batch
+                break
+            batch.append(job)
+
+        try:
+            for job_id, prediction in zip([job_id for job_id, _ in batch],
+                                          _separate_batch(separator, [waveform for _, waveform in batch], gap)):
+                results.put((job_id, prediction, None))
+        except Exception as e:
+            for job_id, _ in batch:
+                results.put((job_id, None, '{}: {}'.format(type(e).__name__, e)))
+    results.put(None)
+
+
+def _separate_batch(separator, waveforms, gap):
+    """
+    Separates several tracks with a single separator call by concatenating them in time,
+    with gap samples of silence in between, and splitting the stems afterwards.
+    """
+    silence = np.zeros((gap,) + waveforms[0].shape[1:], dtype=waveforms[0].dtype)
+    pieces = list(itertools.chain.from_iterable((waveform, silence) for waveform in waveforms))[:-1]
+    prediction = separator.separate(np.concatenate(pieces))
+
+    starts = np.cumsum([0] + [len(waveform) + gap for waveform in waveforms])
+    return [{key: stems[start:start + len(waveform)] for key, stems in prediction.items()}
+            for start, waveform in zip(starts, waveforms)]
+
+
+class SeparatorWorker(object):
+    """
+    Long-lived process holding a loaded source separator.
+
+    Tracks submitted from any thread are sent to the worker over a local queue. The worker
+    collects up to max_batch_tracks queued tracks (waiting at most batch_timeout seconds for
+    more) and separates them with one call of the separator. Instances can be passed as
+    separator to SpleeterFactorization, so the model is built and loaded once per catalog
+    instead of once per track.
+    """
+    def __init__(self, model_name, max_batch_tracks=4, batch_timeout=0.05, gap=8192,
+                 separator_factory=spleeter_separator, start_method='spawn'):
+        """
+        :param model_name: name of the separation model, e.g. 'spleeter:5stems'
+        :param max_batch_tracks: maximum number of tracks separated in a single call
+        :param batch_timeout: seconds to wait for further tracks before separating a batch
+        :param gap: samples of silence between batched tracks, keeps the STFT frames of
+                neighbouring tracks apart
+        :param separator_factory: picklable function model_name -> object with a
+                separate(waveform) method, called once inside the worker
+        :param start_method: multiprocessing start method, spawn by default as TensorFlow
+                is not fork safe
+        """
+        if max_batch_tracks < 1:
+            raise ValueError('max_batch_tracks must be positive.')
+        self.model_name = model_name
+        self.max_batch_tracks = max_batch_tracks
+        context = multiprocessing.get_context(start_method)
+        self._jobs = context.Queue()
+        self._results = context.Queue()
+        self._process = context.Process(target=_serve, daemon=True,
+                                        args=(separator_factory, model_name, self._jobs, self._results,
+                                              max_batch_tracks, batch_timeout, gap))
+        self._futures = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._closed = False
+        self._exited = False
+        self._process.start()
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            try:
+                result = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._process.is_alive():
+                    continue
+                result = None
+            if result is None:
+                break
+            job_id, prediction, error = result
+            with self._lock:
+                future = self._futures.pop(job_id)
+            if error is None:
+                future.set_result(prediction)
+            else:
+                future.set_exception(RuntimeError('Separation failed in the worker: ' + error))
+
+        # jobs submitted from now on would never be served
+        with self._lock:
+            self._exited = True
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.set_exception(RuntimeError('Separator worker exited.'))
+
+    def submit(self, waveform):
+        """
+        :param waveform: array of shape (n_samples, n_channels) at the separator's sampling rate
+        :return: Future of a dict mapping stem names to arrays shaped like waveform
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Separator worker is closed.')
+            if self._exited:
+                raise RuntimeError('Separator worker exited.')
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+        self._jobs.put((job_id, np.ascontiguousarray(waveform, dtype=np.float32)))
+        return future
+
+    def separate(self, waveform):
+        """Same interface as spleeter's Separator.separate."""
+        return self.submit(waveform).result()
+
+    def separate_many(self, waveforms):
+        """Submits all waveforms at once, so they are batched, and returns their predictions in order."""
+        return [future.result() for future in [self.submit(waveform) for waveform in waveforms]]
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._jobs.put(None)
+        self._dispatcher.join()
+        self._process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+class StemCache(object):
+    """
+    On-disk cache of separated stems, addressed by the content of the separated audio.
+
+    Every entry is a float32 ``.npy`` array of shape (n_stems, n_samples), loaded memory-mapped,
+    and a ``.json`` file with the stem names. Hits refresh the modification time of the entry,
+    which orders entries for LRU eviction once the cache grows beyond max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=None):
+        """
+        :param cache_dir: directory holding the cache entries, created if missing
+        :param max_bytes: size cap of all entries in bytes, None for an unbounded cache
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(waveform, model_name, target_sr):
+        """
+        :param waveform: separated mix, hashed as float32 samples
+        :param model_name: name of the separation model
+        :param target_sr: sampling rate of the mix and the stems
+        :return: hex digest identifying the entry
+        """
+        digest = hashlib.sha256(np.ascontiguousarray(waveform, dtype=np.float32).tobytes())
+        digest.update('{}:{}'.format(model_name, target_sr).encode())
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.npy', base + '.json'
+
+    def get(self, key):
+        """
+        :return: tuple (names, stems) with stems memory-mapped read-only, or None on a miss
+        """
+        stems_path, names_path = self._paths(key)
+        try:
+            with open(names_path) as f:
+                names = json.load(f)
+            stems = np.load(stems_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        os.utime(stems_path)
+        return names, stems
+
+    def put(self, key, names, stems):
+        """
+        Stores stems under key and evicts least recently used entries above max_bytes.
+
+        :param names: list of stem names
+        :param stems: sequence of equally long stems
+        """
+        stems_path, names_path = self._paths(key)
+        stems = np.asarray(stems, dtype=np.float32)
+        # written to temporary files first, so readers never see partial entries
+        self._write_atomic(stems_path, lambda f: np.save(f, stems))
+        self._write_atomic(names_path, lambda f: f.write(json.dumps(list(names)).encode()))
+        self.evict()
+
+    def _write_atomic(self, path, write_fn):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_fn(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def entries(self):
+        """
+        :return: list of (key, size in bytes, last use) tuples, least recently used first
+        """
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.npy'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, filename))
+            entries.append((filename[:-len('.npy')], stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,1067 @@
+import os
+import threading
+import time
+
+import pytest
+import librosa
+import numpy as np
+import soundfile
+
+from pylibxai.AudioLoader import AudioLoader, RawAudioLoader
+from pylibxai.audioLIME import factorization as factorization_module
+from pylibxai.audioLIME.factorization import (BandFactorization, DataBasedFactorization, NMFFactorization,
+                                              SpleeterFactorization, band_filterbank)
+from pylibxai.audioLIME.factorization_slime import SoundLIMEFactorization
+from pylibxai.audioLIME.factorization_spectral import SpectralFactorization
+from pylibxai.Interfaces import StftFrontEnd
+from pylibxai.audioLIME.lime_audio import CompositionPipeline, LimeAudioExplainer, PackedMasks, PredictionCache
+from pylibxai.audioLIME.lime_base import LimeBase
+from pylibxai.audioLIME.separator_worker import SeparatorWorker
+from pylibxai.audioLIME.stem_cache import StemCache
+
+
+class ArrayAudioLoader(AudioLoader):
+    """Data provider serving an in-memory waveform"""
+    def __init__(self, waveform):
+        self._waveform = waveform
+        super().__init__(None)
+
+    def initialize_mix(self):
+        return self._waveform
+
+
+def failing_separator(model_name):
+    """Separator factory failing inside the worker, as a separator that cannot be loaded"""
+    raise RuntimeError('cannot load {}'.format(model_name))
+
+
+class RandomStemsFactorization(DataBasedFactorization):
+    """Factorization splitting the mix into random stems that sum up to it"""
+    def __init__(self, data_provider, n_temporal_segments, n_stems=3, composition_fn=None, seed=0):
+        self.n_stems = n_stems
+        self.seed = seed
+        super().__init__(data_provider, n_temporal_segments, composition_fn)
+
+    def initialize_components(self):
+        mix = self.data_provider.get_mix()
+        rng = np.random.RandomState(self.seed)
+        shares = rng.dirichlet(np.ones(self.n_stems), size=len(mix)).T
+        self.original_components = [(mix * share).astype(np.float32) for share in shares]
+        self._components_names = ['stem{}'.format(i) for i in range(self.n_stems)]
+
+
+class ScalingSeparator:
+    """Separator splitting a waveform into fixed shares, reporting the length it was called on"""
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def separate(self, waveform):
+        if not np.all(np.isfinite(waveform)):
+            raise ValueError('waveform is not finite')
+        return {'vocals': waveform * 0.25, 'accompaniment': waveform * 0.75,
+                'call_length': np.full_like(waveform, len(waveform))}
+
+
+@pytest.fixture
+def waveform():
+    return np.random.RandomState(42).uniform(-1.0, 1.0, 1600).astype(np.float32)
+
+
+@pytest.fixture
+def factorization(waveform):
+    return RandomStemsFactorization(ArrayAudioLoader(waveform), n_temporal_segments=4)
+
+
+class TestComposeBatch:
+    """Test batched composition of perturbed inputs"""
+
+    def test_matches_compose_model_input(self, factorization):
+        """Test each composed row equals the sum of the selected components"""
+        masks = np.random.RandomState(0).randint(0, 2, (32, factorization.get_number_components()))
+        masks[masks.sum(axis=1) == 0, 0] = 1
+
+        composed = factorization.compose_batch(masks)
+
+        assert composed.shape == (32, 1600)
+        assert composed.dtype == np.float32
+        for mask, row in zip(masks, composed):
+            expected = factorization.compose_model_input(np.flatnonzero(mask))
+            np.testing.assert_allclose(row, expected, rtol=1e-5, atol=1e-6)
+
+    def test_empty_mask_is_filled_with_minimum(self, factorization):
+        """Test a mask without components gives a constant signal at the mix minimum"""
+        masks = np.zeros((2, factorization.get_number_components()), dtype=int)
+        masks[1, :] = 1
+
+        composed = factorization.compose_batch(masks)
+
+        full = factorization.compose_model_input()
+        np.testing.assert_allclose(composed[0], np.full_like(full, full.min()), rtol=1e-5)
+        np.testing.assert_allclose(composed[1], full, rtol=1e-5, atol=1e-6)
+
+    def test_applies_composition_fn(self, waveform):
+        """Test a custom composition function is applied to every composed row"""
+        factorization = RandomStemsFactorization(ArrayAudioLoader(waveform), n_temporal_segments=4,
+                                                 composition_fn=lambda y: y[::2] * 2.0)
+        masks = np.ones((3, factorization.get_number_components()), dtype=int)
+
+        composed = factorization.compose_batch(masks)
+
+        assert composed.shape == (3, 800)
+        np.testing.assert_allclose(composed[0], factorization.compose_model_input(), rtol=1e-5, atol=1e-6)
+
+    def test_component_matrix_follows_analysis_window(self, factorization):
+        """Test the component matrix is rebuilt after the analysis window moves"""
+        assert factorization.get_component_matrix().shape == (12, 1600)
+
+        factorization.set_analysis_window(0, 800)
+
+        assert factorization.get_component_matrix().shape == (factorization.get_number_components(), 800)
+
+
+class TestDataLabels:
+    """Test neighborhood generation of LimeAudioExplainer"""
+
+    def test_batched_labels_match_per_row_composition(self, factorization):
+        """Test predictions on batched compositions match per-row compositions"""
+        explainer = LimeAudioExplainer(random_state=0)
+        explainer.factorization = factorization
+
+        def predict_fn(x):
+            return np.stack([x.sum(axis=1), np.abs(x).max(axis=1)], axis=1)
+
+        data, labels = explainer.data_labels(predict_fn, num_samples=50, batch_size=16)
+
+        assert labels.shape == (50, 2)
+        assert np.all(data[0] == 1)
+        for row, label in zip(data, labels):
+            non_zeros = np.flatnonzero(row)
+            if len(non_zeros) == 0:
+                continue
+            audio = factorization.compose_model_input(non_zeros)
+            np.testing.assert_allclose(label, [audio.sum(), np.abs(audio).max()], rtol=1e-4, atol=1e-4)
+
+    def test_exhaustive_masks_follow_product_order(self, waveform):
+        """Test exhaustive sampling enumerates all masks, starting with the full mix"""
+        import itertools
+        factorization = RandomStemsFactorization(ArrayAudioLoader(waveform), n_temporal_segments=2, n_stems=2)
+        explainer = LimeAudioExplainer(random_state=0)
+        explainer.factorization = factorization
+
+        data, labels = explainer.data_labels(lambda x: x[:, :2], 'exhaustive', batch_size=5)
+
+        np.testing.assert_array_equal(data, list(itertools.product([1, 0], repeat=4)))
+        assert labels.shape == (16, 2)
+
+
+class TestSegmentComponents:
+    """Test the sparse segment-local component records"""
+
+    def test_components_are_views_into_stems(self, factorization):
+        """Test every component references its segment of the stem without a copy"""
+        components = factorization.retrieve_components()
+
+        assert len(components) == 12
+        for index, component in enumerate(components):
+            segment, stem = divmod(index, 3)
+            assert component.offset == segment * 400
+            assert component.shape == (1600,)
+            assert np.shares_memory(component.data, factorization.original_components[stem])
+
+    def test_sum_matches_dense_components(self, factorization):
+        """Test summing records equals summing the zero-padded components"""
+        selection = [0, 4, 5, 11]
+
+        dense = sum(np.asarray(c) for c in factorization.retrieve_components(selection))
+
+        np.testing.assert_allclose(factorization.sum_components(selection), dense, rtol=1e-6)
+        np.testing.assert_allclose(factorization.compose_model_input(), factorization.data_provider.get_mix(),
+                                   rtol=1e-5, atol=1e-6)
+
+    def test_segment_products_match_component_matrix(self, waveform):
+        """Test composition equals the dense matrix product for more stems"""
+        factorization = RandomStemsFactorization(ArrayAudioLoader(waveform), n_temporal_segments=2, n_stems=5)
+        masks = np.random.RandomState(2).randint(0, 2, (9, 10))
+
+        np.testing.assert_allclose(factorization.compose_waveforms(masks),
+                                   masks.astype(np.float32) @ factorization.get_component_matrix(),
+                                   rtol=1e-5, atol=1e-6)
+
+    def test_names_survive_new_analysis_window(self, factorization):
+        """Test component names are derived from the stem names for every window"""
+        factorization.set_analysis_window(400, 800)
+
+        assert factorization.get_ordered_component_names()[:4] == ['stem00', 'stem10', 'stem20', 'stem01']
+        assert len(factorization.sum_components()) == 800
+
+
+class TestSegmentLookup:
+    """Test composition from the precomputed segment-pattern lookup table"""
+
+    def test_lookup_shape(self, factorization):
+        """Test the table holds every stem combination of every segment"""
+        assert factorization.uses_segment_lookup()
+        assert factorization.get_segment_lookup().shape == (4, 8, 400)
+
+    def test_lookup_matches_component_matrix(self, factorization):
+        """Test lookup composition equals the mask @ components product"""
+        masks = np.random.RandomState(1).randint(0, 2, (64, factorization.get_number_components()))
+
+        composed = factorization.compose_waveforms(masks)
+
+        expected = masks.astype(np.float32) @ factorization.get_component_matrix()
+        np.testing.assert_allclose(composed, expected, rtol=1e-5, atol=1e-6)
+
+    def test_lookup_writes_into_out(self, factorization):
+        """Test the gathered segments are written into the given array"""
+        masks = np.random.RandomState(2).randint(0, 2, (5, factorization.get_number_components()))
+        out = np.empty((5, 1600), dtype=np.float32)
+
+        assert factorization.compose_waveforms(masks, out=out) is out
+        np.testing.assert_allclose(out, masks.astype(np.float32) @ factorization.get_component_matrix(),
+                                   rtol=1e-5, atol=1e-6)
+
+    def test_table_over_budget_uses_segment_matmul(self, factorization, monkeypatch):
+        """Test composition falls back to the segment matmul when the table exceeds the budget"""
+        monkeypatch.setattr(factorization, 'segment_lookup_budget', 4 * 8 * 400 * 4 - 1)
+        masks = np.random.RandomState(3).randint(0, 2, (9, factorization.get_number_components()))
+
+        assert not factorization.uses_segment_lookup()
+        np.testing.assert_allclose(factorization.compose_waveforms(masks),
+                                   masks.astype(np.float32) @ factorization.get_component_matrix(),
+                                   rtol=1e-5, atol=1e-6)
+        assert factorization._segment_lookup is None
+
+    def test_single_segment_composition(self, waveform):
+        """Test composition of a single segment equals summing the selected components"""
+        factorization = RandomStemsFactorization(ArrayAudioLoader(waveform), n_temporal_segments=1)
+        masks = np.array([[1, 0, 1], [0, 1, 1]])
+
+        np.testing.assert_allclose(factorization.compose_batch(masks)[0],
+                                   factorization.compose_model_input([0, 2]), rtol=1e-5, atol=1e-6)
+
+
+class TestStreamingDataLabels:
+    """Test bounded-memory neighborhood generation"""
+
+    @staticmethod
+    def predict_fn(x):
+        return np.stack([x.sum(axis=1), np.abs(x).max(axis=1), x.min(axis=1)], axis=1)
+
+    def test_matches_default_mode(self, factorization):
+        """Test streaming yields the same masks and predictions as the default mode"""
+        explainer = LimeAudioExplainer(random_state=3)
+        explainer.factorization = factorization
+        data, labels = explainer.data_labels(self.predict_fn, num_samples=40, batch_size=8)
+
+        explainer = LimeAudioExplainer(random_state=3)
+        explainer.factorization = factorization
+        stream_data, stream_labels = explainer.data_labels(self.predict_fn, num_samples=40, batch_size=8,
+                                                           memory_budget=10 ** 6)
+
+        assert stream_data.dtype == np.uint8
+        assert stream_labels.dtype == np.float32
+        np.testing.assert_array_equal(stream_data, data)
+        np.testing.assert_allclose(stream_labels, labels, rtol=1e-5, atol=1e-5)
+
+    def test_budget_limits_batch_size(self, factorization):
+        """Test the batch size is lowered so a composed batch fits the budget"""
+        explainer = LimeAudioExplainer(random_state=0)
+        explainer.factorization = factorization
+        batch_sizes = []
+
+        def predict_fn(x):
+            batch_sizes.append(len(x))
+            return self.predict_fn(x)
+
+        # masks (40 x 12 B) + labels (40 x 12 B) + 3 rows of 1600 float32 samples and their labels
+        memory_budget = 40 * 12 + 40 * 12 + 3 * (1600 * 4 + 12)
+        explainer.data_labels(predict_fn, num_samples=40, batch_size=16, memory_budget=memory_budget)
+
+        assert max(batch_sizes) == 3
+        assert sum(batch_sizes) == 40
+
+    def test_too_small_budget_raises_error(self, factorization):
+        """Test a budget that cannot hold a single composed input is rejected"""
+        explainer = LimeAudioExplainer(random_state=0)
+        explainer.factorization = factorization
+
+        with pytest.raises(ValueError) as excinfo:
+            explainer.data_labels(self.predict_fn, num_samples=40, memory_budget=1024)
+
+        assert "memory_budget of 1024 bytes" in str(excinfo.value)
+
+
+class TestPredictionCache:
+    """Test memoization of predictions keyed by perturbation bitmask"""
+
+    @staticmethod
+    def counting_predict_fn(calls):
+        def predict_fn(x):
+            calls.append(len(x))
+            return np.stack([x.sum(axis=1), x.max(axis=1)], axis=1)
+        return predict_fn
+
+    def test_repeated_masks_are_predicted_once(self):
+        """Test duplicates within and across batches are served from the cache"""
+        cache = PredictionCache()
+        masks = np.array([[1, 0, 1], [1, 0, 1], [0, 1, 0]])
+        calls = []
+
+        first = cache.predict(masks, self.counting_predict_fn(calls))
+        second = cache.predict(masks[::-1], self.counting_predict_fn(calls))
+
+        assert calls == [2]
+        np.testing.assert_array_equal(second, first[::-1])
+        assert cache.misses == 2
+        assert cache.hits == 4
+        assert cache.hit_rate() == pytest.approx(4 / 6)
+
+    def test_labels_match_uncached_run(self, waveform):
+        """Test cached neighborhood labels equal the uncached ones while skipping repeats"""
+        factorization = RandomStemsFactorization(ArrayAudioLoader(waveform), n_temporal_segments=2, n_stems=2)
+        calls = []
+
+        explainer = LimeAudioExplainer(random_state=5)
+        explainer.factorization = factorization
+        data, labels = explainer.data_labels(self.counting_predict_fn([]), num_samples=64, batch_size=16)
+
+        cache = PredictionCache()
+        explainer = LimeAudioExplainer(random_state=5)
+        explainer.factorization = factorization
+        cached_data, cached_labels = explainer.data_labels(self.counting_predict_fn(calls), num_samples=64,
+                                                           batch_size=16, prediction_cache=cache)
+
+        np.testing.assert_array_equal(cached_data, data)
+        np.testing.assert_allclose(cached_labels, labels, rtol=1e-5, atol=1e-5)
+        assert sum(calls) == len(np.unique(data, axis=0)) <= 16
+        assert cache.hit_rate() > 0.5
+
+    def test_cache_is_kept_across_explanations(self, factorization):
+        """Test a cache reused with the same factorization and predict_fn avoids new predictions"""
+        cache = PredictionCache()
+        calls = []
+        predict_fn = self.counting_predict_fn(calls)
+        explainer = LimeAudioExplainer(random_state=0)
+
+        explainer.explain_instance(factorization, predict_fn, labels=[0], num_samples=20,
+                                   prediction_cache=cache)
+        n_calls = len(calls)
+        explainer = LimeAudioExplainer(random_state=0)
+        explainer.explain_instance(factorization, predict_fn, labels=[0], num_samples=20,
+                                   prediction_cache=cache)
+
+        assert len(calls) == n_calls
+        assert cache.hits >= 20
+
+    def test_cache_is_cleared_on_new_window(self, factorization):
+        """Test moving the analysis window invalidates cached predictions"""
+        cache = PredictionCache()
+        predict_fn = self.counting_predict_fn([])
+        cache.bind(factorization, predict_fn)
+        cache.predict(np.ones((1, factorization.get_number_components())), predict_fn)
+
+        factorization.set_analysis_window(0, 800)
+        cache.bind(factorization, predict_fn)
+
+        assert len(cache) == 0
+
+
+class TestMultiLabelFit:
+    """Test the closed-form multi-label fit against per-label sklearn fits"""
+
+    @pytest.fixture
+    def neighborhood(self):
+        rng = np.random.RandomState(7)
+        data = rng.randint(0, 2, (400, 12))
+        data[0, :] = 1
+        true_weights = rng.normal(size=(12, 6))
+        labels = data @ true_weights + rng.normal(scale=0.5, size=(400, 6))
+        distances = 1 - np.sqrt(data.sum(axis=1) / data.shape[1])
+        return data, labels.astype(np.float32), distances
+
+    @staticmethod
+    def base():
+        return LimeBase(lambda d: np.sqrt(np.exp(-(d ** 2) / 0.25 ** 2)), random_state=0)
+
+    @pytest.mark.parametrize("feature_selection, num_features", [
+        ('auto', 100000),
+        ('none', 100000),
+        ('highest_weights', 4),
+        ('forward_selection', 3),
+    ])
+    def test_matches_per_label_fit(self, neighborhood, feature_selection, num_features):
+        """Test intercepts, weights, p-values, scores and local predictions match"""
+        data, labels, distances = neighborhood
+        explained = [5, 0, 3]
+
+        explanations = self.base().explain_instances_with_data(data, labels, distances, explained,
+                                                               num_features, feature_selection)
+
+        for label in explained:
+            intercept, exp, score, local_pred = self.base().explain_instance_with_data(
+                data, labels, distances, label, num_features, feature_selection)
+            multi_intercept, multi_exp, multi_score, multi_local_pred = explanations[label]
+            assert multi_intercept == pytest.approx(intercept, rel=1e-6, abs=1e-6)
+            assert multi_score == pytest.approx(score, rel=1e-6)
+            np.testing.assert_allclose(multi_local_pred, local_pred, rtol=1e-6)
+            assert [e[0] for e in multi_exp] == [e[0] for e in exp]
+            np.testing.assert_allclose([e[1] for e in multi_exp], [e[1] for e in exp], rtol=1e-6, atol=1e-8)
+            np.testing.assert_allclose([e[2] for e in multi_exp], [e[2] for e in exp], rtol=1e-5, atol=1e-8)
+
+    def test_cosine_distance_from_popcount(self, factorization):
+        """Test explanations use cosine distances equal to sklearn's"""
+        import sklearn.metrics
+        explainer = LimeAudioExplainer(random_state=0)
+        captured = {}
+        base_fit = explainer.base.explain_instances_with_data
+
+        def spy(data, labels, distances, *args, **kwargs):
+            captured['data'], captured['distances'] = data, distances
+            return base_fit(data, labels, distances, *args, **kwargs)
+
+        explainer.base.explain_instances_with_data = spy
+        explainer.explain_instance(factorization, TestStreamingDataLabels.predict_fn, top_labels=2,
+                                   num_samples=30)
+
+        data = captured['data']
+        expected = sklearn.metrics.pairwise_distances(data, data[0].reshape(1, -1), metric='cosine').ravel()
+        np.testing.assert_allclose(captured['distances'], expected, atol=1e-12)
+
+
+class TestForwardSelection:
+    """Test incremental forward selection against refitting every candidate"""
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_selects_same_features_as_refit(self, seed):
+        """Test the incremental Cholesky selection picks the refit selection"""
+        rng = np.random.RandomState(seed)
+        data = rng.randint(0, 2, (300, 20))
+        data[0, :] = 1
+        labels = data @ rng.normal(size=20) + rng.normal(scale=0.3, size=300)
+        weights = rng.uniform(0.1, 1.0, 300)
+        base = LimeBase(kernel_fn=None, random_state=0)
+
+        selected = base.forward_selection(data, labels, weights, 6)
+
+        np.testing.assert_array_equal(selected, base.forward_selection_refit(data, labels, weights, 6))
+
+    def test_collinear_features(self):
+        """Test duplicated columns are handled like in the refit selection"""
+        rng = np.random.RandomState(0)
+        data = rng.randint(0, 2, (200, 4))
+        data = np.hstack((data, data[:, :1]))
+        labels = 3 * data[:, 0] - data[:, 2] + rng.normal(scale=0.1, size=200)
+        base = LimeBase(kernel_fn=None, random_state=0)
+
+        selected = base.forward_selection(data, labels, np.ones(200), 5)
+
+        np.testing.assert_array_equal(selected, base.forward_selection_refit(data, labels, np.ones(200), 5))
+        assert list(selected[:2]) == [0, 2]
+
+
+class TestSamplingRounds:
+    """Test convergence-based early stopping and the deadline mode"""
+
+    @staticmethod
+    def predict_fn(x):
+        projection = np.random.RandomState(11).normal(size=(x.shape[1], 3)).astype(np.float32)
+        return np.tanh(x @ projection / 10)
+
+    def test_full_sampling_is_recorded(self, factorization):
+        """Test explanations record the neighborhood size and why sampling stopped"""
+        explanation = LimeAudioExplainer(random_state=0).explain_instance(
+            factorization, self.predict_fn, top_labels=1, num_samples=64)
+
+        assert explanation.num_samples == 64
+        assert explanation.stop_reason == 'num_samples'
+
+    def test_rounds_draw_the_same_neighborhood(self, factorization):
+        """Test sampling in rounds continues the neighborhood of a single draw"""
+        explanation = LimeAudioExplainer(random_state=4).explain_instance(
+            factorization, self.predict_fn, top_labels=2, num_samples=300)
+        rounds = LimeAudioExplainer(random_state=4).explain_instance(
+            factorization, self.predict_fn, top_labels=2, num_samples=300,
+            sample_round_size=64, convergence_tol=0.0)
+
+        assert rounds.stop_reason == 'num_samples'
+        np.testing.assert_array_equal(rounds.neighborhood_data, explanation.neighborhood_data)
+        for label in explanation.local_exp:
+            np.testing.assert_allclose(np.array(rounds.local_exp[label], dtype=float),
+                                       np.array(explanation.local_exp[label], dtype=float), rtol=1e-5, atol=1e-6)
+
+    def test_stops_when_converged(self, factorization):
+        """Test sampling stops early once the top components are stable"""
+        explanation = LimeAudioExplainer(random_state=0).explain_instance(
+            factorization, self.predict_fn, top_labels=2, num_samples=20000,
+            sample_round_size=500, convergence_top_k=3, convergence_tol=0.2)
+
+        assert explanation.stop_reason == 'converged'
+        assert explanation.num_samples < 20000
+        assert len(explanation.neighborhood_data) == explanation.num_samples
+
+    def test_deadline_returns_partial_explanation(self, factorization):
+        """Test the best available explanation is returned when time runs out"""
+        import time
+
+        def slow_predict_fn(x):
+            time.sleep(0.01)
+            return self.predict_fn(x)
+
+        explanation = LimeAudioExplainer(random_state=0).explain_instance(
+            factorization, slow_predict_fn, top_labels=1, num_samples=100000,
+            batch_size=10, sample_round_size=50, deadline=0.2)
+
+        assert explanation.stop_reason == 'deadline'
+        assert 50 <= explanation.num_samples < 100000
+        assert len(explanation.local_exp) == 1
+
+    def test_exhaustive_sampling_in_rounds_raises_error(self, factorization):
+        """Test rounds need a finite number of samples"""
+        with pytest.raises(ValueError):
+            LimeAudioExplainer(random_state=0).explain_instance(
+                factorization, self.predict_fn, top_labels=1, num_samples='exhaustive',
+                sample_round_size=10)
+
+    def test_exhaustive_sampling_with_deadline_raises_error(self, factorization):
+        """Test a deadline, which implies rounds, rejects exhaustive sampling before sizing the rounds"""
+        with pytest.raises(ValueError, match='exhaustive sampling'):
+            LimeAudioExplainer(random_state=0).explain_instance(
+                factorization, self.predict_fn, top_labels=1, num_samples='exhaustive', deadline=1.0)
+
+
+class TestCompositionPipeline:
+    """Test overlapping composition of perturbations with predict_fn"""
+
+    @staticmethod
+    def predict_fn(x):
+        return np.stack([x.sum(axis=1), x.max(axis=1), x[:, 0]], axis=1)
+
+    def run(self, factorization, **kwargs):
+        explainer = LimeAudioExplainer(random_state=3)
+        explainer.factorization = factorization
+        return explainer.data_labels(self.predict_fn, num_samples=100, batch_size=16, **kwargs)
+
+    @pytest.mark.parametrize('workers,queue_depth', [(1, 1), (2, 3)])
+    def test_matches_sequential_labels(self, factorization, workers, queue_depth):
+        """Test pipelined labels equal the sequentially computed ones"""
+        data, labels = self.run(factorization)
+        piped_data, piped_labels = self.run(factorization, pipeline=CompositionPipeline(workers, queue_depth))
+
+        np.testing.assert_array_equal(piped_data, data)
+        np.testing.assert_array_equal(piped_labels, labels)
+
+    def test_streaming_and_cache(self, factorization):
+        """Test the pipeline combines with streaming mode and a prediction cache"""
+        data, labels = self.run(factorization)
+        piped_data, piped_labels = self.run(factorization, pipeline=CompositionPipeline(),
+                                            memory_budget=10 ** 6, prediction_cache=PredictionCache())
+
+        np.testing.assert_array_equal(piped_data, data)
+        np.testing.assert_allclose(piped_labels, labels, rtol=1e-5, atol=1e-5)
+
+    def test_backpressure_bounds_batches_ahead(self):
+        """Test no more than queue_depth batches are composed ahead of the predicted one"""
+        lock = threading.Lock()
+        state = {'composed': 0, 'predicted': 0, 'ahead': 0}
+
+        def compose_fn(masks, out):
+            with lock:
+                state['composed'] += 1
+                state['ahead'] = max(state['ahead'], state['composed'] - state['predicted'])
+            return np.asarray(masks, dtype=np.float32)
+
+        batches = [np.full((4, 2), i) for i in range(10)]
+        pipeline = CompositionPipeline(workers=3, queue_depth=2)
+        for i, (masks, composed) in enumerate(pipeline.compose(compose_fn, batches)):
+            time.sleep(0.01)
+            np.testing.assert_array_equal(composed, batches[i])
+            with lock:
+                state['predicted'] += 1
+
+        assert state['composed'] == 10
+        assert state['ahead'] <= 3
+
+    def test_buffers_are_reused(self):
+        """Test composed batches are written into a ring of queue_depth + 1 buffers"""
+        def compose_fn(masks, out):
+            if out is None:
+                return np.asarray(masks, dtype=np.float32)
+            out[...] = masks
+            return out
+
+        batches = [np.full((4, 2), i) for i in range(8)]
+        buffers = set()
+        for _, composed in CompositionPipeline(queue_depth=2).compose(compose_fn, batches):
+            buffers.add(composed.__array_interface__['data'][0])
+
+        assert len(buffers) == 3
+
+    def test_composition_overlaps_prediction(self):
+        """Test composing the next batch runs while the current one is predicted"""
+        def compose_fn(masks, out):
+            time.sleep(0.05)
+            return masks
+
+        batches = [np.zeros((1, 1))] * 6
+        start = time.perf_counter()
+        for _ in CompositionPipeline().compose(compose_fn, batches):
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+
+        # sequential execution would take 0.6 s
+        assert elapsed < 0.5
+
+    @pytest.mark.parametrize('workers,queue_depth', [(0, 2), (1, 0)])
+    def test_invalid_configuration_raises_error(self, workers, queue_depth):
+        """Test non positive workers or queue depth raise a ValueError"""
+        with pytest.raises(ValueError):
+            CompositionPipeline(workers, queue_depth)
+
+
+class TestPackedMasks:
+    """Test bit-packed storage of perturbation masks"""
+
+    @pytest.fixture
+    def dense(self):
+        masks = np.random.RandomState(0).randint(0, 2, (50, 13))
+        masks[0, :] = 1
+        return masks
+
+    def test_indexing_matches_dense_masks(self, dense):
+        """Test row, slice and column selections equal those of the dense matrix"""
+        packed = PackedMasks.from_dense(dense)
+        packed.block_size = 8
+
+        assert packed.shape == dense.shape
+        np.testing.assert_array_equal(packed, dense)
+        np.testing.assert_array_equal(packed[3], dense[3])
+        np.testing.assert_array_equal(packed[10:20], dense[10:20])
+        np.testing.assert_array_equal(packed[:, [2, 5, 12]], dense[:, [2, 5, 12]])
+        np.testing.assert_array_equal(packed[0, [1, 4]], dense[0, [1, 4]])
+        np.testing.assert_array_equal(list(packed), dense)
+        np.testing.assert_array_equal(packed.popcount(), dense.sum(axis=1))
+
+    def test_concatenate(self, dense):
+        """Test concatenated packed masks equal the concatenated dense masks"""
+        packed = PackedMasks.concatenate([PackedMasks.from_dense(dense[:20]), PackedMasks.from_dense(dense[20:])])
+
+        np.testing.assert_array_equal(packed, dense)
+
+    def test_data_labels_returns_packed_masks(self, factorization):
+        """Test neighborhoods are stored with one bit per component"""
+        explainer = LimeAudioExplainer(random_state=0)
+        explainer.factorization = factorization
+
+        data, _ = explainer.data_labels(lambda x: x[:, :2], num_samples=64, batch_size=16)
+
+        assert isinstance(data, PackedMasks)
+        assert data.nbytes == 64 * 2
+
+    def test_fit_matches_dense_fit(self, dense):
+        """Test packed masks are fitted to the same explanation as dense masks"""
+        rng = np.random.RandomState(1)
+        labels = dense @ rng.normal(size=(13, 3)) + rng.normal(scale=0.3, size=(50, 3))
+        distances = 1 - np.sqrt(dense.sum(axis=1) / dense.shape[1])
+        base = LimeBase(kernel_fn=lambda d: np.sqrt(np.exp(-(d ** 2) / 0.25 ** 2)), random_state=0)
+        packed = PackedMasks.from_dense(dense)
+        packed.block_size = 16
+
+        expected = base.explain_instances_with_data(dense, labels, distances, range(3), 4)
+        explanations = base.explain_instances_with_data(packed, labels, distances, range(3), 4)
+
+        for label in range(3):
+            np.testing.assert_allclose(explanations[label][0], expected[label][0], rtol=1e-8)
+            assert [x[0] for x in explanations[label][1]] == [x[0] for x in expected[label][1]]
+            np.testing.assert_allclose([x[1:] for x in explanations[label][1]],
+                                       [x[1:] for x in expected[label][1]], rtol=1e-8, atol=1e-12)
+
+
+class TestStemCache:
+    """Test the content-addressed cache of separated stems"""
+
+    @staticmethod
+    def stems(seed, n_samples=1000):
+        return np.random.RandomState(seed).uniform(-1, 1, (2, n_samples)).astype(np.float32)
+
+    def test_roundtrip_is_memory_mapped(self, tmp_path, waveform):
+        """Test stored stems are returned memory-mapped with their names"""
+        cache = StemCache(str(tmp_path))
+        key = cache.key(waveform, 'spleeter:2stems', 16000)
+        cache.put(key, ['vocals', 'accompaniment'], self.stems(0))
+
+        names, stems = cache.get(key)
+
+        assert names == ['vocals', 'accompaniment']
+        assert isinstance(stems, np.memmap)
+        assert stems.dtype == np.float32
+        np.testing.assert_array_equal(stems, self.stems(0))
+
+    def test_key_depends_on_content_model_and_rate(self, waveform):
+        """Test the key changes with the audio, the model and the sampling rate only"""
+        key = StemCache.key(waveform, 'spleeter:2stems', 16000)
+
+        assert key == StemCache.key(waveform.copy(), 'spleeter:2stems', 16000)
+        assert key != StemCache.key(waveform[::-1], 'spleeter:2stems', 16000)
+        assert key != StemCache.key(waveform, 'spleeter:5stems', 16000)
+        assert key != StemCache.key(waveform, 'spleeter:2stems', 22050)
+
+    def test_miss_returns_none(self, tmp_path):
+        """Test a missing entry is a cache miss"""
+        assert StemCache(str(tmp_path)).get('unknown') is None
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Test entries above the size cap are evicted in least recently used order"""
+        entry_size = self.stems(0).nbytes + 128
+        cache = StemCache(str(tmp_path), max_bytes=2 * entry_size)
+        cache.put('a', ['x', 'y'], self.stems(0))
+        cache.put('b', ['x', 'y'], self.stems(1))
+        os.utime(os.path.join(str(tmp_path), 'a.npy'), (0, 0))
+        os.utime(os.path.join(str(tmp_path), 'b.npy'), (1, 1))
+        cache.get('a')
+
+        cache.put('c', ['x', 'y'], self.stems(2))
+
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.get('c') is not None
+        assert cache.size() <= 2 * entry_size
+
+    def test_spleeter_factorization_separates_once(self, tmp_path, waveform, monkeypatch):
+        """Test a second factorization of the same audio loads the stems from the cache"""
+        separations = []
+
+        class FakeSeparator:
+            def __init__(self, model_name, multiprocess=False):
+                pass
+
+            def separate(self, waveform):
+                separations.append(len(waveform))
+                return {'vocals': waveform * 0.25, 'accompaniment': waveform * 0.75}
+
+        monkeypatch.setattr(factorization_module, 'Separator', FakeSeparator)
+        audio_path = os.path.join(str(tmp_path), 'mix.wav')
+        soundfile.write(audio_path, waveform, 16000, subtype='FLOAT')
+        cache = StemCache(os.path.join(str(tmp_path), 'stems'))
+
+        first = SpleeterFactorization(RawAudioLoader(audio_path), 4, None, 'spleeter:2stems', stem_cache=cache)
+        second = SpleeterFactorization(RawAudioLoader(audio_path), 4, None, 'spleeter:2stems', stem_cache=cache)
+
+        assert len(separations) == 1
+        assert second.get_ordered_component_names() == first.get_ordered_component_names()
+        np.testing.assert_allclose(second.compose_model_input(), first.compose_model_input(), rtol=1e-6)
+
+
+class TestSeparatorWorker:
+    """Test the persistent separator process"""
+
+    @pytest.fixture(scope='class')
+    def worker(self):
+        with SeparatorWorker('fake:3stems', max_batch_tracks=3, batch_timeout=1.0, gap=16,
+                             separator_factory=ScalingSeparator) as worker:
+            yield worker
+
+    def test_batches_queued_tracks(self, worker):
+        """Test tracks submitted together are separated by one call and split apart again"""
+        tracks = [np.random.RandomState(i).uniform(-1, 1, (100 + i, 2)).astype(np.float32) for i in range(3)]
+
+        predictions = worker.separate_many(tracks)
+
+        for track, prediction in zip(tracks, predictions):
+            np.testing.assert_allclose(prediction['vocals'], track * 0.25)
+            np.testing.assert_allclose(prediction['accompaniment'], track * 0.75)
+            np.testing.assert_array_equal(prediction['call_length'], 303 + 2 * 16)
+
+    def test_errors_are_raised_in_client(self, worker):
+        """Test a failing separation raises instead of hanging and the worker keeps serving"""
+        with pytest.raises(RuntimeError, match='not finite'):
+            worker.separate(np.full((10, 2), np.nan, dtype=np.float32))
+
+        assert worker.separate(np.ones((10, 2), dtype=np.float32))['vocals'].shape == (10, 2)
+
+    def test_spleeter_factorization_uses_worker(self, tmp_path, waveform, worker):
+        """Test SpleeterFactorization separates through a shared worker"""
+        audio_path = os.path.join(str(tmp_path), 'mix.wav')
+        soundfile.write(audio_path, waveform, 16000, subtype='FLOAT')
+
+        factorization = SpleeterFactorization(RawAudioLoader(audio_path), 4, None, 'fake:3stems',
+                                              separator=worker)
+
+        assert factorization.get_ordered_component_names()[:3] == ['vocals0', 'accompaniment0', 'call_length0']
+        vocals, accompaniment = factorization.original_components[:2]
+        np.testing.assert_allclose(vocals * 3, accompaniment, rtol=1e-4, atol=1e-5)
+
+    def test_closed_worker_rejects_jobs(self):
+        """Test submitting to a closed worker raises a RuntimeError"""
+        worker = SeparatorWorker('fake:3stems', separator_factory=ScalingSeparator)
+        worker.close()
+
+        with pytest.raises(RuntimeError):
+            worker.submit(np.zeros((10, 2), dtype=np.float32))
+
+    def test_exited_worker_fails_every_job(self):
+        """Test jobs submitted after the worker process died fail instead of hanging"""
+        worker = SeparatorWorker('fake:3stems', separator_factory=failing_separator)
+        try:
+            with pytest.raises(RuntimeError, match='exited'):
+                worker.submit(np.zeros((10, 2), dtype=np.float32)).result(timeout=30)
+            for _ in range(2):
+                with pytest.raises(RuntimeError, match='exited'):
+                    worker.separate(np.zeros((10, 2), dtype=np.float32))
+        finally:
+            worker.close()
+
+
+class TestSoundLIMEComposeBatch:
+    """Test batched ISTFT composition of time-frequency segments"""
+
+    @pytest.fixture
+    def slime(self, tmp_path):
+        audio_path = os.path.join(str(tmp_path), 'mix.wav')
+        soundfile.write(audio_path, np.random.RandomState(0).uniform(-0.5, 0.5, 16000), 16000, subtype='FLOAT')
+        factorization = SoundLIMEFactorization(audio_path, frequency_segments=5, temporal_segments=4)
+        factorization.set_analysis_window(0, 16000)
+        return factorization
+
+    def test_matches_per_mask_composition(self, slime):
+        """Test every batched row equals compose_model_input of the selected segments"""
+        masks = np.random.RandomState(1).randint(0, 2, (12, slime.get_number_components()))
+        masks[masks.sum(axis=1) == 0, 0] = 1
+
+        composed = slime.compose_batch(masks)
+
+        assert composed.shape == (12, 16000)
+        for mask, row in zip(masks, composed):
+            np.testing.assert_allclose(row, slime.compose_model_input(np.flatnonzero(mask)), rtol=1e-4, atol=1e-6)
+
+    def test_keeps_segment_order(self, slime):
+        """Test component t * frequency_segments + f selects frequency band f of temporal segment t"""
+        mask = np.zeros((1, slime.get_number_components()), dtype=int)
+        mask[0, 1 * 5 + 3] = 1
+
+        y = slime.compose_batch(mask)[0]
+
+        spectrum = np.abs(librosa.stft(y))
+        band_energy = spectrum.reshape(5, 205, -1).sum(axis=(1, 2))
+        assert np.argmax(band_energy) == 3
+        assert np.abs(y[:3000]).max() < np.abs(y[4000:8000]).max() * 1e-2
+
+    def test_empty_mask_is_filled_with_minimum(self, slime):
+        """Test a mask without segments gives a constant signal at the mix minimum"""
+        composed = slime.compose_batch(np.zeros((1, slime.get_number_components()), dtype=int))
+
+        np.testing.assert_allclose(composed[0], slime.compose_model_input().min())
+
+
+class TestSpectralFactorization:
+    """Test composition of perturbations in the STFT domain"""
+
+    @pytest.fixture
+    def front_end(self):
+        return StftFrontEnd(n_fft=128, hop_length=32, input_length=2000)
+
+    def test_matches_stft_of_composed_waveforms(self, factorization, front_end):
+        """Test spectral composition equals the front end applied to the composed waveforms"""
+        spectral = SpectralFactorization(factorization, front_end)
+        masks = np.random.RandomState(0).randint(0, 2, (16, 12))
+        masks[0] = 1
+        masks[1] = 0
+
+        composed = spectral.compose_batch(masks)
+
+        expected = front_end.stft(factorization.compose_batch(masks))
+        assert composed.dtype == np.complex64
+        np.testing.assert_allclose(composed, expected, rtol=1e-4, atol=1e-4)
+
+    def test_component_spectra_are_segment_local(self, factorization, front_end):
+        """Test each segment only stores the frames its samples reach"""
+        spectral = SpectralFactorization(factorization, front_end)
+
+        n_frames = spectral.compose_model_input().shape[-1]
+        for indices, frame_start, frame_stop, spectra in spectral._segment_spectra:
+            assert len(indices) == 3
+            assert frame_stop - frame_start <= 400 // 32 + 128 // 32 + 1 < n_frames
+
+    def test_follows_analysis_window(self, factorization, front_end):
+        """Test component spectra are recomputed for a new analysis window"""
+        spectral = SpectralFactorization(factorization, front_end)
+
+        spectral.set_analysis_window(800, 800)
+
+        masks = np.ones((1, 12), dtype=int)
+        np.testing.assert_allclose(spectral.compose_batch(masks)[0],
+                                   front_end.stft(factorization.data_provider.get_mix()), rtol=1e-4, atol=1e-4)
+
+
+class TestNMFFactorization:
+    """Test the separation-free NMF factorization"""
+
+    @pytest.fixture
+    def two_tones(self):
+        t = np.arange(32000) / 16000
+        low = np.sin(2 * np.pi * 250 * t) * (t < 1.2)
+        high = 0.5 * np.sin(2 * np.pi * 2000 * t) * (t > 0.8)
+        return (low + high).astype(np.float32)
+
+    def test_stems_sum_up_to_mix(self, two_tones):
+        """Test the soft masked stems reconstruct the analysis window"""
+        factorization = NMFFactorization(ArrayAudioLoader(two_tones), n_temporal_segments=4, n_components=2)
+
+        assert factorization.get_number_components() == 8
+        assert factorization.get_ordered_component_names()[:2] == ['nmf00', 'nmf10']
+        np.testing.assert_allclose(factorization.compose_model_input(), two_tones, atol=1e-3)
+
+    def test_templates_separate_tones(self, two_tones):
+        """Test each template captures one of the two tones"""
+        factorization = NMFFactorization(ArrayAudioLoader(two_tones), n_temporal_segments=4, n_components=2)
+
+        peaks = sorted(np.argmax(factorization.templates, axis=0) * 16000 / factorization.n_fft)
+
+        assert peaks[0] == pytest.approx(250, abs=20)
+        assert peaks[1] == pytest.approx(2000, abs=20)
+
+    def test_warm_start_from_previous_window(self, two_tones):
+        """Test a moved window starts from the previous templates and keeps their order"""
+        factorization = NMFFactorization(ArrayAudioLoader(two_tones), n_temporal_segments=2, n_components=2,
+                                         warm_start_iter=10)
+        templates = factorization.templates.copy()
+        cold = NMFFactorization(ArrayAudioLoader(two_tones[8000:24000]), n_temporal_segments=2,
+                                n_components=2, n_iter=10)
+
+        factorization.set_analysis_window(8000, 16000)
+
+        assert factorization.divergence < cold.divergence
+        assert len(factorization.compose_model_input()) == 16000
+        np.testing.assert_array_equal(np.argmax(factorization.templates, axis=0), np.argmax(templates, axis=0))
+
+
+class TestBandFactorization:
+    """Test the filterbank band factorization"""
+
+    def test_bands_sum_up_to_mix(self, waveform):
+        """Test the bands reconstruct the mix"""
+        factorization = BandFactorization(ArrayAudioLoader(waveform), n_temporal_segments=4, n_bands=5)
+
+        assert factorization.get_number_components() == 20
+        assert factorization.get_ordered_component_names()[:5] == ['band00', 'band10', 'band20', 'band30', 'band40']
+        np.testing.assert_allclose(factorization.compose_model_input(), waveform, atol=1e-5)
+
+    def test_sine_falls_into_its_band(self):
+        """Test a sine is passed by the band containing its frequency only"""
+        t = np.arange(16000) / 16000
+        sine = np.sin(2 * np.pi * 1000 * t).astype(np.float32)
+        factorization = BandFactorization(ArrayAudioLoader(sine), n_temporal_segments=1,
+                                          band_edges=[250, 500, 2000, 4000])
+
+        energy = [np.sum(np.asarray(band)[2000:-2000] ** 2) for band in factorization.retrieve_components()]
+
+        assert np.argmax(energy) == 2
+        assert sorted(energy)[-2] < 1e-3 * max(energy)
+
+    def test_filterbank_is_cached(self):
+        """Test the filterbank of a configuration is designed once"""
+        filters = band_filterbank(16000, (500.0, 2000.0), 257)
+
+        assert band_filterbank(16000, (500.0, 2000.0), 257) is filters
+        np.testing.assert_allclose(filters.sum(axis=0), np.eye(1, 257, 128)[0], atol=1e-12)
+
+
+class TestWindowedExplanations:
+    """Test explaining a track in hopped analysis windows"""
+
+    @staticmethod
+    def predict_fn(x):
+        projection = np.random.RandomState(11).normal(size=(x.shape[1], 3)).astype(np.float32)
+        return np.tanh(x @ projection / 10)
+
+    def test_window_starts_cover_the_track(self):
+        """Test the last window ends at the end of the track"""
+        assert LimeAudioExplainer.window_starts(1600, 400, 400) == [0, 400, 800, 1200]
+        assert LimeAudioExplainer.window_starts(1700, 400, 300) == [0, 300, 600, 900, 1200, 1300]
+        assert LimeAudioExplainer.window_starts(300, 400, 200) == [0]
+
+    @pytest.mark.parametrize("window_length, hop_length, argument", [
+        (400, 0, 'hop_length'),
+        (400, -100, 'hop_length'),
+        (0, 200, 'window_length'),
+    ])
+    def test_window_starts_reject_non_positive_lengths(self, window_length, hop_length, argument):
+        """Test a non-positive window or hop length names the bad argument"""
+        with pytest.raises(ValueError, match=argument):
+            LimeAudioExplainer.window_starts(1600, window_length, hop_length)
+
+    def test_window_views_share_stems(self, factorization):
+        """Test window views reuse the separated stems and leave the factorization untouched"""
+        components = factorization.retrieve_components()
+        view = factorization.window_view(400, 800)
+
+        assert len(view.compose_model_input()) == 800
+        assert len(factorization.compose_model_input()) == 1600
+        assert np.shares_memory(view.original_components[0], factorization.original_components[0])
+        np.testing.assert_array_equal(np.asarray(factorization.retrieve_components()[0]), np.asarray(components[0]))
+
+    def test_windows_share_predict_calls(self, factorization):
+        """Test perturbations of consecutive windows are packed into full batches"""
+        batch_sizes = []
+
+        def predict_fn(x):
+            batch_sizes.append(len(x))
+            return self.predict_fn(x)
+
+        starts = LimeAudioExplainer.window_starts(1600, 800, 400)
+        results = LimeAudioExplainer(random_state=0).explain_windows(
+            factorization, predict_fn, starts, 800, top_labels=1, num_samples=30, batch_size=16)
+
+        assert [start for start, _ in results] == starts
+        assert sum(batch_sizes) == 90
+        assert batch_sizes == [16] * 5 + [10]
+
+    def test_windows_are_fitted_on_their_own_perturbations(self, factorization):
+        """Test every window is fitted on predictions of perturbations composed in that window"""
+        done = []
+        results = LimeAudioExplainer(random_state=3).explain_windows(
+            factorization, self.predict_fn, [0, 800], 800, top_labels=2, num_samples=64, batch_size=24,
+            window_done_fn=lambda start, explanation: done.append(start))
+
+        assert done == [0, 800]
+        for start, explanation in results:
+            view = factorization.window_view(start, 800)
+            data = np.asarray(explanation.neighborhood_data)
+            assert np.all(data[0] == 1)
+            np.testing.assert_allclose(explanation.neighborhood_labels,
+                                       self.predict_fn(view.compose_batch(data)), rtol=1e-6)
+            assert len(explanation.local_exp) == 2
+
+
+class TestComparePredictFns:
+    """Test comparing preview predictions against full precision"""
+
+    @staticmethod
+    def predict_fn(x):
+        projection = np.random.RandomState(11).normal(size=(x.shape[1], 3)).astype(np.float32)
+        return np.tanh(x @ projection / 10)
+
+    def test_identical_predictions_agree(self, factorization):
+        """Test a preview predicting exactly like the model ranks all components alike"""
+        report = LimeAudioExplainer(random_state=0).compare_predict_fns(
+            factorization, self.predict_fn, self.predict_fn, num_samples=128)
+
+        assert report['spearman'] == pytest.approx(1.0)
+        assert report['top_overlap'] == 1.0
+
+    def test_noisy_predictions_are_reported(self, factorization):
+        """Test a preview with perturbed predictions lowers the rank correlation"""
+        rng = np.random.RandomState(5)
+
+        def noisy_fn(x):
+            predictions = self.predict_fn(x)
+            return predictions + rng.normal(scale=1.0, size=predictions.shape)
+
+        explainer = LimeAudioExplainer(random_state=0)
+        report = explainer.compare_predict_fns(factorization, self.predict_fn, noisy_fn, num_samples=128)
+        reference = LimeAudioExplainer(random_state=0).explain_instance(
+            factorization, self.predict_fn, top_labels=1, num_samples=128)
+
+        assert report['label'] == reference.top_labels[0]
+        assert -1.0 <= report['spearman'] < 1.0
+        assert 0.0 <= report['top_overlap'] <= 1.0
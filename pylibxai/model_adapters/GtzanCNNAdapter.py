@@ -1,20 +1,53 @@
+import warnings
+
 from pylibxai.models.GtzanCNN.eval import GtzanPredictor
-from pylibxai.utils import get_install_path
+from pylibxai.utils import get_install_path, get_available_device, set_torch_threads
 import torch
 import numpy as np
-from pylibxai.models.GtzanCNN.preprocessing import convert_to_spectrogram
-from pylibxai.Interfaces import LrpAdapter, LimeAdapter, IGradientsAdapter, ModelLabelProvider
+from pylibxai.models.GtzanCNN.preprocessing import (convert_to_spectrogram, spectrogram_to_model_input,
+                                                    waveforms_to_spectrogram, N_FFT, HOP_LENGTH, N_MELS)
+from pylibxai.models.fusion import fuse_conv_bn
+from pylibxai.models.inference_backends import load_backend
+from pylibxai.models.quantization import CalibratedQuantizedModel
+from pylibxai.Interfaces import (LrpAdapter, SpectralLimeAdapter, LimePreviewAdapter, StftFrontEnd, IGradientsAdapter,
+                                 ModelLabelProvider)
 import torch.nn.functional as F
 from typing import Dict
 MODEL_PATH = get_install_path() / "pylibxai" / "models" / "GtzanCNN" / "best_model.ckpt"
 
-class GtzanCNNAdapter(LrpAdapter, LimeAdapter, IGradientsAdapter, ModelLabelProvider):
-    def __init__(self, model_path, device='cuda'):
-        self.predictor = GtzanPredictor(model_path, device)
+class GtzanCNNAdapter(LrpAdapter, SpectralLimeAdapter, LimePreviewAdapter, IGradientsAdapter, ModelLabelProvider):
+    def __init__(self, model_path, device='cuda', num_threads=None, num_interop_threads=None, channels_last=True,
+                 backend='eager', fuse_batch_norm=True):
+        """
+        Args:
+            model_path: path to the GtzanCNN checkpoint
+            device: 'cuda' or 'cpu', falls back to 'cpu' without a GPU
+            num_threads: intra-op threads of torch, None keeps torch's default
+            num_interop_threads: inter-op threads of torch, None keeps torch's default
+            channels_last: store the model in channels_last format on CPU, faster for its 2D convolutions
+            backend: 'eager', 'torchscript' or 'onnxruntime', runs LIME predictions; IG and LRP
+                     always use the eager model
+            fuse_batch_norm: fold the BatchNorms into the convolutions of the model copy used for
+                             LIME predictions, see fuse_conv_bn
+        """
+        self.device = get_available_device(device)
+        set_torch_threads(num_threads, num_interop_threads)
+        self.predictor = GtzanPredictor(model_path, self.device)
         self.predictor.load_model()
-        self.device = device
+        self.memory_format = torch.channels_last if channels_last and self.device == 'cpu' else torch.contiguous_format
+        self.predictor.model.to(memory_format=self.memory_format)
+        self.predictor.model.eval()
         self.target_length = 22050 * 30  # Expected audio length
 
+        example_input = torch.randn(2, 1, N_MELS, self.target_length // HOP_LENGTH + 1,
+                                    generator=torch.Generator().manual_seed(0))
+        # IG and LRP keep the unfused model, LRP propagates relevance through every BatchNorm
+        self.fused_model = fuse_conv_bn(self.predictor.model) if fuse_batch_norm else self.predictor.model
+        self.inference_model = load_backend(backend, self.fused_model,
+                                            example_input.to(self.device).contiguous(memory_format=self.memory_format),
+                                            model_path, self.device, variant='fused' if fuse_batch_norm else None)
+        self.preview_model = None  # int8 copy of the last preview predict function
+
     def pad_or_truncate_waveform(self, wav, target_len):
         current_len = wav.shape[-1]
         if current_len < target_len:
@@ -31,36 +64,46 @@ class GtzanCNNAdapter(LrpAdapter, LimeAdapter, IGradientsAdapter, ModelLabelProv
         return self.predictor.label_to_id[target]
 
     def get_lime_predict_fn(self):
-        self.predictor.model.eval()
+        return self._lime_predict_fn(self.inference_model)
 
+    def _lime_predict_fn(self, model):
         def predict_fn(x_array):
-            # Convert numpy array to tensor and ensure correct shape
-            #audio = torch.zeros(len(x_array), self.target_length, device=self.device)
-            
-            audios = []
-            for i in range(len(x_array)):
-                audio = torch.from_numpy(np.array(x_array)).to(self.device)
-                audio_tensor = convert_to_spectrogram(audio, self.device).squeeze(0)
-                print(f': {audio_tensor.shape}')
-                audio_tensor = self.pad_or_truncate_waveform(audio_tensor, self.target_length)
-                print(f'LIME audio shape after padding/truncating: {audio_tensor.shape}')
-                audios.append(audio_tensor)
-
-            # Convert to spectrogram with proper shape [batch_size, 1, mel_bins, time]
-            batch_tensor = torch.stack(audios)
-            print(f'LIME audio shape before spectrogram conversion: {batch_tensor.shape}')
-
-            # Ensure correct shape for batch normalization
-            if audio.dim() == 3:
-                audio = audio.unsqueeze(1)  # Add channel dimension if missing
-
-            print(f'LIME audio spectrogram after unsqueeze shape: {audio.shape}')
-            with torch.no_grad():
-                output_dict = self.predictor.model(audio)
-            output_tensor = output_dict.detach().cpu().numpy()
-            return np.array(output_tensor)
+            # shares memory with x_array for float32 input on the CPU
+            audio = torch.as_tensor(np.asarray(x_array, dtype=np.float32), device=self.device)
+            with torch.inference_mode():
+                spectrogram = waveforms_to_spectrogram(audio, self.device, target_len=self.target_length)
+                output = model(spectrogram.contiguous(memory_format=self.memory_format))
+            return output.cpu().numpy()
+
+        return predict_fn
+
+    def get_stft_front_end(self):
+        return StftFrontEnd(n_fft=N_FFT, hop_length=HOP_LENGTH, input_length=self.target_length)
+
+    def get_lime_spectral_predict_fn(self):
+        return self._lime_spectral_predict_fn(self.inference_model)
+
+    def _lime_spectral_predict_fn(self, model):
+        def predict_fn(spectra):
+            spectrum = torch.from_numpy(np.asarray(spectra)).to(self.device)
+            with torch.inference_mode():
+                spectrogram = spectrogram_to_model_input(spectrum, self.device)
+                output = model(spectrogram.contiguous(memory_format=self.memory_format))
+            return output.cpu().numpy()
 
         return predict_fn
+
+    def get_lime_preview_predict_fn(self, spectral=False):
+        if self.device != 'cpu':
+            # int8 kernels run on the CPU only, slower than the full precision model on the GPU
+            warnings.warn(f'LIME previews run on the CPU only, predicting with the full precision model on '
+                          f'{self.device} instead.')
+            return self.get_lime_spectral_predict_fn() if spectral else self.get_lime_predict_fn()
+        # calibrated on the first batch of the neighborhood, every explanation quantizes its own copy
+        self.preview_model = CalibratedQuantizedModel(self.fused_model)
+        if spectral:
+            return self._lime_spectral_predict_fn(self.preview_model)
+        return self._lime_predict_fn(self.preview_model)
     
     def igrad_prepare_inference_input(self, x: torch.Tensor) -> torch.Tensor:
         x = convert_to_spectrogram(x, self.device)
@@ -1,14 +1,18 @@
 import sys
 import os
+import warnings
 from argparse import Namespace
 
 import torch
-from torch.autograd import Variable
 import numpy as np
 from typing import Callable
 
 from pathlib import Path
-from pylibxai.Interfaces import LrpAdapter, LimeAdapter, IGradientsAdapter, ModelLabelProvider
+from pylibxai.Interfaces import LrpAdapter, LimePreviewAdapter, IGradientsAdapter, ModelLabelProvider
+from pylibxai.models.fusion import fuse_conv_bn
+from pylibxai.models.inference_backends import load_backend
+from pylibxai.models.quantization import CalibratedQuantizedModel
+from pylibxai.utils import get_available_device, set_torch_threads
 
 path_sota = str(Path.home() / 'Desktop' / 'pylibxai' / 'pylibxai' / 'models' / 'sota-music-tagging-models')
 sys.path.append(path_sota)
@@ -17,16 +21,24 @@ from training.eval import Predict  # can only be imported after appending path_s
 
 TAGS = ['genre---downtempo', 'genre---ambient', 'genre---rock', 'instrument---synthesizer', 'genre---atmospheric', 'genre---indie', 'instrument---electricpiano', 'genre---newage', 'instrument---strings', 'instrument---drums', 'instrument---drummachine', 'genre---techno', 'instrument---guitar', 'genre---alternative', 'genre---easylistening', 'genre---instrumentalpop', 'genre---chillout', 'genre---metal', 'mood/theme---happy', 'genre---lounge', 'genre---reggae', 'genre---popfolk', 'genre---orchestral', 'instrument---acousticguitar', 'genre---poprock', 'instrument---piano', 'genre---trance', 'genre---dance', 'instrument---electricguitar', 'genre---soundtrack', 'genre---house', 'genre---hiphop', 'genre---classical', 'mood/theme---energetic', 'genre---electronic', 'genre---world', 'genre---experimental', 'instrument---violin', 'genre---folk', 'mood/theme---emotional', 'instrument---voice', 'instrument---keyboard', 'genre---pop', 'instrument---bass', 'instrument---computer', 'mood/theme---film', 'genre---triphop', 'genre---jazz', 'genre---funk', 'mood/theme---relaxing']
 
-class HarmonicCNN(LimeAdapter, IGradientsAdapter, LrpAdapter, ModelLabelProvider):
-    def __init__(self, device='cuda'):
+class HarmonicCNN(LimePreviewAdapter, IGradientsAdapter, LrpAdapter, ModelLabelProvider):
+    def __init__(self, device='cuda', num_threads=None, num_interop_threads=None, channels_last=True,
+                 backend='eager', fuse_batch_norm=True):
         """Harmonic CNN model adapter for music tagging.
+
+        Args:
+            device: 'cuda' or 'cpu', falls back to 'cpu' without a GPU
+            num_threads: intra-op threads of torch, None keeps torch's default
+            num_interop_threads: inter-op threads of torch, None keeps torch's default
+            channels_last: store the model in channels_last format on CPU, faster for its 2D convolutions
+            backend: 'eager', 'torchscript' or 'onnxruntime', runs LIME predictions; IG and LRP
+                     always use the eager model
+            fuse_batch_norm: fold the BatchNorms into the convolutions of the model copy used for
+                             LIME predictions, see fuse_conv_bn
         """
         assert device in ['cpu', 'cuda']
-        
-        if device == 'cuda' and torch.cuda.is_available():
-            self.device = 'cuda'
-        else:
-            self.device = 'cpu'
+        self.device = get_available_device(device)
+        set_torch_threads(num_threads, num_interop_threads)
             
         path_models = os.path.join(path_sota, 'models')
 
@@ -40,10 +52,22 @@ class HarmonicCNN(LimeAdapter, IGradientsAdapter, LrpAdapter, ModelLabelProvider
         config.input_length = 5 * 16000
         config.batch_size = 1  # we analyze one chunk of the audio
         self.model = Predict.get_model(config)
-        
-        self.model_state = torch.load(config.model_load_path, map_location=self.device)
-        self.model.cuda()
+
+        # weights are loaded once, every predict function shares the model
+        self.model.load_state_dict(torch.load(config.model_load_path, map_location=self.device))
+        self.model.to(self.device)
+        if channels_last and self.device == 'cpu':
+            self.model.to(memory_format=torch.channels_last)
+        self.model.eval()
         self.config = config
+
+        example_input = torch.randn(2, config.input_length, generator=torch.Generator().manual_seed(0))
+        # IG and LRP keep the unfused model, LRP propagates relevance through every BatchNorm
+        self.fused_model = fuse_conv_bn(self.model) if fuse_batch_norm else self.model
+        self.inference_model = load_backend(backend, self.fused_model, example_input.to(self.device),
+                                            config.model_load_path, self.device,
+                                            variant='fused' if fuse_batch_norm else None)
+        self.preview_model = None  # int8 copy of the last preview predict function
     
     def get_label_mapping(self):
         """Returns the label mapping for the model."""
@@ -56,18 +80,12 @@ class HarmonicCNN(LimeAdapter, IGradientsAdapter, LrpAdapter, ModelLabelProvider
             raise ValueError(f"Target '{target}' not found in label mapping.")
 
     def get_igrad_predict_fn(self) -> Callable[[torch.Tensor], torch.Tensor]:
-        self.model.load_state_dict(self.model_state)
-        self.model.cuda()
-        self.model.eval()
-
         def predict_fn(x):
             # Make sure input requires gradients for Integrated Gradients
             if not x.requires_grad:
                 x = x.detach().clone().requires_grad_(True)
             
-            # Move to GPU if not already there
-            if x.device.type != 'cuda':
-                x = x.cuda()
+            x = x.to(self.device)
                 
             # Forward pass through the model
             output_dict = self.model(x)
@@ -82,46 +100,45 @@ class HarmonicCNN(LimeAdapter, IGradientsAdapter, LrpAdapter, ModelLabelProvider
     
     def get_lrp_predict_fn(self) -> torch.nn.Module:
         class HarmonicCNNWrapper(torch.nn.Module):
-            def __init__(self, model, device, model_state):
+            def __init__(self, model, device):
                 super(HarmonicCNNWrapper, self).__init__()
-                self.model_state = model_state
                 self.model = model 
                 self.device = device
 
             def forward(self, x):
-                self.model.load_state_dict(self.model_state)
-                self.model.cuda()
-                self.model.eval()
-
                 # Make sure input requires gradients for Integrated Gradients
                 if not x.requires_grad:
                     x = x.detach().clone().requires_grad_(True)
 
-                if x.device.type != 'cuda':
-                    x = x.cuda()
+                x = x.to(self.device)
 
                 output_dict = self.model(x)
                 output_tensor = output_dict
                 return output_tensor
 
-        return HarmonicCNNWrapper(self.model, self.device, self.model_state)
+        return HarmonicCNNWrapper(self.model, self.device)
 
     def get_lime_predict_fn(self) -> Callable[[np.ndarray], np.ndarray]:
-        self.model.load_state_dict(self.model_state)
-        self.model.cuda()
-        self.model.eval()
-
+        return self._lime_predict_fn(self.inference_model)
+
+    def get_lime_preview_predict_fn(self, spectral=False) -> Callable[[np.ndarray], np.ndarray]:
+        if spectral:
+            raise ValueError('HarmonicCNN has no spectral LIME predict function.')
+        if self.device != 'cpu':
+            # int8 kernels run on the CPU only, slower than the full precision model on the GPU
+            warnings.warn(f'LIME previews run on the CPU only, predicting with the full precision model on '
+                          f'{self.device} instead.')
+            return self.get_lime_predict_fn()
+        # calibrated on the first batch of the neighborhood, every explanation quantizes its own copy
+        self.preview_model = CalibratedQuantizedModel(self.fused_model)
+        return self._lime_predict_fn(self.preview_model)
+
+    def _lime_predict_fn(self, model):
         def predict_fn(x_array):
-            # based on code from sota repo
-            audio = torch.zeros(len(x_array), self.config.input_length)
-            for i in range(len(x_array)):
-                audio[i] = torch.Tensor(x_array[i]).unsqueeze(0)
-            # audio as an input tensor is created from all
-            # audio slices passed as the function's argument.
-            audio = audio.cuda()
-            audio = Variable(audio)
-            output_dict = self.model(audio) # inference here (input is passed into model)
-            output_tensor = output_dict.detach().cpu().numpy()
-            return np.array(output_tensor)
+            # audio slices passed as the function's argument form one input batch
+            audio = torch.as_tensor(np.asarray(x_array, dtype=np.float32)).to(self.device)
+            with torch.inference_mode():
+                output_tensor = model(audio)
+            return output_tensor.cpu().numpy()
 
         return predict_fn
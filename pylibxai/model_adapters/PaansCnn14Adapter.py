@@ -1,10 +1,15 @@
+import warnings
+
 import torch
 from torch.autograd import Variable
 from .panns_inference import Cnn14, labels
 import numpy as np
 
-from pylibxai.Interfaces import LimeAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapter
-from utils import get_install_path
+from pylibxai.Interfaces import SpectralLimeAdapter, LimePreviewAdapter, StftFrontEnd, IGradientsAdapter, ModelLabelProvider, LrpAdapter
+from pylibxai.models.fusion import fuse_conv_bn
+from pylibxai.models.inference_backends import load_backend
+from pylibxai.models.quantization import CalibratedQuantizedModel
+from pylibxai.utils import get_install_path, get_available_device, set_torch_threads
 
 def move_data_to_device(x, device):
     if 'float' in str(x.dtype):
@@ -16,15 +21,34 @@ def move_data_to_device(x, device):
 
     return x.to(device)
 
-class Cnn14Adapter(LimeAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapter):
-    def __init__(self, device='cuda'):
+class Cnn14SpectrogramHead(torch.nn.Module):
+    """Cnn14 from the power spectrogram to the clipwise output, the part run by inference backends"""
+    def __init__(self, model):
+        super(Cnn14SpectrogramHead, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model.forward_spectrogram(x)['clipwise_output']
+
+class Cnn14Adapter(SpectralLimeAdapter, LimePreviewAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapter):
+    def __init__(self, device='cuda', num_threads=None, num_interop_threads=None, channels_last=True,
+                 backend='eager', fuse_batch_norm=True):
         """Audio tagging inference wrapper.
+
+        Args:
+            device: 'cuda' or 'cpu', falls back to 'cpu' without a GPU
+            num_threads: intra-op threads of torch, None keeps torch's default
+            num_interop_threads: inter-op threads of torch, None keeps torch's default
+            channels_last: store the model in channels_last format on CPU, faster for its 2D convolutions
+            backend: 'eager', 'torchscript' or 'onnxruntime', runs LIME predictions after the STFT;
+                     IG, LRP and inference always use the eager model
+            fuse_batch_norm: fold the BatchNorms into the convolutions of the model copy used for
+                             LIME predictions and inference, see fuse_conv_bn
         """
         
         assert device in ['cpu', 'cuda']
-        if device == 'cuda':
-            assert torch.cuda.is_available()
-        self.device = device
+        self.device = get_available_device(device)
+        set_torch_threads(num_threads, num_interop_threads)
         checkpoint_path = str(get_install_path() / 'pylibxai' / 'models' / 'audioset_tagging_cnn' / 'Cnn14_mAP=0.431.pth')
        
         self.label_to_id = {}
@@ -43,8 +67,10 @@ class Cnn14Adapter(LimeAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapte
                 self.label_to_id[display_name] = int(index)
                 self.id_to_label[int(index)] = display_name
 
-        self.model = Cnn14(sample_rate=32000, window_size=1024, 
-            hop_size=320, mel_bins=64, fmin=50, fmax=14000, 
+        self.window_size = 1024
+        self.hop_size = 320
+        self.model = Cnn14(sample_rate=32000, window_size=self.window_size, 
+            hop_size=self.hop_size, mel_bins=64, fmin=50, fmax=14000, 
             classes_num=self.classes_num)
 
         checkpoint = torch.load(checkpoint_path, map_location=self.device)
@@ -57,6 +83,28 @@ class Cnn14Adapter(LimeAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapte
             self.model = torch.nn.DataParallel(self.model)
         else:
             print('Using CPU.')
+            if channels_last:
+                self.model.to(memory_format=torch.channels_last)
+        self.model.eval()
+
+        # DataParallel only wraps forward, the spectrogram stages are called on the module
+        module = getattr(self.model, 'module', self.model)
+        self.spectrogram_extractor = module.spectrogram_extractor
+        with torch.no_grad():
+            example_input = self.spectrogram_extractor(
+                torch.randn(2, 5 * 16000, generator=torch.Generator().manual_seed(0)).to(self.device))
+        # IG and LRP keep the unfused model, LRP propagates relevance through every BatchNorm
+        self.fused_model = fuse_conv_bn(module) if fuse_batch_norm else module
+        # inference and eager LIME predictions spread batches over the GPUs like self.model,
+        # exported backends are exported from the unwrapped head
+        parallel = 'cuda' in str(self.device)
+        self.parallel_fused_model = torch.nn.DataParallel(self.fused_model) if parallel else self.fused_model
+        head = Cnn14SpectrogramHead(self.fused_model)
+        if parallel and backend == 'eager':
+            head = torch.nn.DataParallel(head)
+        self.inference_model = load_backend(backend, head, example_input, checkpoint_path, self.device,
+                                            variant='fused' if fuse_batch_norm else None)
+        self.preview_model = None  # int8 copy of the last preview predict function
     
     def get_label_mapping(self):
         """Returns the label mapping for the model."""
@@ -71,9 +119,8 @@ class Cnn14Adapter(LimeAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapte
     def inference(self, audio):
         audio = move_data_to_device(audio, self.device)
 
-        with torch.no_grad():
-            self.model.eval()
-            output_dict = self.model(audio, None)
+        with torch.inference_mode():
+            output_dict = self.parallel_fused_model(audio, None)
 
         clipwise_output = output_dict['clipwise_output'].data.cpu().numpy()
         embedding = output_dict['embedding'].data.cpu().numpy()
@@ -133,19 +180,44 @@ class Cnn14Adapter(LimeAdapter, IGradientsAdapter, ModelLabelProvider, LrpAdapte
         return GtzanNNWrapper(self.model, self.device)
 
     def get_lime_predict_fn(self, input_length=None):
+        return self._lime_predict_fn(self.inference_model, input_length)
+
+    def _lime_predict_fn(self, model, input_length=None):
         length = 5 * 16000 if not input_length else input_length
         def predict_fn(x_array):
-            x = torch.zeros(len(x_array), length)
-            for i in range(len(x_array)):
-                x[i] = torch.Tensor(x_array[i]).unsqueeze(0)
+            x = torch.as_tensor(np.asarray(x_array, dtype=np.float32)).to(self.device)
+            if x.shape[1] != length:
+                raise ValueError(f'Expected LIME inputs of {length} samples, got {x.shape[1]}.')
 
-            x = move_data_to_device(x, self.device)
+            with torch.inference_mode():
+                y = model(self.spectrogram_extractor(x))
+            return y.cpu().numpy()
+        return predict_fn
+
+    def get_stft_front_end(self):
+        return StftFrontEnd(n_fft=self.window_size, hop_length=self.hop_size)
 
-            with torch.no_grad():
-                self.model.eval()
-                y = self.model(x, None)
-                y = y['clipwise_output'].data.cpu().numpy()
-                return np.array(y)
+    def get_lime_spectral_predict_fn(self):
+        return self._lime_spectral_predict_fn(self.inference_model)
 
-            return None
+    def _lime_spectral_predict_fn(self, model):
+        def predict_fn(spectra):
+            spectra = torch.from_numpy(np.asarray(spectra)).to(self.device)
+            # power spectrogram in the (batch, 1, time_steps, freq_bins) layout of spectrogram_extractor
+            x = (spectra.abs() ** 2).transpose(1, 2).unsqueeze(1)
+            with torch.inference_mode():
+                y = model(x)
+            return y.cpu().numpy()
         return predict_fn
+
+    def get_lime_preview_predict_fn(self, spectral=False):
+        if self.device != 'cpu':
+            # int8 kernels run on the CPU only, slower than the full precision model on the GPU
+            warnings.warn(f'LIME previews run on the CPU only, predicting with the full precision model on '
+                          f'{self.device} instead.')
+            return self.get_lime_spectral_predict_fn() if spectral else self.get_lime_predict_fn()
+        # calibrated on the first batch of the neighborhood, every explanation quantizes its own copy
+        self.preview_model = CalibratedQuantizedModel(Cnn14SpectrogramHead(self.fused_model))
+        if spectral:
+            return self._lime_spectral_predict_fn(self.preview_model)
+        return self._lime_predict_fn(self.preview_model)
@@ -131,6 +131,12 @@ class Cnn14(nn.Module):
         Input: (batch_size, data_length)"""
 
         x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
+        return self.forward_spectrogram(x, mixup_lambda)
+
+    def forward_spectrogram(self, x, mixup_lambda=None):
+        """
+        Input: power spectrogram (batch_size, 1, time_steps, freq_bins), the output of spectrogram_extractor"""
+
         x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
         
         x = x.transpose(1, 3)
@@ -25,7 +25,7 @@ class GtzanPredictor:
     def load_model(self):
         # Load model
         self.model = CNN(num_classes=len(gtzan_genres))
-        state_dict = torch.load(self.model_path)
+        state_dict = torch.load(self.model_path, map_location=self.device)
         self.model.load_state_dict(state_dict)
         self.model.to(self.device)
 
@@ -1,7 +1,15 @@
+import threading
+
+import torch
 import torchvision
 import torchaudio
 import torch.nn.functional as F
 
+SAMPLE_RATE = 22050
+N_FFT = 1024
+HOP_LENGTH = N_FFT // 2  # MelSpectrogram default
+N_MELS = 128
+
 TRANSFORM = torchvision.transforms.Compose([
     torchaudio.transforms.MelSpectrogram(sample_rate=22050,
                                          n_fft=1024,
@@ -20,24 +28,73 @@ def pad_or_truncate_waveform(wav, target_len):
         wav = wav[:, :target_len]  # truncate
     return wav
 
-def convert_to_spectrogram(input_tensor, device, target_len=22050*30):
-    input_tensor = pad_or_truncate_waveform(input_tensor, target_len=target_len)
-    t = torchvision.transforms.Compose([
-        torchaudio.transforms.MelSpectrogram(sample_rate=22050,
-                                             n_fft=1024,
-                                             f_min=0.0,
-                                             f_max=11025.0,
-                                             n_mels=128).to(device),
-        torchaudio.transforms.AmplitudeToDB().to(device)
-    ])
-    input_tensor = t(input_tensor).to(device)
+_mel_transforms = {}
+_mel_transforms_lock = threading.Lock()
+
+def get_mel_transform(device, sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS, dtype=torch.float32):
+    """
+    Returns the mel spectrogram and decibel transform of a configuration, built once per process.
+
+    Args:
+        device: device of the filterbank and window tensors
+        sr (int): sampling rate of the waveforms
+        n_fft (int): FFT size, the hop is n_fft // 2
+        n_mels (int): number of mel bins
+        dtype (torch.dtype): floating point type of the waveforms
+
+    Returns:
+        torch.nn.Sequential: MelSpectrogram followed by AmplitudeToDB
+    """
+    device = torch.device(device)
+    key = (device, sr, n_fft, n_mels, dtype)
+    with _mel_transforms_lock:
+        if key not in _mel_transforms:
+            # built outside of inference mode, the cached tensors are also used for gradients
+            with torch.inference_mode(False):
+                _mel_transforms[key] = torch.nn.Sequential(
+                    torchaudio.transforms.MelSpectrogram(sample_rate=sr,
+                                                         n_fft=n_fft,
+                                                         f_min=0.0,
+                                                         f_max=sr / 2,
+                                                         n_mels=n_mels),
+                    torchaudio.transforms.AmplitudeToDB()
+                ).to(device=device, dtype=dtype)
+        return _mel_transforms[key]
+
+def waveforms_to_spectrogram(waveforms, device, target_len=SAMPLE_RATE*30):
+    """
+    Batched convert_to_spectrogram.
 
+    Args:
+        waveforms (torch.Tensor): waveforms of shape [B, T]
+
+    Returns:
+        torch.Tensor: model input of shape [B, 1, n_mels, frames]
+    """
+    waveforms = pad_or_truncate_waveform(waveforms.to(device), target_len=target_len)
+    return get_mel_transform(device, dtype=waveforms.dtype)(waveforms).unsqueeze(1)
+
+def convert_to_spectrogram(input_tensor, device, target_len=22050*30):
+    input_tensor = pad_or_truncate_waveform(input_tensor.to(device), target_len=target_len)
+    input_tensor = get_mel_transform(device, dtype=input_tensor.dtype)(input_tensor)
 
     if input_tensor.dim() == 2:
         input_tensor = input_tensor.unsqueeze(0).unsqueeze(0)
     elif input_tensor.dim() == 3:
         input_tensor = input_tensor.unsqueeze(0)
 
-    input_tensor = input_tensor.to(device)
-
     return input_tensor
+
+def spectrogram_to_model_input(spectrum, device):
+    """
+    Applies the nonlinear stages of convert_to_spectrogram to complex STFTs of its front end.
+
+    Args:
+        spectrum (torch.Tensor): complex STFTs of shape [B, N_FFT // 2 + 1, frames]
+
+    Returns:
+        torch.Tensor: model input of shape [B, 1, n_mels, frames]
+    """
+    power = spectrum.to(device).abs() ** 2
+    mel_spectrogram, amplitude_to_db = get_mel_transform(device, dtype=power.dtype)
+    return amplitude_to_db(mel_spectrogram.mel_scale(power)).unsqueeze(1)
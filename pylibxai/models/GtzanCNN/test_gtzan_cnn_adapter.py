@@ -0,0 +1,116 @@
+import pytest
+import numpy as np
+import torch
+from pathlib import Path
+
+from pylibxai.models.GtzanCNN.preprocessing import convert_to_spectrogram
+
+# the package imports every adapter, including those with heavy optional dependencies
+GtzanCNNAdapter = pytest.importorskip('pylibxai.model_adapters.GtzanCNNAdapter').GtzanCNNAdapter
+
+MODEL_PATH = Path(__file__).parent / 'gtzan_cnn.ckpt'
+
+
+@pytest.fixture(scope='module')
+def adapter():
+    return GtzanCNNAdapter(model_path=MODEL_PATH, device='cpu')
+
+
+class TestGtzanCNNLimePredictFn:
+    """Test the batched LIME predict function of GtzanCNNAdapter"""
+
+    def test_matches_per_sample_inference(self, adapter):
+        """Test batched predictions equal running the model on every waveform separately"""
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (3, 22050 * 5)).astype(np.float32)
+
+        predictions = adapter.get_lime_predict_fn()(x)
+
+        assert predictions.shape == (3, 10)
+        with torch.no_grad():
+            for prediction, waveform in zip(predictions, x):
+                expected = adapter.predictor.model(convert_to_spectrogram(torch.from_numpy(waveform[np.newaxis]), 'cpu'))
+                np.testing.assert_allclose(prediction, expected[0].numpy(), rtol=1e-4, atol=1e-4)
+
+    def test_does_not_log_per_sample(self, adapter, capsys):
+        """Test predicting a batch prints nothing"""
+        adapter.get_lime_predict_fn()(np.zeros((2, 22050), dtype=np.float32))
+
+        assert capsys.readouterr().out == ''
+
+
+class TestGtzanCNNCpuInference:
+    """Test the CPU inference mode of GtzanCNNAdapter"""
+
+    def test_missing_gpu_falls_back_to_cpu(self, monkeypatch):
+        """Test requesting CUDA without a GPU loads the model on the CPU"""
+        monkeypatch.setattr(torch.cuda, 'is_available', lambda: False)
+
+        adapter = GtzanCNNAdapter(model_path=MODEL_PATH, device='cuda')
+
+        assert adapter.device == 'cpu'
+        assert next(adapter.predictor.model.parameters()).device.type == 'cpu'
+
+    def test_channels_last_matches_contiguous(self, adapter):
+        """Test channels_last weights give the predictions of the contiguous model"""
+        contiguous = GtzanCNNAdapter(model_path=MODEL_PATH, device='cpu', channels_last=False)
+        x = np.random.RandomState(2).uniform(-0.5, 0.5, (2, 22050 * 5)).astype(np.float32)
+
+        assert adapter.predictor.model.layer1.conv.weight.is_contiguous(memory_format=torch.channels_last)
+        np.testing.assert_allclose(adapter.get_lime_predict_fn()(x), contiguous.get_lime_predict_fn()(x),
+                                   rtol=1e-4, atol=1e-4)
+
+    def test_sets_thread_counts(self):
+        """Test the adapter sizes torch's intra-op thread pool"""
+        num_threads = torch.get_num_threads()
+        try:
+            GtzanCNNAdapter(model_path=MODEL_PATH, device='cpu', num_threads=1)
+            assert torch.get_num_threads() == 1
+        finally:
+            torch.set_num_threads(num_threads)
+
+
+class TestGtzanCNNBackends:
+    """Test LIME predictions of GtzanCNNAdapter through exported backends"""
+
+    def test_torchscript_matches_eager(self, adapter, tmp_path):
+        """Test the TorchScript backend predicts like the eager model, which gradients keep using"""
+        model_path = tmp_path / 'gtzan_cnn.ckpt'
+        model_path.write_bytes(MODEL_PATH.read_bytes())
+        scripted = GtzanCNNAdapter(model_path=model_path, device='cpu', backend='torchscript')
+        x = np.random.RandomState(3).uniform(-0.5, 0.5, (3, 22050 * 5)).astype(np.float32)
+
+        assert len(list(tmp_path.glob('gtzan_cnn.ckpt.torchscript-*.pt'))) == 1
+        assert not isinstance(scripted.predictor.model, torch.jit.ScriptModule)
+        np.testing.assert_allclose(scripted.get_lime_predict_fn()(x), adapter.get_lime_predict_fn()(x),
+                                   rtol=1e-4, atol=1e-4)
+
+
+class TestGtzanCNNPreview:
+    """Test the quantized LIME preview of GtzanCNNAdapter"""
+
+    def test_preview_predicts_close_to_full_precision(self, adapter):
+        """Test the int8 preview model ranks the classes like the full precision model"""
+        x = np.random.RandomState(4).uniform(-0.5, 0.5, (2, 22050 * 5)).astype(np.float32)
+
+        preview = adapter.get_lime_preview_predict_fn()(x)
+        full = adapter.get_lime_predict_fn()(x)
+
+        assert adapter.preview_model is not adapter.predictor.model
+        np.testing.assert_array_equal(np.argmax(preview, axis=1), np.argmax(full, axis=1))
+        # int8 activations through five convolution blocks, logits move by up to a few percent of their range
+        np.testing.assert_allclose(preview, full, rtol=0.05, atol=0.25)
+
+
+class TestGtzanCNNFusion:
+    """Test LIME predictions of GtzanCNNAdapter run the BatchNorm-fused model copy"""
+
+    def test_fused_copy_predicts_like_the_model(self, adapter):
+        """Test LIME runs the fused copy while LRP and IG keep the BatchNorms"""
+        unfused = GtzanCNNAdapter(model_path=MODEL_PATH, device='cpu', fuse_batch_norm=False)
+        x = np.random.RandomState(5).uniform(-0.5, 0.5, (2, 22050 * 5)).astype(np.float32)
+
+        assert isinstance(adapter.fused_model.layer1.bn, torch.nn.Identity)
+        assert isinstance(adapter.predictor.model.layer1.bn, torch.nn.BatchNorm2d)
+        assert adapter.get_lrp_predict_fn().predictor.model is adapter.predictor.model
+        np.testing.assert_allclose(adapter.get_lime_predict_fn()(x), unfused.get_lime_predict_fn()(x),
+                                   rtol=1e-4, atol=1e-4)
@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+
+from pylibxai.Interfaces import StftFrontEnd
+from pylibxai.models.GtzanCNN.preprocessing import (
+    convert_to_spectrogram,
+    get_mel_transform,
+    spectrogram_to_model_input,
+    waveforms_to_spectrogram,
+    N_FFT,
+    HOP_LENGTH
+)
+
+
+class TestSpectralPreprocessing:
+    """Test GtzanCNN preprocessing from precomputed STFTs"""
+
+    def test_matches_waveform_preprocessing(self):
+        """Test mel spectrograms from front end STFTs equal those computed from waveforms"""
+        y = np.random.RandomState(0).uniform(-1, 1, (2, 20000)).astype(np.float32)
+        front_end = StftFrontEnd(n_fft=N_FFT, hop_length=HOP_LENGTH, input_length=22050)
+
+        spectral = spectrogram_to_model_input(torch.from_numpy(front_end.stft(y)), 'cpu')
+
+        assert spectral.shape == (2, 1, 128, 22050 // HOP_LENGTH + 1)
+        for row, waveform in zip(spectral, y):
+            expected = convert_to_spectrogram(torch.from_numpy(waveform[np.newaxis]), 'cpu', target_len=22050)
+            torch.testing.assert_close(row, expected[0], rtol=1e-4, atol=1e-3)
+
+
+class TestMelTransformCache:
+    """Test reuse of the mel spectrogram transforms"""
+
+    def test_transform_is_built_once(self):
+        """Test the transform of a configuration is cached and keyed by its dtype"""
+        transform = get_mel_transform('cpu')
+
+        assert get_mel_transform(torch.device('cpu')) is transform
+        assert get_mel_transform('cpu', dtype=torch.float64) is not transform
+        assert get_mel_transform('cpu', dtype=torch.float64)[0].mel_scale.fb.dtype == torch.float64
+
+    def test_batched_matches_single_waveforms(self):
+        """Test the batched entry point equals converting every waveform on its own"""
+        y = torch.from_numpy(np.random.RandomState(1).uniform(-1, 1, (3, 20000)).astype(np.float32))
+
+        batch = waveforms_to_spectrogram(y, 'cpu', target_len=22050)
+
+        assert batch.shape == (3, 1, 128, 22050 // HOP_LENGTH + 1)
+        for row, waveform in zip(batch, y):
+            torch.testing.assert_close(row, convert_to_spectrogram(waveform[None], 'cpu', target_len=22050)[0])
+
+    def test_cache_built_in_inference_mode_supports_gradients(self):
+        """Test transforms first built under inference_mode can be differentiated later"""
+        with torch.inference_mode():
+            get_mel_transform('cpu', n_mels=64)(torch.zeros(1, 4096))
+        y = torch.rand(1, 4096, requires_grad=True)
+
+        get_mel_transform('cpu', n_mels=64)(y).sum().backward()
+
+        assert y.grad is not None
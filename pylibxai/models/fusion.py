@@ -0,0 +1,45 @@
+import copy
+
+import torch
+from torch.nn.utils.fusion import fuse_conv_bn_eval, fuse_linear_bn_eval
+
+# blocks applying a BatchNorm directly to the output of a convolution or linear layer, by the
+# qualified name of the block and the (layer, batch norm) attribute pairs to fold
+FUSIBLE_BLOCKS = {
+    'pylibxai.models.GtzanCNN.model.Conv_2d': (('conv', 'bn'),),
+    'pylibxai.models.GtzanCNN.model.CNN': (('dense1', 'dense_bn'),),
+    'pylibxai.model_adapters.panns_inference.models.ConvBlock': (('conv1', 'bn1'), ('conv2', 'bn2')),
+    # sota-music-tagging-models is imported from its training directory
+    'modules.Conv_2d': (('conv', 'bn'),),
+}
+
+
+def _qualified_name(module):
+    return f'{type(module).__module__}.{type(module).__qualname__}'
+
+
+def fuse_conv_bn(model, blocks=None):
+    """
+    Returns an inference copy of model with BatchNorms folded into the preceding layer.
+
+    In eval mode a BatchNorm is an affine map of its input, so it can be folded into the weights
+    and bias of the convolution or linear layer it follows; it is then replaced by an Identity.
+    The copy predicts like model in eval mode, model itself keeps its BatchNorms for training
+    and for the per-layer relevances of LRP.
+
+    :param model: torch.nn.Module
+    :param blocks: dict mapping qualified block class names to (layer, batch norm) attribute
+                   pairs, see FUSIBLE_BLOCKS
+    :return: fused copy of model in eval mode
+    """
+    blocks = FUSIBLE_BLOCKS if blocks is None else blocks
+    fused = copy.deepcopy(model).eval()
+    for module in fused.modules():
+        for layer_name, bn_name in blocks.get(_qualified_name(module), ()):
+            layer, bn = getattr(module, layer_name), getattr(module, bn_name)
+            if isinstance(bn, torch.nn.Identity):
+                continue
+            fuse = fuse_linear_bn_eval if isinstance(layer, torch.nn.Linear) else fuse_conv_bn_eval
+            setattr(module, layer_name, fuse(layer, bn))
+            setattr(module, bn_name, torch.nn.Identity())
+    return fused
@@ -0,0 +1,149 @@
+import os
+import tempfile
+
+import torch
+
+BACKENDS = ('eager', 'torchscript', 'onnxruntime')
+
+
+class EagerBackend(object):
+    """Runs the PyTorch model as is."""
+    name = 'eager'
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, x):
+        with torch.inference_mode():
+            return self.model(x)
+
+
+class TorchScriptBackend(object):
+    """
+    Runs a frozen TorchScript export of the model.
+
+    Models are scripted where possible, so the batch size stays dynamic, and traced otherwise.
+    """
+    name = 'torchscript'
+    extension = '.pt'
+
+    def __init__(self, artifact_path, device):
+        self.module = torch.jit.load(artifact_path, map_location=device)
+
+    @staticmethod
+    def export(model, example_input, path):
+        try:
+            module = torch.jit.script(model)
+        except Exception:
+            module = torch.jit.trace(model, example_input)
+        torch.jit.freeze(module.eval()).save(path)
+
+    def __call__(self, x):
+        with torch.inference_mode():
+            return self.module(x)
+
+
+class OnnxRuntimeBackend(object):
+    """Runs an ONNX export of the model with ONNX Runtime on the CPU."""
+    name = 'onnxruntime'
+    extension = '.onnx'
+
+    def __init__(self, artifact_path, device):
+        if device != 'cpu':
+            raise ValueError('The onnxruntime backend runs on the CPU only.')
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        # same thread pools as the rest of the adapter, see set_torch_threads
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.inter_op_num_threads = torch.get_num_interop_threads()
+        self.session = onnxruntime.InferenceSession(artifact_path, options, providers=['CPUExecutionProvider'])
+
+    @staticmethod
+    def export(model, example_input, path):
+        # weights are kept inside the .onnx file, the cache moves a single file into place
+        torch.onnx.export(model, (example_input,), path,
+                          external_data=False,
+                          input_names=['input'],
+                          output_names=['output'],
+                          dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}})
+
+    def __call__(self, x):
+        output, = self.session.run(None, {'input': x.detach().cpu().numpy()})
+        return torch.from_numpy(output)
+
+
+_EXPORTED_BACKENDS = {backend.name: backend for backend in (TorchScriptBackend, OnnxRuntimeBackend)}
+
+
+def artifact_path(checkpoint_path, backend, example_input, variant=None):
+    """
+    :param variant: optional name of the model variant exported, e.g. 'fused'
+    :return: path of the export of the model in checkpoint_path, next to the checkpoint; the
+             input shape is part of the name as traced exports may depend on it
+    """
+    shape = 'x'.join(str(size) for size in example_input.shape[1:])
+    name = f'{backend}-{variant}' if variant else backend
+    return f'{checkpoint_path}.{name}-{shape}{_EXPORTED_BACKENDS[backend].extension}'
+
+
+def check_parity(reference, backend, x, rtol=1e-3, atol=1e-4):
+    """
+    Compares the outputs of two backends.
+
+    :param reference: backend the outputs are checked against, usually EagerBackend
+    :param backend: backend under test
+    :param x: input batch
+    :return: maximum absolute difference of the outputs
+    :raises RuntimeError: if the outputs differ by more than rtol and atol
+    """
+    expected = reference(x).cpu()
+    actual = backend(x).cpu()
+    difference = (actual - expected).abs()
+    if actual.shape != expected.shape or torch.any(difference > atol + rtol * expected.abs()):
+        raise RuntimeError(f'Outputs of the {backend.name} backend differ from the {reference.name} backend '
+                           f'by up to {difference.max().item():.3g}.')
+    return difference.max().item()
+
+
+def load_backend(backend, model, example_input, checkpoint_path, device='cpu', rtol=1e-3, atol=1e-4, variant=None):
+    """
+    Returns a function running model through backend, for LIME and batch prediction only.
+
+    Exports are cached next to checkpoint_path and created again when the checkpoint is newer.
+    Every exported backend is checked against the eager model on a batch one larger than the
+    example input before it is returned.
+
+    :param backend: one of BACKENDS
+    :param model: torch.nn.Module in eval mode mapping a batch tensor to a tensor
+    :param example_input: representative input batch used to export the model
+    :param checkpoint_path: checkpoint the model weights were loaded from
+    :param device: device the backend runs on
+    :param rtol: relative tolerance of the parity check
+    :param atol: absolute tolerance of the parity check
+    :param variant: optional name of the model variant, keeps exports of variants apart
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Invalid backend: {backend}. Must be one of {", ".join(BACKENDS)}.')
+    eager = EagerBackend(model)
+    if backend == 'eager':
+        return eager
+
+    backend_class = _EXPORTED_BACKENDS[backend]
+    path = artifact_path(checkpoint_path, backend, example_input, variant)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(checkpoint_path):
+        # exported to a temporary file first, so concurrent runs never load partial artifacts
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        os.close(fd)
+        try:
+            backend_class.export(model, example_input, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # including weights a failed export may have written next to the temporary file
+            for partial_path in (tmp_path, tmp_path + '.data'):
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            raise
+
+    exported = backend_class(path, device)
+    check_parity(eager, exported, torch.cat([example_input, example_input[:1].flip(-1)]), rtol, atol)
+    return exported
@@ -0,0 +1,102 @@
+import copy
+
+import torch
+
+from pylibxai.models.fusion import _qualified_name
+
+# layers run with int8 kernels, between a quantization of their input and a dequantization of
+# their output; normalizations, activations and pooling around them stay in float
+STATIC_QUANTIZED_LAYERS = (torch.nn.Conv1d, torch.nn.Conv2d, torch.nn.Linear)
+
+# blocks running on quantized tensors from their first convolution to their output, by qualified
+# name; quantized as a whole, their activations, pooling and dropout run in int8 as well
+QUANTIZED_BLOCKS = {
+    'pylibxai.models.GtzanCNN.model.Conv_2d',
+    # with the 'avg' pooling of Cnn14, 'avg+max' adds two quantized tensors
+    'pylibxai.model_adapters.panns_inference.models.ConvBlock',
+    # sota-music-tagging-models is imported from its training directory
+    'modules.Conv_2d',
+}
+
+
+class _QuantizedModule(torch.nn.Module):
+    """Runs module on int8 activations, the surrounding model keeps passing float tensors"""
+    def __init__(self, module, qconfig):
+        super(_QuantizedModule, self).__init__()
+        self.quant = torch.ao.quantization.QuantStub()
+        self.module = module
+        self.dequant = torch.ao.quantization.DeQuantStub()
+        self.qconfig = qconfig
+
+    def forward(self, x, *args, **kwargs):
+        return self.dequant(self.module(self.quant(x), *args, **kwargs))
+
+
+def _candidates(module, layers, blocks):
+    """Yields the outermost blocks and the layers outside of blocks"""
+    for child in module.children():
+        if _qualified_name(child) in blocks or isinstance(child, layers):
+            yield child
+        else:
+            yield from _candidates(child, layers, blocks)
+
+
+def _wrap(module, selected, qconfig):
+    for name, child in module.named_children():
+        if child in selected:
+            setattr(module, name, _QuantizedModule(child, qconfig))
+        else:
+            _wrap(child, selected, qconfig)
+
+
+def quantize_static(model, calibration_input, layers=STATIC_QUANTIZED_LAYERS, blocks=None):
+    """
+    Returns an int8 copy of model for fast previews, model itself is left unchanged.
+
+    The weights of the blocks and layers are quantized ahead of time, their input activations
+    with the ranges observed on calibration_input. Blocks and layers not run on
+    calibration_input stay in float. Quantized copies run on the CPU only.
+
+    :param model: torch.nn.Module on the CPU in eval mode
+    :param calibration_input: input batch representative of the inputs of the copy
+    :param layers: tuple of the layer types quantized outside of blocks
+    :param blocks: set of qualified names of blocks quantized as a whole, see QUANTIZED_BLOCKS
+    """
+    blocks = QUANTIZED_BLOCKS if blocks is None else blocks
+    if any(parameter.device.type != 'cpu' for parameter in model.parameters()):
+        raise ValueError('Static quantization requires a model on the CPU.')
+    quantized = copy.deepcopy(model).eval()
+
+    used = set()
+    hooks = [candidate.register_forward_pre_hook(lambda module, args: used.add(module))
+             for candidate in _candidates(quantized, layers, blocks)]
+    with torch.inference_mode():
+        quantized(calibration_input)
+    for hook in hooks:
+        hook.remove()
+
+    _wrap(quantized, used, torch.ao.quantization.get_default_qconfig(torch.backends.quantized.engine))
+    torch.ao.quantization.prepare(quantized, inplace=True)
+    with torch.inference_mode():
+        quantized(calibration_input)
+    return torch.ao.quantization.convert(quantized, inplace=True)
+
+
+class CalibratedQuantizedModel(torch.nn.Module):
+    """
+    int8 copy of model made by quantize_static, calibrated on the first batch it predicts.
+
+    LIME predicts perturbations of a single recording, so the first batch of a neighborhood
+    covers the activation ranges of the rest of it.
+    """
+    def __init__(self, model, layers=STATIC_QUANTIZED_LAYERS, blocks=None):
+        super(CalibratedQuantizedModel, self).__init__()
+        self.model = model
+        self.layers = layers
+        self.blocks = blocks
+        self.quantized = None
+
+    def forward(self, x):
+        if self.quantized is None:
+            self.quantized = quantize_static(self.model, x, self.layers, self.blocks)
+        return self.quantized(x)
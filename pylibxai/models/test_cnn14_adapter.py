@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+import numpy as np
+import torch
+
+pytest.importorskip('torchlibrosa')
+cnn14_adapter = pytest.importorskip('pylibxai.model_adapters.PaansCnn14Adapter')
+
+INSTALL_PATH = Path(__file__).parents[2]
+
+
+@pytest.fixture(scope='module')
+def adapter():
+    torch.manual_seed(0)
+    model = cnn14_adapter.Cnn14(sample_rate=32000, window_size=1024, hop_size=320, mel_bins=64, fmin=50, fmax=14000,
+                                classes_num=527)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(cnn14_adapter, 'get_install_path', lambda: INSTALL_PATH)
+        monkeypatch.setattr(cnn14_adapter.torch, 'load', lambda path, map_location=None: {'model': model.state_dict()})
+        return cnn14_adapter.Cnn14Adapter(device='cpu')
+
+
+class TestCnn14SpectralPredictFn:
+    """Test the spectral LIME predict function of Cnn14Adapter"""
+
+    def test_matches_waveform_model(self, adapter):
+        """Test predictions from front end STFTs equal the model run on the unmasked waveforms"""
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (2, 16000)).astype(np.float32)
+
+        predictions = adapter.get_lime_spectral_predict_fn()(adapter.get_stft_front_end().stft(x))
+
+        with torch.inference_mode():
+            expected = adapter.model(torch.from_numpy(x), None)['clipwise_output'].numpy()
+        assert predictions.shape == (2, 527)
+        np.testing.assert_allclose(predictions, expected, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,71 @@
+import pytest
+import torch
+
+from pylibxai.models.GtzanCNN.model import CNN
+from pylibxai.models.fusion import fuse_conv_bn
+
+
+def randomize_batch_norms(model, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    for module in model.modules():
+        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+            features = module.num_features
+            module.running_mean.copy_(torch.randn(features, generator=generator))
+            module.running_var.copy_(torch.rand(features, generator=generator) + 0.5)
+            module.weight.data.copy_(torch.randn(features, generator=generator))
+            module.bias.data.copy_(torch.randn(features, generator=generator))
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    model = CNN(num_classes=10)
+    randomize_batch_norms(model)
+    return model.eval()
+
+
+class TestConvBatchNormFusion:
+    """Test folding BatchNorms into the preceding layers"""
+
+    def test_fused_copy_matches_model(self, model):
+        """Test the fused copy is numerically equivalent to the model in eval mode"""
+        x = torch.randn(3, 1, 128, 1292, generator=torch.Generator().manual_seed(1))
+
+        fused = fuse_conv_bn(model)
+
+        with torch.inference_mode():
+            torch.testing.assert_close(fused(x), model(x), rtol=1e-4, atol=1e-4)
+
+    def test_batch_norms_are_removed_from_the_copy_only(self, model):
+        """Test the copy has no BatchNorm after its layers while the model keeps them for LRP and IG"""
+        fused = fuse_conv_bn(model)
+
+        for name in ['layer1', 'layer2', 'layer3', 'layer4', 'layer5']:
+            assert isinstance(getattr(fused, name).bn, torch.nn.Identity)
+            assert isinstance(getattr(model, name).bn, torch.nn.BatchNorm2d)
+        assert isinstance(fused.dense_bn, torch.nn.Identity)
+        # normalizes the input before the zero padding of the first convolution, not foldable
+        assert isinstance(fused.input_bn, torch.nn.BatchNorm2d)
+        assert not fused.training
+
+    def test_fused_copy_keeps_channels_last(self, model):
+        """Test fusion keeps the memory format of channels_last models"""
+        model.to(memory_format=torch.channels_last)
+
+        fused = fuse_conv_bn(model)
+
+        assert fused.layer1.conv.weight.is_contiguous(memory_format=torch.channels_last)
+
+    def test_fuses_panns_conv_blocks(self):
+        """Test both convolutions of a PANNs ConvBlock are fused"""
+        models = pytest.importorskip('pylibxai.model_adapters.panns_inference.models')
+        block = models.ConvBlock(4, 8)
+        randomize_batch_norms(block)
+        block.eval()
+        x = torch.randn(2, 4, 16, 16)
+
+        fused = fuse_conv_bn(block)
+
+        assert isinstance(fused.bn1, torch.nn.Identity) and isinstance(fused.bn2, torch.nn.Identity)
+        with torch.inference_mode():
+            torch.testing.assert_close(fused(x), block(x), rtol=1e-4, atol=1e-4)
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+import torch
+
+from pylibxai.models.GtzanCNN.model import CNN
+from pylibxai.models.inference_backends import (
+    EagerBackend,
+    TorchScriptBackend,
+    artifact_path,
+    check_parity,
+    load_backend
+)
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return CNN(num_classes=10).eval()
+
+
+@pytest.fixture
+def checkpoint(model, tmp_path):
+    path = str(tmp_path / 'model.ckpt')
+    torch.save(model.state_dict(), path)
+    return path
+
+
+@pytest.fixture
+def example_input():
+    return torch.randn(2, 1, 128, 1292, generator=torch.Generator().manual_seed(1))
+
+
+class TestInferenceBackends:
+    """Test exported inference backends"""
+
+    def test_eager_backend_runs_the_model(self, model, checkpoint, example_input):
+        """Test the eager backend is the model without autograd"""
+        backend = load_backend('eager', model, example_input, checkpoint)
+
+        with torch.no_grad():
+            torch.testing.assert_close(backend(example_input), model(example_input))
+        assert os.listdir(os.path.dirname(checkpoint)) == ['model.ckpt']
+
+    def test_torchscript_matches_eager(self, model, checkpoint, example_input):
+        """Test the TorchScript export is cached next to the checkpoint and matches any batch size"""
+        backend = load_backend('torchscript', model, example_input, checkpoint)
+        x = torch.randn(5, 1, 128, 1292)
+
+        assert sorted(os.listdir(os.path.dirname(checkpoint))) == [
+            'model.ckpt', os.path.basename(artifact_path(checkpoint, 'torchscript', example_input))]
+        assert check_parity(EagerBackend(model), backend, x) < 1e-4
+
+    def test_export_is_reused(self, model, checkpoint, example_input, monkeypatch):
+        """Test an export newer than the checkpoint is loaded instead of exported again"""
+        load_backend('torchscript', model, example_input, checkpoint)
+
+        def fail(*args):
+            raise AssertionError('model exported again')
+
+        monkeypatch.setattr(TorchScriptBackend, 'export', staticmethod(fail))
+        load_backend('torchscript', model, example_input, checkpoint)
+
+    def test_stale_export_is_replaced(self, model, checkpoint, example_input):
+        """Test a checkpoint newer than its export triggers a new export"""
+        path = artifact_path(checkpoint, 'torchscript', example_input)
+        load_backend('torchscript', model, example_input, checkpoint)
+        os.utime(path, (0, 0))
+
+        load_backend('torchscript', model, example_input, checkpoint)
+
+        assert os.path.getmtime(path) >= os.path.getmtime(checkpoint)
+
+    def test_parity_check_rejects_mismatching_export(self, model, checkpoint, example_input):
+        """Test an export of different weights fails the parity check"""
+        load_backend('torchscript', model, example_input, checkpoint)
+        with torch.no_grad():
+            model.dense2.bias.add_(1.0)
+
+        with pytest.raises(RuntimeError, match='torchscript backend differ'):
+            load_backend('torchscript', model, example_input, checkpoint)
+
+    def test_failed_export_leaves_no_files(self, model, checkpoint, example_input, monkeypatch):
+        """Test a failing export removes its partial file and the weights written next to it"""
+        def fail(model, example_input, path):
+            for partial_path in (path, path + '.data'):
+                with open(partial_path, 'wb') as f:
+                    f.write(b'partial')
+            raise RuntimeError('export failed')
+
+        monkeypatch.setattr(TorchScriptBackend, 'export', staticmethod(fail))
+        with pytest.raises(RuntimeError, match='export failed'):
+            load_backend('torchscript', model, example_input, checkpoint)
+
+        assert os.listdir(os.path.dirname(checkpoint)) == ['model.ckpt']
+
+    def test_invalid_backend_raises_error(self, model, checkpoint, example_input):
+        """Test unknown backend names are rejected"""
+        with pytest.raises(ValueError, match='Invalid backend'):
+            load_backend('tensorrt', model, example_input, checkpoint)
+
+    def test_onnxruntime_matches_eager(self, model, checkpoint, example_input):
+        """Test the ONNX Runtime backend matches the eager model"""
+        pytest.importorskip('onnxruntime')
+        pytest.importorskip('onnx')
+        backend = load_backend('onnxruntime', model, example_input, checkpoint)
+
+        # self-contained export, no external weights file next to it
+        assert sorted(os.listdir(os.path.dirname(checkpoint))) == [
+            'model.ckpt', os.path.basename(artifact_path(checkpoint, 'onnxruntime', example_input))]
+        assert check_parity(EagerBackend(model), backend, torch.randn(3, 1, 128, 1292)) < 1e-4
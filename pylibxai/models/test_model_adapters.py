@@ -0,0 +1,102 @@
+import pytest
+import numpy as np
+import torch
+
+# the adapter needs the sota-music-tagging-models checkout on its path
+harmonic_cnn = pytest.importorskip('pylibxai.model_adapters.HarmonicCNN')
+
+INPUT_LENGTH = 5 * 16000
+
+
+class TinyTagger(torch.nn.Module):
+    """Stand-in for the Harmonic CNN mapping waveforms to 50 tag scores"""
+    def __init__(self):
+        super().__init__()
+        self.pool = torch.nn.AvgPool1d(1000)
+        self.fc = torch.nn.Linear(INPUT_LENGTH // 1000, len(harmonic_cnn.TAGS))
+
+    def forward(self, x):
+        return torch.sigmoid(self.fc(self.pool(x.unsqueeze(1)).squeeze(1)))
+
+
+@pytest.fixture
+def adapter(monkeypatch):
+    model = TinyTagger()
+    state = {key: value.clone() for key, value in model.state_dict().items()}
+    monkeypatch.setattr(harmonic_cnn.Predict, 'get_model', staticmethod(lambda config: model))
+    monkeypatch.setattr(harmonic_cnn.torch, 'load', lambda path, map_location=None: state)
+    return harmonic_cnn.HarmonicCNN(device='cpu')
+
+
+class TestHarmonicCNNWeights:
+    """Test HarmonicCNN loads its weights once"""
+
+    def test_predict_functions_do_not_reload_weights(self, adapter, monkeypatch):
+        """Test no state dict is loaded and the model is not moved while predicting"""
+        def fail(*args, **kwargs):
+            raise AssertionError('model reloaded or moved in the hot path')
+
+        monkeypatch.setattr(adapter.model, 'load_state_dict', fail)
+        monkeypatch.setattr(adapter.model, 'cuda', fail)
+        monkeypatch.setattr(adapter.model, 'to', fail)
+        x = np.random.RandomState(0).uniform(-1, 1, (2, INPUT_LENGTH)).astype(np.float32)
+
+        lime_fn, igrad_fn, lrp_model = (adapter.get_lime_predict_fn(), adapter.get_igrad_predict_fn(),
+                                        adapter.get_lrp_predict_fn())
+        for _ in range(2):
+            predictions = lime_fn(x)
+            igrad_fn(torch.from_numpy(x)).sum().backward()
+            lrp_model(torch.from_numpy(x))
+
+        assert predictions.shape == (2, len(harmonic_cnn.TAGS))
+        assert not adapter.model.training
+
+    def test_predict_functions_share_the_model(self, adapter):
+        """Test every predict function runs the same model instance"""
+        assert adapter.get_lrp_predict_fn().model is adapter.model
+        assert not hasattr(adapter, 'model_state')
+
+
+class TestHarmonicCNNCpuInference:
+    """Test the CPU inference mode of HarmonicCNN"""
+
+    def test_missing_gpu_falls_back_to_cpu(self, adapter, monkeypatch):
+        """Test requesting CUDA without a GPU keeps the model on the CPU"""
+        monkeypatch.setattr(torch.cuda, 'is_available', lambda: False)
+
+        adapter = harmonic_cnn.HarmonicCNN(device='cuda')
+
+        assert adapter.device == 'cpu'
+        assert next(adapter.model.parameters()).device.type == 'cpu'
+
+    def test_lime_predictions_match_the_model(self, adapter):
+        """Test the batched LIME predictions equal a plain forward pass"""
+        x = np.random.RandomState(1).uniform(-1, 1, (3, INPUT_LENGTH)).astype(np.float32)
+
+        predictions = adapter.get_lime_predict_fn()(x)
+
+        with torch.no_grad():
+            expected = adapter.model(torch.from_numpy(x)).numpy()
+        np.testing.assert_allclose(predictions, expected, rtol=1e-6)
+
+    def test_preview_quantizes_a_copy(self, adapter):
+        """Test the LIME preview runs an int8 copy and leaves the model used by IG and LRP in float"""
+        x = np.random.RandomState(2).uniform(-1, 1, (2, INPUT_LENGTH)).astype(np.float32)
+
+        preview = adapter.get_lime_preview_predict_fn()(x)
+
+        assert type(adapter.model.fc) is torch.nn.Linear
+        assert isinstance(adapter.preview_model.quantized.fc.module, torch.ao.nn.quantized.Linear)
+        np.testing.assert_allclose(preview, adapter.get_lime_predict_fn()(x), atol=0.05)
+
+    def test_preview_falls_back_to_the_model_on_gpu_adapters(self, adapter):
+        """Test a GPU adapter warns and predicts its preview with the full precision model"""
+        adapter.device = 'cuda'
+        x = np.random.RandomState(3).uniform(-1, 1, (2, INPUT_LENGTH)).astype(np.float32)
+
+        with pytest.warns(UserWarning, match='full precision model on cuda'):
+            predict_fn = adapter.get_lime_preview_predict_fn()
+
+        assert adapter.preview_model is None
+        adapter.device = 'cpu'
+        np.testing.assert_array_equal(predict_fn(x), adapter.get_lime_predict_fn()(x))
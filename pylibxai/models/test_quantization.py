@@ -0,0 +1,86 @@
+import pytest
+import torch
+
+from pylibxai.models.GtzanCNN.model import CNN
+from pylibxai.models.quantization import CalibratedQuantizedModel, quantize_static
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return CNN(num_classes=10).eval()
+
+
+@pytest.fixture
+def x():
+    return torch.randn(3, 1, 128, 1292, generator=torch.Generator().manual_seed(1))
+
+
+class TestStaticQuantization:
+    """Test int8 preview copies of models"""
+
+    def test_quantizes_a_copy(self, model, x):
+        """Test the convolution blocks and linear layers of the copy are quantized and the model is left in float"""
+        quantized = quantize_static(model, x)
+
+        assert isinstance(quantized.layer1.module.conv, torch.ao.nn.quantized.Conv2d)
+        assert isinstance(quantized.dense1.module, torch.ao.nn.quantized.Linear)
+        # normalizes the float input of the first block
+        assert type(quantized.input_bn) is torch.nn.BatchNorm2d
+        assert type(model.layer1.conv) is torch.nn.Conv2d
+        assert type(model.dense1) is torch.nn.Linear
+
+    def test_predictions_stay_close(self, model, x):
+        """Test the quantized copy predicts close to the full precision model"""
+        with torch.inference_mode():
+            torch.testing.assert_close(quantize_static(model, x)(x), model(x), rtol=0.05, atol=0.01)
+
+    def test_layers_not_run_stay_in_float(self, model, x):
+        """Test layers the calibration input does not reach are not quantized"""
+        model.unused = torch.nn.Linear(4, 4)
+
+        quantized = quantize_static(model, x)
+
+        assert type(quantized.unused) is torch.nn.Linear
+
+    def test_quantizes_panns_conv_blocks(self):
+        """Test a PANNs ConvBlock with average pooling runs on quantized tensors throughout"""
+        models = pytest.importorskip('pylibxai.model_adapters.panns_inference.models')
+
+        class Head(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.block = models.ConvBlock(4, 8)
+
+            def forward(self, x):
+                return self.block(x, pool_size=(2, 2), pool_type='avg')
+
+        torch.manual_seed(0)
+        head = Head().eval()
+        x = torch.randn(2, 4, 16, 16)
+
+        quantized = quantize_static(head, x)
+
+        assert isinstance(quantized.block.module.conv2, torch.ao.nn.quantized.Conv2d)
+        with torch.inference_mode():
+            expected = head(x)
+            # two convolutions and BatchNorms requantize the activations, a few steps of 1/128 of the range
+            torch.testing.assert_close(quantized(x), expected, rtol=0, atol=0.05 * expected.abs().max().item())
+
+    def test_rejects_models_off_the_cpu(self, model, x):
+        """Test models on other devices are rejected"""
+        with pytest.raises(ValueError, match='on the CPU'):
+            quantize_static(model.to('meta'), x)
+
+    def test_calibrates_on_the_first_batch(self, model, x):
+        """Test the copy is quantized on the first prediction and reused afterwards"""
+        calibrated = CalibratedQuantizedModel(model)
+
+        with torch.inference_mode():
+            first = calibrated(x)
+            quantized = calibrated.quantized
+            second = calibrated(x)
+
+        assert isinstance(quantized.layer1.module.conv, torch.ao.nn.quantized.Conv2d)
+        assert calibrated.quantized is quantized
+        torch.testing.assert_close(first, second)
@@ -35,6 +35,11 @@ class PylibxaiContext:
                 "attributions": smoothed_attribution.tolist(),
             }, f, indent=4)
 
+    def write_json(self, data, suffix):
+        path = os.path.join(self.workdir, suffix)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=4)
+
     def write_label_mapping(self, labels, suffix):
         path = os.path.join(self.workdir, suffix)
         with open(path, 'w') as f:
@@ -7,6 +7,7 @@ from pylibxai.model_adapters import HarmonicCNN, Cnn14Adapter, GtzanCNNAdapter
 from pylibxai.pylibxai_context import PylibxaiContext
 from pylibxai.Explainers import LimeExplainer, IGradientsExplainer, LRPExplainer
 from pylibxai.Interfaces import ViewType, ModelLabelProvider
+from pylibxai.audioLIME import StemCache
 from utils import get_install_path
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
@@ -31,6 +32,24 @@ def main():
     parser.add_argument('-p', '--port', type=int, help="Port to use for the web server.")
     parser.add_argument('-d', '--device', type=str, default=DEVICE,
                         help="Device to use for computation [cpu, cuda]. Default is 'cuda' if available, otherwise 'cpu'.")
+    parser.add_argument('--num-threads', type=int,
+                        help="Number of intra-op threads used by torch for model inference. Default is torch's default.")
+    parser.add_argument('--num-interop-threads', type=int,
+                        help="Number of inter-op threads used by torch for model inference. Default is torch's default.")
+    parser.add_argument('--backend', type=str, default='eager', choices=['eager', 'torchscript', 'onnxruntime'],
+                        help="Inference backend of LIME predictions, gradient explainers always run eager. Default is 'eager'.")
+    parser.add_argument('--lime-preview', action='store_true',
+                        help="Predict the LIME neighborhood with an int8 copy of the model, on CPU adapters only.")
+    parser.add_argument('--lime-preview-report', action='store_true',
+                        help="Compare LIME explanations of the quantized and the full precision model on the input.")
+    parser.add_argument('--stem-cache', type=str,
+                        help="Directory caching separated stems across LIME runs on the same audio.")
+    parser.add_argument('--stem-cache-size', type=int, default=2048,
+                        help="Size cap of the stem cache in MB, least recently used stems are evicted. Default is 2048.")
+    parser.add_argument('--lime-window', type=float,
+                        help="Explain the input with LIME in windows of this many seconds instead of as a whole.")
+    parser.add_argument('--lime-hop', type=float,
+                        help="Seconds between the starts of consecutive LIME windows. Default is the window length.")
     args = parser.parse_args()
    
     try:
@@ -47,12 +66,13 @@ def main():
 
     context = PylibxaiContext(args.workdir)
 
+    adapter_options = dict(num_threads=args.num_threads, num_interop_threads=args.num_interop_threads, backend=args.backend)
     if args.model == "HCNN":
-        adapter = HarmonicCNN(device=device)
+        adapter = HarmonicCNN(device=device, **adapter_options)
     elif args.model == "CNN14":
-        adapter = Cnn14Adapter(device=device)
+        adapter = Cnn14Adapter(device=device, **adapter_options)
     elif args.model == "GtzanCNN":
-        adapter = GtzanCNNAdapter(model_path=GTZAN_MODEL_PATH, device=device)
+        adapter = GtzanCNNAdapter(model_path=GTZAN_MODEL_PATH, device=device, **adapter_options)
     else:
         print('Invalid value for -m/--model argument, available: [HCNN, CNN14, GtzanCNN].')
         return
@@ -74,8 +94,12 @@ def main():
     if "lime" in expls:
         view = view_type if expl_count == 1 else ViewType.NONE
         expl_count -= 1
-        explainer = LimeExplainer(adapter, context, view_type=view, port=port)
-        explainer.explain(args.input, target=None)
+        stem_cache = StemCache(args.stem_cache, max_bytes=args.stem_cache_size * 2**20) if args.stem_cache else None
+        explainer = LimeExplainer(adapter, context, view_type=view, port=port, stem_cache=stem_cache)
+        if args.lime_preview_report:
+            explainer.preview_report([args.input])
+        explainer.explain(args.input, target=None, window_seconds=args.lime_window, hop_seconds=args.lime_hop,
+                          preview=args.lime_preview)
     if "lrp" in expls:
         view = view_type if expl_count == 1 else ViewType.NONE
         expl_count -= 1
@@ -1,4 +1,25 @@
+import warnings
 from pathlib import Path
 
+import torch
+
 def get_install_path():
-    return Path.home() / 'Desktop' / 'pylibxai'
\ No newline at end of file
+    return Path.home() / 'Desktop' / 'pylibxai'
+
+def get_available_device(device):
+    """Returns device if it exists on this machine, otherwise 'cpu'."""
+    return 'cuda' if device == 'cuda' and torch.cuda.is_available() else 'cpu'
+
+def set_torch_threads(num_threads=None, num_interop_threads=None):
+    """
+    Sizes torch's intra-op and inter-op thread pools, None keeps the current size.
+
+    The inter-op pool can only be resized before its first use, later requests only warn.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads is not None and num_interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            warnings.warn(f'Could not set the number of inter-op threads: {e}')
@@ -7,7 +7,16 @@ CLR="\033[0m"
 python -m pytest pylibxai/pylibxai_context/test_pylibxai_context.py \
                     pylibxai/Interfaces/test_interfaces.py \
                     pylibxai/Explainers/test_explainers.py \
-                    pylibxai/Views/test_web_view.py
+                    pylibxai/Views/test_web_view.py \
+                    pylibxai/audioLIME/test_audiolime.py \
+                    pylibxai/AudioLoader/test_resampling.py \
+                    pylibxai/models/GtzanCNN/test_preprocessing.py \
+                    pylibxai/models/GtzanCNN/test_gtzan_cnn_adapter.py \
+                    pylibxai/models/test_model_adapters.py \
+                    pylibxai/models/test_cnn14_adapter.py \
+                    pylibxai/models/test_inference_backends.py \
+                    pylibxai/models/test_quantization.py \
+                    pylibxai/models/test_fusion.py
 
 
 echo -e "${GREEN}[TEST1]${CLR} CNN14, LIME, Integrated Gradients, Sandman 5s"